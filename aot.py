@@ -0,0 +1,145 @@
+"""Compiles a MiniScript program ahead of time into the source of a Python module, which runs the program
+without the lexer, the parser, the virtual machine or the transpiler.
+
+Every code object of the program, the functions defined in it included, is transpiled like the hot code in
+transpiler.py, for the boxed or the native engine. The objects the transpiled functions use become
+expressions of the module, which makes them when it is imported: the constants, the functions of the
+program, the inline caches of the subscripts, the operators of the engine and the builtins. The tables
+keep their prototype chains, since the subscripts go through the caches and the operators like in the
+interpreter. The module runs the functions with the Runtime of msruntime.py and the operators of
+msoperators.py, so it imports those, msbuiltins.py and value.py, which imports typedarray.py. These modules
+must be on the Python path where the module runs, e.g. next to it.
+
+Running the module as a script runs the program, importing it does not, then run() does. A program with
+code which can not be transpiled, like a function which can run past its end, can not be compiled.
+"""
+import math
+import os
+
+import msoperators
+import msruntime
+from transpiler import TranspileError
+from value import *
+
+# The modules a compiled module may import, the interpreter is not among them
+RUNTIME_MODULES = {'msruntime', 'msoperators', 'msbuiltins', 'value', 'typedarray'}
+
+
+def literal(x):
+    """A Python expression of the int, float, str or bool x."""
+    if type(x) is float and not math.isfinite(x):
+        return 'float({!r})'.format(repr(x))
+    return repr(x)
+
+
+class ModuleCompiler:
+    """Compiles a program for the machine `machine_class`."""
+
+    def __init__(self, machine_class, max_call_depth=msoperators.DEFAULT_MAX_CALL_DEPTH):
+        self.machine_class = machine_class
+        self.max_call_depth = max_call_depth
+        # the transpiler only needs the operators of the machine, the runtime of the compiler has the same
+        self.runtime = msruntime.Runtime(machine_class.operators_class)
+        self.code_names = {}  # type: {CodeObj: str} the variable of every code object in the module
+        self.imports = {'msruntime', machine_class.operators_class.__module__}
+        # the expressions of the objects the module gets from the runtime, by their id
+        self.known = {id(TRUE): 'TRUE', id(FALSE): 'FALSE'}
+        operators = self.runtime.operators
+        for table_name in ('UNARY_OPERATORS', 'BINARY_OPERATORS'):
+            for key, operator_function in getattr(operators, table_name).items():
+                self.known.setdefault(id(operator_function), 'runtime.operators.{}[{!r}]'.format(table_name, key))
+        for index, operator_function in enumerate(operators.COMPARE_OPERATORS):
+            self.known.setdefault(id(operator_function), 'runtime.operators.COMPARE_OPERATORS[{}]'.format(index))
+        self.known.setdefault(id(operators.STORE_SUBSCR_OPERATOR), 'runtime.operators.STORE_SUBSCR_OPERATOR')
+
+    def name_code(self, code_obj: CodeObj, enclosing_names=()):
+        """Name `code_obj` and the functions defined in it, and find the names of their scopes like
+        VirtualMachine.decode does. Returns the code objects of the functions and their arities."""
+        code_objs = []
+        if code_obj not in self.code_names:
+            self.code_names[code_obj] = 'code{}'.format(len(self.code_names))
+            code_obj.scope_names = enclosing_names + (code_obj.name_list,)
+            for const in code_obj.const_list:
+                if const.dtype is FUNCTION:
+                    code_objs.append((const.value.code_obj, const.value.arity))
+                    code_objs.extend(self.name_code(const.value.code_obj, code_obj.scope_names))
+        return code_objs
+
+    def expression(self, obj):
+        """The Python expression which makes `obj` in the module."""
+        if id(obj) in self.known:
+            return self.known[id(obj)]
+        if type(obj) is Value and obj.dtype is FUNCTION:
+            func = obj.value
+            if type(func) is NativeFunction:
+                self.imports.add('msbuiltins')
+                return 'msbuiltins.BUILTINS[{!r}]'.format(func.name)
+            parameters = tuple((parameter.id_name, parameter.type_name)
+                               for parameter in func.parameter_list.parameters)
+            return 'msruntime.make_function({}, {!r}, {})'.format(self.code_names[func.code_obj], parameters,
+                                                                 func.lexical_depth)
+        if type(obj) is Value:
+            return 'Value(type_tag({!r}), {})'.format(obj.dtype, literal(obj.value))
+        if type(obj) is PropertyCache:
+            return 'PropertyCache(runtime.operators.PROTOTYPE_KEY, {})'.format(self.expression(obj.fallback))
+        if type(obj) is str and obj in TYPE_TAGS:
+            return 'type_tag({!r})'.format(obj)
+        if type(obj) in UNBOXED_TYPE_TAGS:
+            return literal(obj)
+        module = getattr(obj, '__module__', None)
+        if module == 'value':
+            return obj.__qualname__
+        if module in RUNTIME_MODULES and '<' not in getattr(obj, '__qualname__', '<'):
+            self.imports.add(module)
+            return '{}.{}'.format(module, obj.__qualname__)
+        raise TranspileError('{!r} can not be made by the module'.format(obj))
+
+    def binding(self, name: str, obj, code_obj: CodeObj):
+        """The expression of the argument `name` of the factory of `code_obj`."""
+        if name in ('call', 'tail_call', 'unassigned'):
+            return 'runtime.' + name
+        if name == 'code_obj':
+            return self.code_names[code_obj]
+        return self.expression(obj)
+
+    def compile(self, code_obj: CodeObj, program_name='<program>'):
+        """The source of the module of the program `code_obj`."""
+        code_objs = [(code_obj, None)] + self.name_code(code_obj)
+        definitions = []
+        for function_code, arity in code_objs:
+            code_name = self.code_names[function_code]
+            transpiler = self.machine_class.transpiler_class(self.runtime.operators, self.runtime, function_code,
+                                                             arity)
+            try:
+                source, namespace = transpiler.transpile('make_' + code_name)
+            except TranspileError as error:
+                raise TranspileError('{} at line {} can not be compiled: {}'
+                                     .format(function_code.name, function_code.line, error)) from None
+            arguments = ['    {}={},'.format(name, self.binding(name, obj, function_code))
+                         for name, obj in sorted(namespace.items())]
+            definitions.extend(['', '', source.rstrip('\n'), '',
+                                'runtime.add({}, make_{}(\n{}\n))'.format(code_name, code_name, '\n'.join(arguments))])
+        lines = ['"""{} compiled ahead of time by aot.py for the {} engine. Running the module runs the program,'
+                 .format(program_name, self.machine_class.engine),
+                 'importing it does not, then run() does."""']
+        lines.extend('import {}'.format(module) for module in sorted(self.imports))
+        lines.append('from value import *')
+        operators_class = self.machine_class.operators_class
+        lines.extend(['', 'runtime = msruntime.Runtime({}.{}, max_call_depth={})'.format(
+            operators_class.__module__, operators_class.__qualname__, self.max_call_depth), ''])
+        lines.append('# the code objects identify the functions, their code is not needed')
+        lines.extend('{} = CodeObj([], [], {!r}, {!r}, {})'.format(self.code_names[function_code],
+                                                                   function_code.name_list, function_code.name,
+                                                                   function_code.line)
+                     for function_code, _ in code_objs)
+        lines.extend(definitions)
+        lines.extend(['', '', 'def run():', '    """Run the program and return its return value."""',
+                      '    return runtime.run({})'.format(self.code_names[code_obj]), '', '',
+                      "if __name__ == '__main__':", '    run()'])
+        return '\n'.join(lines) + '\n'
+
+
+def compile_module(code_obj: CodeObj, machine_class, file_name: str,
+                   max_call_depth=msoperators.DEFAULT_MAX_CALL_DEPTH):
+    """The source of a Python module which runs the program `code_obj` of the file `file_name`."""
+    return ModuleCompiler(machine_class, max_call_depth).compile(code_obj, os.path.basename(file_name))
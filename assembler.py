@@ -0,0 +1,39 @@
+class Label:
+    """A jump target whose position is only known once the code after it has been emitted."""
+    def __init__(self):
+        self.position = None  # type: int
+
+    def __repr__(self):
+        return 'Label({})'.format(self.position)
+
+
+class CodeBuffer:
+    """The code generator appends (byte_name, argument) instructions here, jump arguments may be Labels
+    which are patched to instruction positions by `assemble`."""
+    def __init__(self):
+        self.instructions = []  # type: [(str, int or Label)]
+        self.fixups = []  # type: [int] the positions of the instructions which jump to a label
+
+    def emit(self, byte_name: str, argument=None):
+        if isinstance(argument, Label):
+            self.fixups.append(len(self.instructions))
+        self.instructions.append((byte_name, argument))
+
+    @staticmethod
+    def new_label():
+        return Label()
+
+    def mark(self, label: Label):
+        """Place the label before the next instruction to be emitted."""
+        label.position = len(self.instructions)
+
+    def assemble(self):
+        """Replace every label by its position and return the instructions."""
+        instructions = self.instructions
+        for position in self.fixups:
+            byte_name, label = instructions[position]
+            if label.position is None:
+                raise ValueError('the label of {} at {} is never placed'.format(byte_name, position))
+            instructions[position] = (byte_name, label.position)
+        self.fixups = []
+        return instructions
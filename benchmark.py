@@ -0,0 +1,223 @@
+"""Measure how fast MiniScript programs compile and run, or with --compile how fast they compile with and
+without the debugging output.
+
+usage: python benchmark.py [--repeat N] [--warmup N] [--engine ENGINE] [-O LEVEL] [--jit] [--json FILE]
+                           [--compare FILE] [program.ms ...]
+
+By default the programs of the bench/ suite are measured, and a large generated program for the compile
+time. For every program the compile time, the run time, the instructions executed and the peak memory of a
+run are reported separately. The times are the best of the repeated runs, after the warmup runs. --json
+writes the results with the commit they were measured on, and --compare prints how they changed since
+the results of another commit.
+"""
+import argparse
+import contextlib
+import functools
+import glob
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import msparser
+import optimizer
+from miniscript import ENGINES
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench')
+GENERATED = '<generated>'
+DEFAULT_PROGRAMS = sorted(glob.glob(os.path.join(BENCH_DIR, '*.ms'))) + [GENERATED]
+GENERATED_FUNCTIONS = 300
+
+
+class InstructionCounter:
+    """Wraps the handlers of a virtual machine to count the instructions it executes."""
+    def __init__(self, virtual_machine):
+        self.instruction_count = 0
+        virtual_machine.handlers = [self.counting(handler) for handler in virtual_machine.handlers]
+
+    def counting(self, handler):
+        def counted_handler(*arguments):
+            self.instruction_count += 1
+            return handler(*arguments)
+        return counted_handler
+
+
+def generated_program(functions=GENERATED_FUNCTIONS):
+    """A long program of many small functions, which measures the compiler more than the machine. The
+    functions are kept in a table, a scope has room for only 256 variables."""
+    lines = ['library = {}']
+    for index in range(functions):
+        lines.extend([
+            'library.function{} = function (n: int, t: table) {{'.format(index),
+            '    total = 0',
+            '    for (i = 0; i < n; i = i + 1) {',
+            '        if (i > {}) {{ total = total + i * 2 }} else {{ total = total - 1 }}'.format(index % 7),
+            '    }',
+            '    t.value{} = total'.format(index),
+            '    return total + {}'.format(index),
+            '}',
+        ])
+    lines.append('results = {}')
+    lines.extend('print library.function{}(3, results)'.format(index) for index in range(0, functions, 50))
+    lines.append('return 0')
+    return '\n'.join(lines) + '\n'
+
+
+def read_program(file_name):
+    if file_name == GENERATED:
+        return generated_program()
+    with open(file_name, 'r') as program_file:
+        return program_file.read()
+
+
+def compile_program(program, debug=False, optimize_level=0):
+    with contextlib.redirect_stdout(io.StringIO()):
+        code_obj = msparser.generate_code(program, debug)
+    return optimizer.optimize(code_obj, optimize_level)
+
+
+def run_silently(virtual_machine, code_obj):
+    with contextlib.redirect_stdout(io.StringIO()):
+        virtual_machine.run_code(code_obj)
+
+
+def timings(function, repeat, warmup):
+    """The times of `repeat` calls of `function`, after `warmup` calls which are not timed."""
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def bench_program(file_name, repeat, engine, optimize_level=0, superinstructions=True, warmup=1, jit=False):
+    """The measurements of one program, the times in milliseconds and the memory in KiB. The instructions
+    are those the machine interprets, with jit the transpiled code runs none."""
+    program = read_program(file_name)
+    make_machine = functools.partial(engine, superinstructions, jit=jit)
+    compile_times = timings(lambda: compile_program(program, optimize_level=optimize_level), repeat, warmup)
+    # every run compiles the program anew, so that no run finds the code decoded by an earlier run
+    code_objs = [compile_program(program, optimize_level=optimize_level) for _ in range(warmup + repeat)]
+    run_times = timings(lambda: run_silently(make_machine(), code_objs.pop()), repeat, warmup)
+
+    virtual_machine = make_machine()
+    counter = InstructionCounter(virtual_machine)
+    run_silently(virtual_machine, compile_program(program, optimize_level=optimize_level))
+
+    code_obj = compile_program(program, optimize_level=optimize_level)
+    tracemalloc.start()
+    try:
+        run_silently(make_machine(), code_obj)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'compile_ms': min(compile_times) * 1000,
+        'run_ms': min(run_times) * 1000,
+        'run_mean_ms': statistics.mean(run_times) * 1000,
+        'run_stdev_ms': statistics.stdev(run_times) * 1000 if len(run_times) > 1 else 0.0,
+        'instructions': counter.instruction_count,
+        'instructions_per_s': counter.instruction_count / min(run_times),
+        'peak_kib': peak / 1024,
+    }
+
+
+def bench_compile(file_name, repeat, debug):
+    program = read_program(file_name)
+    return statistics.mean(timings(lambda: compile_program(program, debug), repeat, 0))
+
+
+def current_commit():
+    """The commit of the working tree, or None if it is not a git repository."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(BENCH_DIR),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def program_name(file_name):
+    if file_name == GENERATED:
+        return file_name
+    return os.path.relpath(file_name, os.path.dirname(BENCH_DIR))
+
+
+def print_results(results, baseline=None):
+    header = '{:<24}{:>12}{:>12}{:>10}{:>14}{:>12}'.format('program', 'compile(ms)', 'run(ms)', '+-(ms)',
+                                                            'instructions', 'peak(KiB)')
+    if baseline:
+        header += '{:>10}'.format('speedup')
+    print(header)
+    for name, result in results.items():
+        line = '{:<24}{:>12.2f}{:>12.2f}{:>10.2f}{:>14}{:>12.1f}'.format(
+            name, result['compile_ms'], result['run_ms'], result['run_stdev_ms'], result['instructions'],
+            result['peak_kib'])
+        if baseline:
+            old = baseline.get(name)
+            line += '{:>10}'.format('{:.2f}x'.format(old['run_ms'] / result['run_ms']) if old else '-')
+        print(line)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='measure the compile time, the run time, the instructions '
+                                                     'and the memory of MiniScript programs')
+    arg_parser.add_argument('programs', nargs='*', default=DEFAULT_PROGRAMS)
+    arg_parser.add_argument('--repeat', type=int, default=10, help='how many times each program is measured')
+    arg_parser.add_argument('--warmup', type=int, default=1, help='how many runs before the measured ones')
+    arg_parser.add_argument('--engine', choices=sorted(ENGINES), default='boxed')
+    arg_parser.add_argument('-O', dest='optimize_level', type=int, choices=range(optimizer.MAX_LEVEL + 1), default=0,
+                            help='the optimization level of the programs')
+    arg_parser.add_argument('--no-superinstructions', action='store_true',
+                            help='run every instruction on its own instead of fusing common sequences')
+    arg_parser.add_argument('--jit', action='store_true',
+                            help='transpile the hot code to Python, not with the register engine')
+    arg_parser.add_argument('--json', metavar='FILE', help='write the results to FILE')
+    arg_parser.add_argument('--compare', metavar='FILE', help='print the speedup over the results in FILE')
+    arg_parser.add_argument('--compile', action='store_true',
+                            help='measure the compile latency with and without the debugging output instead')
+    args = arg_parser.parse_args()
+    if args.engine == 'register' and args.jit:
+        arg_parser.error('the register engine does not support --jit')
+    if args.compile:
+        print('{:<30}{:>16}{:>16}'.format('program', 'debug(ms)', 'production(ms)'))
+        for file_name in args.programs:
+            debug = bench_compile(file_name, args.repeat, True)
+            production = bench_compile(file_name, args.repeat, False)
+            print('{:<30}{:>16.3f}{:>16.3f}'.format(program_name(file_name), debug * 1000, production * 1000))
+        return
+    results = {}
+    for file_name in args.programs:
+        results[program_name(file_name)] = bench_program(file_name, args.repeat, ENGINES[args.engine],
+                                                         args.optimize_level, not args.no_superinstructions,
+                                                         args.warmup, args.jit)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+    print_results(results, baseline)
+    if args.json:
+        report = {
+            'commit': current_commit(),
+            'python': platform.python_version(),
+            'engine': args.engine,
+            'optimize_level': args.optimize_level,
+            'superinstructions': not args.no_superinstructions,
+            'jit': args.jit,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'results': results,
+        }
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
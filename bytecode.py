@@ -1,13 +1,58 @@
-HAVE_CONST = ['LOAD_CONST']
+# Bump this whenever the compiler generates different code, it invalidates the compiled files in the cache
+COMPILER_VERSION = 7
+
+HAVE_CONST = ['LOAD_CONST', 'MAKE_FUNCTION']
 HAVE_NAME = ['LOAD_NAME',
              'STORE_NAME']
 HAVE_LABEL = ['JUMP_ABSOLUTE',
               'POP_JUMP_IF_TRUE',
               'POP_JUMP_IF_FALSE',
               'SETUP_LOOP']
-HAVE_OTHER = ['COMPARE_OP', 'BUILD_LIST', 'BUILD_MAP']
+HAVE_OTHER = ['COMPARE_OP', 'BUILD_LIST', 'BUILD_MAP', 'BUILD_ARRAY', 'LOAD_BUILTIN', 'CALL_FUNCTION',
+              'TAIL_CALL_FUNCTION']
 HAVE_ARGUMENT = HAVE_LABEL + HAVE_NAME + HAVE_CONST + HAVE_OTHER
 
+UNARY_OPS = ['POSITIVE', 'NEGATIVE', 'NOT', 'INVERT']
+BINARY_OPS = ['POWER', 'MULTIPLY', 'FLOOR_DIVIDE', 'TRUE_DIVIDE', 'DIVIDE', 'MODULO', 'ADD', 'SUBTRACT',
+              'SUBSCR', 'LSHIFT', 'RSHIFT', 'AND', 'XOR', 'OR']
+
+# The integer opcode of an instruction is its position in OPNAMES
+OPNAMES = ['POP_TOP',
+           'DUP_TOP',
+           'LOAD_CONST',
+           'LOAD_NAME',
+           'LOAD_BUILTIN',
+           'STORE_NAME',
+           'STORE_SUBSCR',
+           'COMPARE_OP',
+           'BUILD_TUPLE',
+           'BUILD_LIST',
+           'BUILD_MAP',
+           'BUILD_ARRAY',
+           'LIST_APPEND',
+           'JUMP_ABSOLUTE',
+           'POP_JUMP_IF_TRUE',
+           'POP_JUMP_IF_FALSE',
+           'SETUP_LOOP',
+           'BREAK_LOOP',
+           'POP_BLOCK',
+           'MAKE_FUNCTION',
+           'CALL_FUNCTION',
+           'TAIL_CALL_FUNCTION',
+           'RETURN_VALUE',
+           'PRINT_EXPR'] + \
+          ['UNARY_' + op for op in UNARY_OPS] + \
+          ['BINARY_' + op for op in BINARY_OPS]
+
+# The virtual machine fuses common sequences of the instructions above into these, the compiler never emits them
+SUPERINSTRUCTIONS = ['COMPARE_NAME_CONST_JUMP_IF_FALSE',
+                     'INCREMENT_NAME',
+                     'COMPARE_JUMP_IF_FALSE',
+                     'LOAD_NAME_CONST_BINARY',
+                     'LOAD_NAME_NAME_BINARY']
+OPNAMES += SUPERINSTRUCTIONS
+OPMAP = {name: opcode for opcode, name in enumerate(OPNAMES)}
+
 
 def tuple2index(t):
     lexical_depth, index = t
@@ -17,3 +62,31 @@ def tuple2index(t):
 def index2tuple(storage_index):
     lexical_depth, index = divmod(storage_index, 256)
     return lexical_depth, index
+
+
+# The instructions of the register machine in registervm.py, which it translates the code above into. The operands
+# are registers, a jump target is always the last operand.
+REGISTER_OPNAMES = ['MOVE',
+                    'CHECK',
+                    'LOAD_OUTER',
+                    'STORE_OUTER',
+                    'MAKE_FUNCTION',
+                    'UNARY',
+                    'BINARY',
+                    'SUBSCR',
+                    'STORE_SUBSCR',
+                    'COMPARE',
+                    'BUILD_LIST',
+                    'BUILD_MAP',
+                    'BUILD_ARRAY',
+                    'JUMP',
+                    'JUMP_IF_FALSE',
+                    'JUMP_IF_TRUE',
+                    'COMPARE_JUMP_IF_FALSE',
+                    'COMPARE_JUMP_IF_TRUE',
+                    'CALL',
+                    'TAIL_CALL',
+                    'RETURN',
+                    'PRINT']
+REGISTER_OPMAP = {name: opcode for opcode, name in enumerate(REGISTER_OPNAMES)}
+REGISTER_JUMPS = {'JUMP', 'JUMP_IF_FALSE', 'JUMP_IF_TRUE', 'COMPARE_JUMP_IF_FALSE', 'COMPARE_JUMP_IF_TRUE'}
@@ -0,0 +1,96 @@
+"""Serialize compiled code objects to .msc files, so that unchanged programs skip the compiler.
+
+A cache file is named after the hash of the program source, of the compiler version and of the optimization
+level, so editing the program, upgrading the compiler or optimizing differently simply misses the cache.
+"""
+import hashlib
+import marshal
+import os
+
+from bytecode import COMPILER_VERSION
+from value import *
+
+MAGIC = b'MSC\x00'
+CACHE_DIR_NAME = '__mscache__'
+
+
+def value_to_tuple(value: Value):
+    if value.dtype is FUNCTION:
+        func = value.value
+        parameters = tuple((parameter.id_name, parameter.type_name) for parameter in func.parameter_list.parameters)
+        return value.dtype, (parameters, code_to_tuple(func.code_obj), func.lexical_depth)
+    return value.dtype, value.value
+
+
+def tuple_to_value(t):
+    dtype, value = t
+    dtype = type_tag(dtype)
+    if dtype is FUNCTION:
+        parameters, code, lexical_depth = value
+        parameter_list = ParameterList()
+        parameter_list.parameters = [Parameter(id_name, type_name) for id_name, type_name in parameters]
+        return Value(dtype, Function(parameter_list, tuple_to_code(code), lexical_depth))
+    return Value(dtype, value)
+
+
+def code_to_tuple(code_obj: CodeObj):
+    return (tuple(code_obj.code),
+            tuple(value_to_tuple(const) for const in code_obj.const_list),
+            tuple(code_obj.name_list),
+            code_obj.name,
+            code_obj.line)
+
+
+def tuple_to_code(t):
+    code, const_list, name_list, name, line = t
+    return CodeObj([tuple(instruction) for instruction in code],
+                   [tuple_to_value(const) for const in const_list],
+                   list(name_list),
+                   name,
+                   line)
+
+
+def dumps(code_obj: CodeObj) -> bytes:
+    return MAGIC + marshal.dumps((COMPILER_VERSION, code_to_tuple(code_obj)))
+
+
+def loads(data: bytes) -> CodeObj:
+    if not data.startswith(MAGIC):
+        raise ValueError('not a compiled MiniScript file')
+    version, code = marshal.loads(data[len(MAGIC):])
+    if version != COMPILER_VERSION:
+        raise ValueError('the file is compiled by compiler version {}, but the current version is {}'
+                         .format(version, COMPILER_VERSION))
+    return tuple_to_code(code)
+
+
+def source_hash(program: str, optimize_level=0):
+    digest = hashlib.sha256('{}\n{}\n'.format(COMPILER_VERSION, optimize_level).encode())
+    digest.update(program.encode())
+    return digest.hexdigest()
+
+
+def cache_path(cache_dir: str, program: str, optimize_level=0):
+    return os.path.join(cache_dir, source_hash(program, optimize_level) + '.msc')
+
+
+def load(cache_dir: str, program: str, optimize_level=0):
+    """Return the cached code object of `program`, or None if it is not cached."""
+    try:
+        with open(cache_path(cache_dir, program, optimize_level), 'rb') as cache_file:
+            return loads(cache_file.read())
+    except (OSError, ValueError, EOFError, TypeError):
+        return None
+
+
+def store(cache_dir: str, program: str, code_obj: CodeObj, optimize_level=0):
+    """Write the code object of `program` to the cache. A cache that can not be written is ignored."""
+    path = cache_path(cache_dir, program, optimize_level)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(temp_path, 'wb') as cache_file:
+            cache_file.write(dumps(code_obj))
+        os.replace(temp_path, path)
+    except OSError:
+        pass
@@ -0,0 +1,56 @@
+"""Counters of the instructions the virtual machine executes, which it keeps when it is made with
+instrument=True.
+
+Every opcode is counted, and every position of every code object, so the report shows which instructions
+and which places of the program run most, e.g. to choose the sequences to fuse into superinstructions.
+With timing=True, the time spent in the handler of each opcode is added up as well.
+
+The machine runs an instrumented copy of its loop instead of checking in the normal loop whether to count,
+so it runs as fast as before when it does not instrument. The positions are those of the decoded code,
+in which a superinstruction takes the place of the instructions it fuses.
+"""
+import collections
+
+from bytecode import OPNAMES
+from value import *
+
+DEFAULT_REPORT_LINES = 20
+
+
+class Instrumentation:
+    def __init__(self, timing=False):
+        self.timing = timing
+        self.opcode_counts = [0] * len(OPNAMES)
+        self.opcode_times = [0.0] * len(OPNAMES)  # in seconds, only with timing
+        self.position_counts = collections.Counter()  # type: {(CodeObj, int, int): int} by code, position and opcode
+        self.code_names = {}  # type: {CodeObj: str}
+
+    def name_code(self, code_obj: CodeObj, name='<program>'):
+        """Name `code_obj` and the functions defined in it for the report, like the optimizer report does."""
+        self.code_names[code_obj] = name
+        for index, const in enumerate(code_obj.const_list):
+            if const.dtype is FUNCTION:
+                self.name_code(const.value.code_obj, '{}/function{}'.format(name, index))
+
+    def format_report(self, lines=DEFAULT_REPORT_LINES):
+        """The opcodes by how often they ran, then the `lines` positions which ran most."""
+        total = sum(self.opcode_counts) or 1
+        header = '{:<36}{:>12}{:>8}'.format('opcode', 'count', '%')
+        if self.timing:
+            header += '{:>12}{:>10}'.format('time(ms)', 'ns/op')
+        report = [header]
+        for opcode in sorted(range(len(OPNAMES)), key=lambda opcode: -self.opcode_counts[opcode]):
+            count = self.opcode_counts[opcode]
+            if not count:
+                break
+            line = '{:<36}{:>12}{:>8.2f}'.format(OPNAMES[opcode], count, count * 100 / total)
+            if self.timing:
+                seconds = self.opcode_times[opcode]
+                line += '{:>12.3f}{:>10.0f}'.format(seconds * 1000, seconds * 1e9 / count)
+            report.append(line)
+        report.append('')
+        report.append('{:<36}{:>8}  {:<36}{:>12}'.format('code', 'position', 'opcode', 'count'))
+        for (code_obj, position, opcode), count in self.position_counts.most_common(lines):
+            report.append('{:<36}{:>8}  {:<36}{:>12}'.format(self.code_names.get(code_obj, '?'), position,
+                                                             OPNAMES[opcode], count))
+        return '\n'.join(report)
@@ -0,0 +1,127 @@
+"""Memoization of the calls of pure functions, which the virtual machine does when it is made with memoize=True.
+
+A function is pure when a call has no effect but its return value, which depends on nothing but the arguments:
+it does not print, it does not read or write tables, it does not make tables or functions, it does not assign
+the variables of the functions enclosing it, and it only reads those variables which never change once they
+are assigned. Which functions are pure is found by reading their code before the program runs.
+
+A pure function may still call a function which is not pure, e.g. one passed as an argument. Every such call
+is counted while the program runs, and a call during which the count changed is not memoized.
+"""
+import collections
+import weakref
+
+from bytecode import HAVE_LABEL, index2tuple
+from value import *
+
+DEFAULT_MEMO_SIZE = 4096
+
+IMPURE_INSTRUCTIONS = {'PRINT_EXPR', 'BINARY_SUBSCR', 'STORE_SUBSCR', 'BUILD_MAP', 'BUILD_LIST', 'BUILD_ARRAY',
+                       'MAKE_FUNCTION'}
+
+MISSING = object()
+
+
+def loop_positions(code):
+    """The positions of the instructions which may run more than once, because a jump goes back before them."""
+    positions = set()
+    for position, (byte_name, arg) in enumerate(code):
+        if byte_name in HAVE_LABEL and byte_name != 'SETUP_LOOP' and arg <= position:
+            positions.update(range(arg, position + 1))
+    return positions
+
+
+def stored_names(code_obj: CodeObj, lexical_depth: int):
+    """The positions of the stores to the slots at `lexical_depth` in `code_obj` and in the functions in it."""
+    stores = collections.defaultdict(list)
+    for position, (byte_name, arg) in enumerate(code_obj.code):
+        if byte_name == 'STORE_NAME' and index2tuple(arg)[0] == lexical_depth:
+            stores[index2tuple(arg)[1]].append(position)
+    for const in code_obj.const_list:
+        if const.dtype is FUNCTION:
+            for index in stored_names(const.value.code_obj, lexical_depth):
+                stores[index].append(None)
+    return stores
+
+
+def constant_names(code_obj: CodeObj, lexical_depth: int, arity: int):
+    """The slots of `code_obj` which never change once they are assigned: the parameters which are never
+    assigned, and the variables which are assigned once by `code_obj` itself, outside of any loop."""
+    stores = stored_names(code_obj, lexical_depth)
+    loops = loop_positions(code_obj.code)
+    constants = set()
+    for index in range(len(code_obj.name_list)):
+        positions = stores.get(index, [])
+        if index < arity and not positions or \
+                index >= arity and len(positions) == 1 and positions[0] is not None and positions[0] not in loops:
+            constants.add(index)
+    return constants
+
+
+def is_pure(code_obj: CodeObj, lexical_depth: int, enclosing_constants: tuple):
+    for byte_name, arg in code_obj.code:
+        if byte_name in IMPURE_INSTRUCTIONS:
+            return False
+        if byte_name in ('LOAD_NAME', 'STORE_NAME'):
+            depth, index = index2tuple(arg)
+            if depth < lexical_depth and (byte_name == 'STORE_NAME' or index not in enclosing_constants[depth]):
+                return False
+    return True
+
+
+def mark_pure_functions(code_obj: CodeObj, lexical_depth=0, arity=0, enclosing_constants=()):
+    """Set CodeObj.pure for the functions defined in `code_obj`, which runs at `lexical_depth`."""
+    scope_constants = enclosing_constants + (constant_names(code_obj, lexical_depth, arity),)
+    for const in code_obj.const_list:
+        if const.dtype is FUNCTION:
+            func = const.value
+            func.code_obj.pure = is_pure(func.code_obj, func.lexical_depth, scope_constants)
+            mark_pure_functions(func.code_obj, func.lexical_depth, func.arity, scope_constants)
+
+
+class MemoCache:
+    """The return values of the calls of one function, by the arguments, keeping the most recently used."""
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """The memoized return value, or MISSING. Raises TypeError if an argument is not hashable."""
+        result = self.entries.get(key, MISSING)
+        if result is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return result
+
+    def store(self, key, result):
+        self.entries[key] = result
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
+class Memoizer:
+    def __init__(self, size=DEFAULT_MEMO_SIZE):
+        self.size = size
+        self.impure_calls = 0  # the number of calls of functions which are not pure, so far
+        # every function made by MAKE_FUNCTION has its own cache, which goes away with the function, so the
+        # functions made in a loop do not keep their caches alive and the report shows the functions which live
+        self.caches = weakref.WeakKeyDictionary()  # type: {Function: MemoCache}
+
+    def cache(self, func: Function):
+        cache = self.caches.get(func)
+        if cache is None:
+            name = 'function({})'.format(', '.join(str(parameter) for parameter in func.parameter_list.parameters))
+            cache = self.caches[func] = MemoCache(name, self.size)
+        return cache
+
+    def format_report(self):
+        lines = ['{:<50}{:>10}{:>10}{:>10}'.format('memoized function', 'hits', 'misses', 'size')]
+        for cache in self.caches.values():
+            lines.append('{:<50}{:>10}{:>10}{:>10}'.format(cache.name, cache.hits, cache.misses, len(cache.entries)))
+        lines.append('calls of functions which are not pure: {}'.format(self.impure_calls))
+        return '\n'.join(lines)
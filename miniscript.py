@@ -1,24 +1,137 @@
+import argparse
+import os
 import sys
 
-import msparser
+import codecache
+import memo
+import nativevm
+import optimizer
+import registervm
+import transpiler
 import vm
-import labelconverter
-from value import CodeObj
 
+ENGINES = {
+    'boxed': vm.VirtualMachine,
+    'native': nativevm.NativeVirtualMachine,
+    'register': registervm.RegisterVirtualMachine,
+}
+
+
+def compile_program(program: str, cache_dir=None, debug=False, optimize_level=0, report=False):
+    """Compile and optimize the program, or load its compiled code from `cache_dir` if it has not changed.
+    With `report`, the instructions removed by the optimizer are printed to stderr."""
+    if cache_dir:
+        code_obj = codecache.load(cache_dir, program, optimize_level)
+        if code_obj:
+            return code_obj
+    # the compiler is only imported when needed, building the lexer and the parser is slow
+    import msparser
+    code_obj = msparser.generate_code(program, debug)
+    code_optimizer = optimizer.Optimizer(optimize_level)
+    code_optimizer.optimize(code_obj)
+    if report:
+        print(code_optimizer.format_report(), file=sys.stderr)
+    if cache_dir:
+        codecache.store(cache_dir, program, code_obj, optimize_level)
+    return code_obj
 
-def convert_label_recursive(code_obj: CodeObj):
-    code_obj.code = labelconverter.convert(code_obj.code)
-    for const_item in code_obj.const_list:
-        if const_item.dtype == 'function':
-            convert_label_recursive(const_item.value.code_obj)
 
 if __name__ == '__main__':
-    file_name = sys.argv[1]
-    with open(file_name, 'r') as program_file:
+    arg_parser = argparse.ArgumentParser(description='run a MiniScript program')
+    arg_parser.add_argument('file_name')
+    arg_parser.add_argument('--no-cache', action='store_true', help='always compile the program')
+    arg_parser.add_argument('--debug', action='store_true',
+                            help='log the parser actions to parselog.txt and print the syntax tree, '
+                                 'the cache is not used')
+    arg_parser.add_argument('--engine', choices=sorted(ENGINES), default='boxed',
+                            help='boxed wraps every value in a Value, native keeps int, real, str and bool unboxed, '
+                                 'register runs register code instead of stack code, it can not be combined with '
+                                 '--memoize, --instrument, --profile or the --jit options')
+    arg_parser.add_argument('--max-call-depth', type=int, default=vm.DEFAULT_MAX_CALL_DEPTH,
+                            help='how deep the calls of the program may be nested')
+    arg_parser.add_argument('--memoize', action='store_true',
+                            help='remember the return values of the functions which are found to be pure')
+    arg_parser.add_argument('--memo-size', type=int, default=memo.DEFAULT_MEMO_SIZE,
+                            help='how many return values are remembered for each function')
+    arg_parser.add_argument('--memo-report', action='store_true',
+                            help='print the memoization hits and misses of every function when the program ends')
+    arg_parser.add_argument('--instrument', action='store_true',
+                            help='count the instructions the program runs and print them when it ends')
+    arg_parser.add_argument('--instrument-timing', action='store_true',
+                            help='with --instrument, also time the instructions')
+    arg_parser.add_argument('--profile', action='store_true',
+                            help='time the calls of every function and print the slowest when the program ends')
+    arg_parser.add_argument('--profile-pstats', metavar='FILE',
+                            help='with --profile, write the profile in the format of the pstats module')
+    arg_parser.add_argument('--profile-collapsed', metavar='FILE',
+                            help='with --profile, write the call stacks in the collapsed format of flame graphs')
+    arg_parser.add_argument('--no-jit', action='store_true',
+                            help='interpret all the code instead of transpiling the hot functions and loops to Python, '
+                                 'which is not done anyway with --memoize, --instrument, --profile or the register '
+                                 'engine')
+    arg_parser.add_argument('--jit-calls', type=int,
+                            help='how many calls make a function hot, {} by default'
+                                 .format(transpiler.DEFAULT_CALL_THRESHOLD))
+    arg_parser.add_argument('--jit-loops', type=int,
+                            help='how many iterations make a loop hot, {} by default'
+                                 .format(transpiler.DEFAULT_LOOP_THRESHOLD))
+    arg_parser.add_argument('--jit-dump', metavar='DIR', help='write the Python source of the transpiled code to DIR')
+    arg_parser.add_argument('--aot', metavar='MODULE',
+                            help='compile the program to the Python module MODULE instead of running it. The module '
+                                 'runs it without the compiler, the interpreter or the transpiler, but it imports '
+                                 'msruntime.py, msoperators.py, msbuiltins.py and value.py, see aot.py')
+    arg_parser.add_argument('-O', dest='optimize_level', type=int, choices=range(optimizer.MAX_LEVEL + 1), default=0,
+                            help='the optimization level, see optimizer.py')
+    arg_parser.add_argument('--optimization-report', action='store_true',
+                            help='print the instructions removed from every function, the cache is not used')
+    arg_parser.add_argument('--cache-dir', help='where the compiled code is cached, '
+                                                'by default {} next to the program'.format(codecache.CACHE_DIR_NAME))
+    args = arg_parser.parse_args()
+    if args.engine == 'register':
+        unsupported = [option for option, given in (('--memoize', args.memoize), ('--instrument', args.instrument),
+                                                    ('--profile', args.profile),
+                                                    ('--jit-calls', args.jit_calls is not None),
+                                                    ('--jit-loops', args.jit_loops is not None),
+                                                    ('--jit-dump', args.jit_dump is not None)) if given]
+        if unsupported:
+            arg_parser.error('the register engine does not support {}'.format(', '.join(unsupported)))
+    # the thresholds default to None above to tell whether they are given
+    if args.jit_calls is None:
+        args.jit_calls = transpiler.DEFAULT_CALL_THRESHOLD
+    if args.jit_loops is None:
+        args.jit_loops = transpiler.DEFAULT_LOOP_THRESHOLD
+    cache_dir = None
+    if not args.no_cache and not args.debug and not args.optimization_report:
+        cache_dir = args.cache_dir or os.path.join(os.path.dirname(args.file_name), codecache.CACHE_DIR_NAME)
+    with open(args.file_name, 'r') as program_file:
         program = program_file.read()
-        code_obj = msparser.generate_code(program)
-        convert_label_recursive(code_obj)
+        code_obj = compile_program(program, cache_dir, args.debug, args.optimize_level, args.optimization_report)
+        if args.aot:
+            import aot
+            module = aot.compile_module(code_obj, ENGINES[args.engine], args.file_name, args.max_call_depth)
+            with open(args.aot, 'w') as module_file:
+                module_file.write(module)
+            sys.exit()
         print('the generated code is:\n{}'.format(code_obj))
         print('==============================================')
-        virtual_machine = vm.VirtualMachine()
-        virtual_machine.run_code(code_obj)
+        virtual_machine = ENGINES[args.engine](max_call_depth=args.max_call_depth, memoize=args.memoize,
+                                               memo_size=args.memo_size, instrument=args.instrument,
+                                               timing=args.instrument_timing, profile=args.profile,
+                                               file_name=args.file_name, jit=not args.no_jit,
+                                               jit_calls=args.jit_calls, jit_loops=args.jit_loops,
+                                               jit_dump=args.jit_dump)
+        try:
+            virtual_machine.run_code(code_obj)
+        finally:
+            if args.profile:
+                profile = virtual_machine.profiler
+                profile.leave_all()
+                print(profile.format_report(), file=sys.stderr)
+                if args.profile_pstats:
+                    profile.write_pstats(args.profile_pstats)
+                if args.profile_collapsed:
+                    profile.write_collapsed(args.profile_collapsed)
+        if args.memoize and args.memo_report:
+            print(virtual_machine.memoizer.format_report(), file=sys.stderr)
+        if args.instrument:
+            print(virtual_machine.instrumentation.format_report(), file=sys.stderr)
@@ -0,0 +1,174 @@
+"""The builtin functions of MiniScript, written in Python.
+
+A name which is not a variable of the program is looked up here by the compiler, which loads the builtin
+with LOAD_BUILTIN. The virtual machine calls a builtin with the arguments right away, without a frame.
+
+Every builtin takes the virtual machine first, because the boxed and the native machine represent values
+differently: `type_of` gives the type tag of a value, `from_value` the Python object of a value (a Table for
+a table), and `to_value` makes a value of an int, a float, a str or a bool.
+"""
+import math
+
+from value import *
+
+BUILTINS = {}  # type: {str: Value} the function values of the builtins, by name
+
+
+def builtin(min_arity: int, max_arity=None, pure=True):
+    """Register a builtin. The name is that of the Python function, without a trailing underscore."""
+    def register(function):
+        name = function.__name__.rstrip('_')
+        native_function = NativeFunction(name, function, min_arity,
+                                         min_arity if max_arity is None else max_arity, pure)
+        BUILTINS[name] = Value(FUNCTION, native_function)
+        return function
+    return register
+
+
+def expect(virtual_machine, builtin_name: str, argument, *type_names):
+    """The Python object of `argument`, which must have one of the types `type_names`."""
+    if virtual_machine.type_of(argument) not in type_names:
+        raise TypeError('the argument of {} must be {}, but it is {}'
+                        .format(builtin_name, ' or '.join(type_names), argument))
+    return virtual_machine.from_value(argument)
+
+
+def make_list(elements):
+    return Value(TABLE, Table(list(elements)))
+
+
+# Tables, arrays and strs
+
+@builtin(1, pure=False)
+def len_(virtual_machine, x):
+    return virtual_machine.to_value(len(expect(virtual_machine, 'len', x, STR, TABLE, INT_ARRAY, REAL_ARRAY)))
+
+
+@builtin(1, pure=False)
+def keys(virtual_machine, t):
+    table = expect(virtual_machine, 'keys', t, TABLE)
+    array_keys = map(virtual_machine.to_value, range(len(table.array)))
+    return make_list(list(array_keys) + list(map(table_key, table.hash)))
+
+
+@builtin(1, 3, pure=False)
+def range_(virtual_machine, *bounds):
+    """range(stop), range(start, stop) or range(start, stop, step), a list of the ints like in Python."""
+    bounds = [expect(virtual_machine, 'range', bound, INT) for bound in bounds]
+    return make_list(map(virtual_machine.to_value, range(*bounds)))
+
+
+@builtin(2, 3, pure=False)
+def insert(virtual_machine, t, *arguments):
+    """insert(t, value) appends the value to the list t, insert(t, index, value) inserts it at the index."""
+    table = expect(virtual_machine, 'insert', t, TABLE)
+    if len(arguments) == 1:
+        index, value = len(table.array), arguments[0]
+    else:
+        index, value = expect(virtual_machine, 'insert', arguments[0], INT), arguments[1]
+    table.insert(index, value, virtual_machine.to_value)
+    return value
+
+
+@builtin(1, 2, pure=False)
+def remove(virtual_machine, t, *arguments):
+    """remove(t) removes the last element of the list t, remove(t, index) the element at the index."""
+    table = expect(virtual_machine, 'remove', t, TABLE)
+    index = expect(virtual_machine, 'remove', arguments[0], INT) if arguments else len(table.array) - 1
+    return table.remove(index)
+
+
+@builtin(2, pure=False)
+def split(virtual_machine, s, separator):
+    parts = expect(virtual_machine, 'split', s, STR).split(expect(virtual_machine, 'split', separator, STR))
+    return make_list(map(virtual_machine.to_value, parts))
+
+
+@builtin(2, pure=False)
+def join(virtual_machine, t, separator):
+    table = expect(virtual_machine, 'join', t, TABLE)
+    parts = [expect(virtual_machine, 'join', element, STR) for element in table.array]
+    return virtual_machine.to_value(expect(virtual_machine, 'join', separator, STR).join(parts))
+
+
+@builtin(1)
+def upper(virtual_machine, s):
+    return virtual_machine.to_value(expect(virtual_machine, 'upper', s, STR).upper())
+
+
+@builtin(1)
+def lower(virtual_machine, s):
+    return virtual_machine.to_value(expect(virtual_machine, 'lower', s, STR).lower())
+
+
+@builtin(2)
+def find(virtual_machine, s, sub):
+    """The index of the first occurrence of sub in s, or -1."""
+    index = expect(virtual_machine, 'find', s, STR).find(expect(virtual_machine, 'find', sub, STR))
+    return virtual_machine.to_value(index)
+
+
+@builtin(3)
+def substring(virtual_machine, s, start, stop):
+    """The characters of s from the index start to the index stop, stop not included."""
+    start, stop = (expect(virtual_machine, 'substring', index, INT) for index in (start, stop))
+    return virtual_machine.to_value(expect(virtual_machine, 'substring', s, STR)[start:stop])
+
+
+# Conversions
+
+@builtin(1)
+def to_str(virtual_machine, x):
+    return virtual_machine.to_value(str(expect(virtual_machine, 'to_str', x, INT, REAL, STR, BOOL)))
+
+
+@builtin(1)
+def to_int(virtual_machine, x):
+    """An int, a real truncated toward 0 or a str of digits as an int."""
+    return virtual_machine.to_value(int(expect(virtual_machine, 'to_int', x, INT, REAL, STR)))
+
+
+@builtin(1)
+def to_real(virtual_machine, x):
+    return virtual_machine.to_value(float(expect(virtual_machine, 'to_real', x, INT, REAL, STR)))
+
+
+# Numbers
+
+def number_builtin(name, function):
+    """A builtin of one number which returns a real."""
+    def number_function(virtual_machine, x):
+        return virtual_machine.to_value(float(function(expect(virtual_machine, name, x, INT, REAL))))
+    number_function.__name__ = name
+    builtin(1)(number_function)
+
+
+for name, function in [('sqrt', math.sqrt), ('exp', math.exp), ('log', math.log), ('sin', math.sin),
+                       ('cos', math.cos)]:
+    number_builtin(name, function)
+
+
+@builtin(1)
+def abs_(virtual_machine, x):
+    return virtual_machine.to_value(abs(expect(virtual_machine, 'abs', x, INT, REAL)))
+
+
+@builtin(1)
+def floor(virtual_machine, x):
+    """The greatest int not greater than the number x."""
+    return virtual_machine.to_value(math.floor(expect(virtual_machine, 'floor', x, INT, REAL)))
+
+
+def extreme_builtin(name, function):
+    """min or max of one or more numbers of the same type."""
+    def extreme(virtual_machine, *numbers):
+        type_name = virtual_machine.type_of(numbers[0])
+        if type_name is not INT and type_name is not REAL:
+            type_name = INT
+        return virtual_machine.to_value(function(expect(virtual_machine, name, x, type_name) for x in numbers))
+    extreme.__name__ = name
+    builtin(1, 255)(extreme)
+
+
+extreme_builtin('min', min)
+extreme_builtin('max', max)
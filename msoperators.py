@@ -0,0 +1,291 @@
+"""The operators and the representation of the values of the engines, which the virtual machines share with
+the Runtime of the modules compiled ahead of time, see msruntime.py.
+
+The boxed machine in vm.py wraps every value in a Value, its operators are the methods of Value. The native
+machine in nativevm.py keeps int, real, str and bool values unboxed, as Python objects, and its operators
+below raise the same TypeErrors as the methods of Value do. Both check the arguments of the calls and make
+the errors of the machines. This module does not import the interpreter, so a compiled module runs without it.
+"""
+import operator
+
+from value import *
+
+DEFAULT_MAX_CALL_DEPTH = 100000
+DTYPE = operator.attrgetter('dtype')
+
+
+class VirtualMachineError(Exception):
+    pass
+
+
+class BoxedOperators:
+    """The operators of the boxed machine, and how it represents the values."""
+    def __init__(self, max_call_depth=DEFAULT_MAX_CALL_DEPTH):
+        self.max_call_depth = max_call_depth
+
+    # The representation of the values, for the builtins in msbuiltins.py
+    type_of = staticmethod(DTYPE)
+
+    @staticmethod
+    def from_value(x):
+        return x.value
+
+    @staticmethod
+    def to_value(x):
+        return make_value(UNBOXED_TYPE_TAGS[type(x)], x)
+
+    # Tables
+    PROTOTYPE_KEY = PROTOTYPE
+    STORE_SUBSCR_OPERATOR = staticmethod(operator.setitem)
+
+    # Operators
+
+    UNARY_OPERATORS = {
+        'POSITIVE': operator.pos,
+        'NEGATIVE': operator.neg,
+        'NOT': lambda x: make_bool(not x),
+        'INVERT': operator.invert,
+    }
+
+    BINARY_OPERATORS = {
+        'POWER': pow,
+        'MULTIPLY': operator.mul,
+        'FLOOR_DIVIDE': operator.floordiv,
+        'TRUE_DIVIDE': operator.truediv,
+        'DIVIDE': operator.truediv,
+        'MODULO': operator.mod,
+        'ADD': operator.add,
+        'SUBTRACT': operator.sub,
+        'SUBSCR': operator.getitem,
+        'LSHIFT': operator.lshift,
+        'RSHIFT': operator.rshift,
+        'AND': operator.and_,
+        'XOR': operator.xor,
+        'OR': operator.or_,
+    }
+
+    COMPARE_OPERATORS = [
+        operator.lt,
+        operator.le,
+        operator.eq,
+        operator.ne,
+        operator.gt,
+        operator.ge,
+        lambda x, y: x in y,
+        lambda x, y: x not in y,
+        lambda x, y: x is y,
+        lambda x, y: x is not y,
+        lambda x, y: issubclass(x, Exception) and issubclass(x, y),
+    ]
+
+    # Calls
+
+    def check_arguments(self, func: Function, arguments: []):
+        if tuple(map(DTYPE, arguments)) != func.parameter_types:
+            for parameter, argument in zip(func.parameter_list.parameters, arguments):
+                if parameter.type_name is not argument.dtype:
+                    raise TypeError('the parameter {} is type {}, but the argument is {}'
+                                    .format(parameter.id_name, parameter.type_name, argument))
+
+    def check_arity(self, func: Function, arguments: []):
+        if len(arguments) != func.arity:
+            raise VirtualMachineError('the length of parameter is {}, but the argument is {}'
+                                      .format(func.arity, len(arguments)))
+
+    def call_depth_error(self):
+        return VirtualMachineError('the calls are nested deeper than the maximum call depth {}'
+                                   .format(self.max_call_depth))
+
+    @staticmethod
+    def unassigned_error(name):
+        return VirtualMachineError('the variable {} is used before it is assigned'.format(name))
+
+
+# The operators of the native machine, the type of a native value is the type of the Python object
+NATIVE_TYPES = UNBOXED_TYPE_TAGS
+NATIVE_PROTOTYPE_KEY = 'prototype'
+
+
+def type_of(x):
+    if type(x) is Value:
+        return x.dtype
+    return NATIVE_TYPES[type(x)]
+
+
+def box(x, boxed_tables=None):
+    """The boxed equivalent of a native value, used to print values the same way as the boxed machine."""
+    if type(x) is not Value:
+        return Value(NATIVE_TYPES[type(x)], x)
+    if x.dtype is not TABLE:
+        return x
+    if boxed_tables is None:
+        boxed_tables = {}
+    if id(x) not in boxed_tables:
+        boxed_tables[id(x)] = boxed = Value(TABLE, Table())
+        for key, value in x.value.items():
+            boxed.value[box(key, boxed_tables)] = box(value, boxed_tables)
+    return boxed_tables[id(x)]
+
+
+def check_type(x, y):
+    if type(x) is not type(y) or type(x) is Value and x.dtype is not y.dtype:
+        raise TypeError('the compare of = for {} and {} is error, the first is of type {} '
+                        'but the latter is of type {}'.format(box(x), box(y), type_of(x), type_of(y)))
+
+
+def check_number(x, operation):
+    if type(x) is not int and type(x) is not float:
+        raise TypeError('to {}, the type of operand must be number'.format(operation))
+
+
+def check_bool(x, operation):
+    if type(x) is not bool:
+        raise TypeError('to {}, the type of operand must be bool'.format(operation))
+
+
+def add(x, y):
+    if type(x) is type(y) and (type(x) is int or type(x) is float or type(x) is str):
+        return x + y
+    if is_array(x) or is_array(y):
+        return array_operation('add', x, y)
+    check_type(x, y)
+    raise TypeError('to add, the type of operand must be number or str')
+
+
+def arithmetic(operation, name):
+    """The fast path is for two numbers of the same type, everything else is an error."""
+    def operate(x, y):
+        if type(x) is type(y) and (type(x) is int or type(x) is float):
+            return operation(x, y)
+        if is_array(x) or is_array(y):
+            return array_operation(name, x, y)
+        check_type(x, y)
+        check_number(x, name)
+    return operate
+
+
+subtract = arithmetic(operator.sub, 'subtract')
+multiply = arithmetic(operator.mul, 'multiply')
+divide = arithmetic(lambda x, y: x // y if type(x) is int else x / y, 'divide')
+
+
+def logical_and(x, y):
+    check_type(x, y)
+    check_bool(x, 'and')
+    return x and y
+
+
+def logical_or(x, y):
+    check_type(x, y)
+    check_bool(x, 'or')
+    return x or y
+
+
+def negative(x):
+    check_number(x, 'negative')
+    return -x
+
+
+def logical_not(x):
+    if type(x) is not bool:
+        raise TypeError('you should check bool with a bool value')
+    return not x
+
+
+def equal(x, y):
+    if type(x) is not type(y):
+        return False
+    if type(x) is Value:
+        if x.dtype is TABLE and y.dtype is TABLE:
+            return table_equal(x.value, y.value)
+        return (x == y).value
+    return x == y
+
+
+def table_equal(x: Table, y: Table):
+    """Whether the tables have the same keys and equal values. Python considers 1, 1.0 and True equal, so the
+    unboxed values are compared with `equal`, like the boxed machine compares Values."""
+    if len(x.array) != len(y.array) or x.hash.keys() != y.hash.keys():
+        return False
+    return all(map(equal, x.array, y.array)) and all(equal(value, y.hash[key]) for key, value in x.hash.items())
+
+
+def not_equal(x, y):
+    return not equal(x, y)
+
+
+def ordering(compare):
+    def compare_checked(x, y):
+        if type(x) is type(y) and type(x) is not Value:
+            return compare(x, y)
+        check_type(x, y)
+        return compare(x, y).value
+    return compare_checked
+
+
+def getitem(obj, key):
+    if is_array(obj):
+        return obj.value[key]
+    if type(obj) is not Value or obj.dtype is not TABLE:
+        raise TypeError('only a table or an array can be subscripted, but the object is {}'.format(box(obj)))
+    owner = find_owner(obj, key, NATIVE_PROTOTYPE_KEY)
+    if owner is None:
+        raise KeyError('item {} not exists!'.format(box(key)))
+    return owner[key]
+
+
+def setitem(obj, key, value):
+    if is_array(obj):
+        obj.value[key] = value
+        return
+    if type(obj) is not Value or obj.dtype is not TABLE:
+        raise TypeError('only a table or an array can be subscripted, but the object is {}'.format(box(obj)))
+    store_property(obj, key, value, NATIVE_PROTOTYPE_KEY)
+
+
+class NativeOperators(BoxedOperators):
+    """The operators of the native machine, and how it represents the values."""
+    PROTOTYPE_KEY = NATIVE_PROTOTYPE_KEY
+    STORE_SUBSCR_OPERATOR = staticmethod(setitem)
+    type_of = staticmethod(type_of)
+
+    @staticmethod
+    def from_value(x):
+        return x.value if type(x) is Value else x
+
+    @staticmethod
+    def to_value(x):
+        return x
+
+    UNARY_OPERATORS = dict(BoxedOperators.UNARY_OPERATORS, **{
+        'NEGATIVE': negative,
+        'NOT': logical_not,
+    })
+
+    BINARY_OPERATORS = dict(BoxedOperators.BINARY_OPERATORS, **{
+        'MULTIPLY': multiply,
+        'TRUE_DIVIDE': divide,
+        'DIVIDE': divide,
+        'ADD': add,
+        'SUBTRACT': subtract,
+        'SUBSCR': getitem,
+        'AND': logical_and,
+        'OR': logical_or,
+    })
+
+    COMPARE_OPERATORS = [
+        ordering(operator.lt),
+        ordering(operator.le),
+        equal,
+        not_equal,
+        ordering(operator.gt),
+        ordering(operator.ge),
+    ]
+
+    def check_arguments(self, func: Function, arguments: []):
+        if func.unboxed_types is not None and tuple(map(type, arguments)) == func.unboxed_types:
+            return
+        for parameter, argument in zip(func.parameter_list.parameters, arguments):
+            if parameter.type_name is not type_of(argument):
+                raise TypeError('the parameter {} is type {}, but the argument is {}'
+                                .format(parameter.id_name, parameter.type_name, box(argument)))
@@ -4,11 +4,15 @@ from typing import Optional
 import ply.yacc as yacc
 import sys
 import logging
-from copy import deepcopy
+import threading
+from copy import copy, deepcopy
+from assembler import CodeBuffer
 from manager import ScopeManager
 from bytecode import *
+import mslexer
 from mslexer import tokens
-from value import Value, Function, CodeObj, Parameter, ParameterList
+from msbuiltins import BUILTINS
+from value import Value, Function, CodeObj, Parameter, ParameterList, INT, REAL, STR, FUNCTION
 precedence = (
     ('nonassoc', 'INCOMPLETE_IF'),
     ('nonassoc', 'ELSE'),
@@ -25,42 +29,12 @@ precedence = (
 )
 
 
-logging.basicConfig(
-    level = logging.DEBUG,
-    filename = "parselog.txt",
-    filemode = "w",
-    format = "%(filename)10s:%(lineno)4d:%(message)s"
-)
-log = logging.getLogger()
-current_parameter_list = ParameterList()
-scope_manager = ScopeManager()
-
-
-class Counter:
-    def __init__(self, init_value):
-        self.value = init_value
-
-
-def label_counter(init_value=0):
-    counter = Counter(init_value)
-
-    def increment():
-        old_label_count = counter.value
-        counter.value += 1
-        return old_label_count
-
-    return increment
-
-
-next_label = label_counter()
-
-
 class StatNode:
     def __init__(self):
         self.type = None  # type: str
         self.children = None  # type: OrderedDict
 
-    def emit_code(self) -> str:
+    def emit_code(self, code: CodeBuffer):
         return NotImplemented
 
 
@@ -69,7 +43,7 @@ class ExpNode:
         self.type = None  # type: str
         self.children = None  # type: OrderedDict
 
-    def emit_code(self) -> str:
+    def emit_code(self, code: CodeBuffer):
         return NotImplemented
 
 
@@ -81,10 +55,9 @@ class ListNode:
         else:
             self.children = [init_item]
 
-    def emit_code(self):
-        code_array = [item.emit_code() for item in self.children]
-        code = '\n'.join(code_array)
-        return code
+    def emit_code(self, code: CodeBuffer):
+        for item in self.children:
+            item.emit_code(code)
 
     def prepend_item(self, item):
         self.children.insert(0, item)
@@ -96,8 +69,18 @@ class ConstExpNode(ExpNode):
         self.type = 'const'
         self.children = {'index': index}
 
-    def emit_code(self):
-        return 'LOAD_CONST {}'.format(self.children['index'])
+    def emit_code(self, code: CodeBuffer):
+        code.emit('LOAD_CONST', self.children['index'])
+
+
+class FunctionExpNode(ExpNode):
+    def __init__(self, index: int):
+        super().__init__()
+        self.type = 'function'
+        self.children = {'index': index}
+
+    def emit_code(self, code: CodeBuffer):
+        code.emit('MAKE_FUNCTION', self.children['index'])
 
 
 class IDExpNode(ExpNode):
@@ -106,8 +89,18 @@ class IDExpNode(ExpNode):
         self.type = 'id'
         self.children = {'index': index}
 
-    def emit_code(self):
-        return 'LOAD_NAME {}'.format(self.children['index'])
+    def emit_code(self, code: CodeBuffer):
+        code.emit('LOAD_NAME', self.children['index'])
+
+
+class BuiltinExpNode(ExpNode):
+    def __init__(self, name: str):
+        super().__init__()
+        self.type = 'builtin'
+        self.children = {'name': name}
+
+    def emit_code(self, code: CodeBuffer):
+        code.emit('LOAD_BUILTIN', self.children['name'])
 
 
 class BinaryExpNode(ExpNode):
@@ -116,10 +109,8 @@ class BinaryExpNode(ExpNode):
         self.type = 'binary'
         self.children = OrderedDict([('operator', operator), ('left', left), ('right', right)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         [operator, left, right] = self.children.values()
-        left_code = left.emit_code()
-        right_code = right.emit_code()
         if operator == '+':
             operator_code = 'BINARY_ADD'
         elif operator == '-':
@@ -148,7 +139,9 @@ class BinaryExpNode(ExpNode):
             operator_code = 'BINARY_SUBSCR'
         else:
             raise ValueError('unrecognized binary operator {}'.format(operator))
-        return left_code + '\n' + right_code + '\n' + operator_code
+        left.emit_code(code)
+        right.emit_code(code)
+        code.emit(operator_code)
 
 
 class CompareExpNode(ExpNode):
@@ -157,24 +150,24 @@ class CompareExpNode(ExpNode):
         self.type = 'compare'
         self.children = OrderedDict([('operator', operator), ('left', left), ('right', right)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         [operator, left, right] = self.children.values()
-        left_code = left.emit_code()
-        right_code = right.emit_code()
-        operator_code = 'UNKNOWN_COMPARE_OPERATOR'
+        left.emit_code(code)
+        right.emit_code(code)
         if operator == '<':
-            operator_code = 'COMPARE_OP 0'
+            code.emit('COMPARE_OP', 0)
         elif operator == '<=':
-            operator_code = 'COMPARE_OP 1'
+            code.emit('COMPARE_OP', 1)
         elif operator == '==':
-            operator_code = 'COMPARE_OP 2'
+            code.emit('COMPARE_OP', 2)
         elif operator == '!=':
-            operator_code = 'COMPARE_OP 3'
+            code.emit('COMPARE_OP', 3)
         elif operator == '>':
-            operator_code = 'COMPARE_OP 4'
+            code.emit('COMPARE_OP', 4)
         elif operator == '>=':
-            operator_code = 'COMPARE_OP 5'
-        return left_code + '\n' + right_code + '\n' + operator_code
+            code.emit('COMPARE_OP', 5)
+        else:
+            code.emit('UNKNOWN_COMPARE_OPERATOR')
 
 
 class UnaryExpNode(ExpNode):
@@ -183,15 +176,15 @@ class UnaryExpNode(ExpNode):
         self.type = 'unary'
         self.children = OrderedDict([('operator', operator), ('exp', exp)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         [operator, exp] = self.children.values()
-        exp_code = exp.emit_code()
+        exp.emit_code(code)
         operator_code = 'UNKNOWN_UNARY_OPERATOR'
         if operator == '-':
             operator_code = 'UNARY_NEGATIVE'
         elif operator == 'not':
             operator_code = 'UNARY_NOT'
-        return exp_code + '\n' + operator_code
+        code.emit(operator_code)
 
 
 class ExpListNode(ListNode):
@@ -206,11 +199,10 @@ class MapElementExpNode(ExpNode):
         self.type = 'map_element_expression'
         self.children = OrderedDict([('key_expression', key_expression), ('value_expression', value_expression)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         key_expression, value_expression = self.children.values()
-        key_exp_code = key_expression.emit_code()
-        value_exp_code = value_expression.emit_code()
-        return key_exp_code + '\n' + value_exp_code
+        key_expression.emit_code(code)
+        value_expression.emit_code(code)
 
 
 class MapElementListNode(ListNode):
@@ -226,16 +218,11 @@ class CallExpNode(ExpNode):
         self.children = OrderedDict([('func_expression', func_expression),
                                      ('expression_list', expression_list)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer, byte_name='CALL_FUNCTION'):
         func_expression, expression_list = self.children.values()
-        exp_code = expression_list.emit_code()
-        load_function_code = func_expression.emit_code()
-        call_function_code = 'CALL_FUNCTION'
-        if exp_code:
-            ret_code = exp_code + '\n' + load_function_code + '\n' + call_function_code
-        else:
-            ret_code = load_function_code + '\n' + call_function_code
-        return ret_code
+        expression_list.emit_code(code)
+        func_expression.emit_code(code)
+        code.emit(byte_name, len(expression_list.children))
 
 
 class ArrayExpNode(ExpNode):
@@ -244,15 +231,22 @@ class ArrayExpNode(ExpNode):
         self.type = 'array'
         self.children = {'expression_list': expression_list}
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         expression_list = self.children['expression_list']
-        exp_code = expression_list.emit_code()
-        build_array_code = 'BUILD_LIST {}'.format(len(expression_list.children))
-        if exp_code:
-            ret_code = exp_code + '\n' + build_array_code
-        else:
-            ret_code = build_array_code
-        return ret_code
+        expression_list.emit_code(code)
+        code.emit('BUILD_LIST', len(expression_list.children))
+
+
+class TypedArrayExpNode(ExpNode):
+    def __init__(self, type_name: str, expression: ExpNode):
+        super().__init__()
+        self.type = 'typed_array'
+        self.children = OrderedDict([('type_name', type_name), ('expression', expression)])
+
+    def emit_code(self, code: CodeBuffer):
+        type_name, expression = self.children.values()
+        expression.emit_code(code)
+        code.emit('BUILD_ARRAY', type_name)
 
 
 class MapExpNode(ExpNode):
@@ -261,15 +255,10 @@ class MapExpNode(ExpNode):
         self.type = 'map'
         self.children = {'map_element_list': map_element_list}
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         map_element_list = self.children['map_element_list']
-        exp_code = map_element_list.emit_code()
-        build_array_code = 'BUILD_MAP {}'.format(len(map_element_list.children))
-        if exp_code:
-            ret_code = exp_code + '\n' + build_array_code
-        else:
-            ret_code = build_array_code
-        return ret_code
+        map_element_list.emit_code(code)
+        code.emit('BUILD_MAP', len(map_element_list.children))
 
 
 class StatListNode(ListNode):
@@ -284,9 +273,8 @@ class ProgramNode(StatNode):
         self.type = 'program'
         self.children = {'stat_list': stat_list}
 
-    def emit_code(self):
-        stat_code = self.children['stat_list'].emit_code()
-        return stat_code
+    def emit_code(self, code: CodeBuffer):
+        self.children['stat_list'].emit_code(code)
 
 
 class CompoundStatNode(StatNode):
@@ -295,8 +283,8 @@ class CompoundStatNode(StatNode):
         self.type = 'compound'
         self.children = {'stat_list': stat_list}
 
-    def emit_code(self):
-        return self.children['stat_list'].emit_code()
+    def emit_code(self, code: CodeBuffer):
+        self.children['stat_list'].emit_code(code)
 
 
 class AssignStatNode(StatNode):
@@ -305,11 +293,10 @@ class AssignStatNode(StatNode):
         self.type = 'assign'
         self.children = OrderedDict([('id_index', id_index), ('exp', exp)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         [id_index, exp] = self.children.values()
-        exp_code = exp.emit_code()
-        assign_code = 'STORE_NAME {}'.format(id_index)
-        return exp_code + '\n' + assign_code
+        exp.emit_code(code)
+        code.emit('STORE_NAME', id_index)
 
 
 class AssignSubscrStatNode(StatNode):
@@ -320,13 +307,12 @@ class AssignSubscrStatNode(StatNode):
                                      ('subscr_expression', subscr_expression),
                                      ('value_expression', value_expression)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         array_expression, subscr_expression, value_expression = self.children.values()
-        array_exp_code = array_expression.emit_code()
-        subscr_exp_code = subscr_expression.emit_code()
-        value_exp_code = value_expression.emit_code()
-        store_code = 'STORE_SUBSCR'
-        return value_exp_code + '\n' + array_exp_code + '\n' + subscr_exp_code + '\n' + store_code
+        value_expression.emit_code(code)
+        array_expression.emit_code(code)
+        subscr_expression.emit_code(code)
+        code.emit('STORE_SUBSCR')
 
 
 class BreakStatNode(StatNode):
@@ -335,8 +321,8 @@ class BreakStatNode(StatNode):
         self.type = 'break'
         self.children = None
 
-    def emit_code(self):
-        return 'BREAK_LOOP'
+    def emit_code(self, code: CodeBuffer):
+        code.emit('BREAK_LOOP')
 
 
 class PrintStatNode(StatNode):
@@ -345,10 +331,9 @@ class PrintStatNode(StatNode):
         self.type = 'print'
         self.children = {'exp': exp}
 
-    def emit_code(self):
-        exp_code = self.children['exp'].emit_code()
-        print_code = 'PRINT_EXPR'
-        return exp_code + '\n' + print_code
+    def emit_code(self, code: CodeBuffer):
+        self.children['exp'].emit_code(code)
+        code.emit('PRINT_EXPR')
 
 
 class WhileStatNode(StatNode):
@@ -357,20 +342,18 @@ class WhileStatNode(StatNode):
         self.type = 'while'
         self.children = OrderedDict([('condition', condition_exp), ('body', body_stat)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         [condition, body] = self.children.values()
-        condition_code = condition.emit_code()
-        body_code = body.emit_code()
-        while_code = """SETUP_LOOP L{0}
-L{1}:
-{2}
-POP_JUMP_IF_FALSE L{3}
-{4}
-JUMP_ABSOLUTE L{1}
-L{3}:
-POP_BLOCK
-L{0}:""".format(next_label(), next_label(), condition_code, next_label(), body_code)
-        return while_code
+        loop_end, loop_start, loop_exit = code.new_label(), code.new_label(), code.new_label()
+        code.emit('SETUP_LOOP', loop_end)
+        code.mark(loop_start)
+        condition.emit_code(code)
+        code.emit('POP_JUMP_IF_FALSE', loop_exit)
+        body.emit_code(code)
+        code.emit('JUMP_ABSOLUTE', loop_start)
+        code.mark(loop_exit)
+        code.emit('POP_BLOCK')
+        code.mark(loop_end)
 
 
 class ForStatNode(StatNode):
@@ -381,24 +364,20 @@ class ForStatNode(StatNode):
         self.children = OrderedDict([('init', init_stat), ('condition', condition_exp),
                                      ('loop', loop_stat), ('body', body_stat)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         [init, condition, loop, body] = self.children.values()
-        init_code = init.emit_code()
-        condition_code = condition.emit_code()
-        loop_code = loop.emit_code()
-        for_code = """{0}
-SETUP_LOOP L{1}
-L{2}:
-{3}
-POP_JUMP_IF_FALSE L{4}
-{5}
-{6}
-JUMP_ABSOLUTE L{2}
-L{4}:
-POP_BLOCK
-L{1}:""".format(init_code, next_label(), next_label(), condition_code, next_label(),
-                body.emit_code(), loop_code)
-        return for_code
+        loop_end, loop_start, loop_exit = code.new_label(), code.new_label(), code.new_label()
+        init.emit_code(code)
+        code.emit('SETUP_LOOP', loop_end)
+        code.mark(loop_start)
+        condition.emit_code(code)
+        code.emit('POP_JUMP_IF_FALSE', loop_exit)
+        body.emit_code(code)
+        loop.emit_code(code)
+        code.emit('JUMP_ABSOLUTE', loop_start)
+        code.mark(loop_exit)
+        code.emit('POP_BLOCK')
+        code.mark(loop_end)
 
 
 class BranchStatNode(StatNode):
@@ -407,24 +386,20 @@ class BranchStatNode(StatNode):
         self.type = 'branch'
         self.children = OrderedDict([('if_exp', if_exp), ('if_stat', if_stat), ('else_stat', else_stat)])
 
-    def emit_code(self):
+    def emit_code(self, code: CodeBuffer):
         [if_exp, if_stat, else_stat] = self.children.values()
-        if_exp_code = if_exp.emit_code()
+        else_start = code.new_label()
+        if_exp.emit_code(code)
+        code.emit('POP_JUMP_IF_FALSE', else_start)
+        if_stat.emit_code(code)
         if else_stat:
-            branch_code = """{0}
-POP_JUMP_IF_FALSE L{1}
-{2}
-JUMP_ABSOLUTE L{3}
-L{1}:
-{4}
-L{3}:""".format(if_exp_code, next_label(), if_stat.emit_code(), next_label(),
-                else_stat.emit_code())
+            branch_end = code.new_label()
+            code.emit('JUMP_ABSOLUTE', branch_end)
+            code.mark(else_start)
+            else_stat.emit_code(code)
+            code.mark(branch_end)
         else:
-            branch_code = """{0}
-POP_JUMP_IF_FALSE L{1}
-{2}
-L{1}:""".format(if_exp_code, next_label(), if_stat.emit_code())
-        return branch_code
+            code.mark(else_start)
 
 
 class ExpStatNode(StatNode):
@@ -433,11 +408,9 @@ class ExpStatNode(StatNode):
         self.type = 'exp_statement'
         self.children = {'expression': exp}
 
-    def emit_code(self):
-        expression = self.children['expression']
-        exp_code = expression.emit_code()
-        discard_code = 'POP_TOP'
-        return exp_code + '\n' + discard_code
+    def emit_code(self, code: CodeBuffer):
+        self.children['expression'].emit_code(code)
+        code.emit('POP_TOP')
 
 
 class ReturnStatNode(StatNode):
@@ -446,10 +419,27 @@ class ReturnStatNode(StatNode):
         self.type = 'return'
         self.children = {'exp': exp}
 
-    def emit_code(self):
-        exp_code = self.children['exp'].emit_code()
-        return_code = 'RETURN_VALUE'
-        return exp_code + '\n' + return_code
+    def emit_code(self, code: CodeBuffer):
+        exp = self.children['exp']
+        if isinstance(exp, CallExpNode):
+            # the callee runs in the frame of the caller, the RETURN_VALUE is only reached after a builtin
+            # or a transpiled call, which leave their result on the stack
+            exp.emit_code(code, 'TAIL_CALL_FUNCTION')
+        else:
+            exp.emit_code(code)
+        code.emit('RETURN_VALUE')
+
+
+FUNCTION_NAME = 'function'  # the name of a function until it is named after where it is assigned
+
+
+def name_function(scope_manager: ScopeManager, expression: ExpNode, name: str):
+    """Name the function which `expression` makes after the variable or the key it is assigned to, for the
+    profiler. A function keeps the first name it is given."""
+    if isinstance(expression, FunctionExpNode):
+        code_obj = scope_manager.current_const_list[expression.children['index']].value.code_obj
+        if code_obj.name == FUNCTION_NAME:
+            code_obj.name = name
 
 
 class SyntaxTreeJSONEncoder(json.JSONEncoder):
@@ -531,7 +521,9 @@ def p_assign_statement(p):
     """
     assign_statement : ID ASSIGN seen_ASSIGN expression
     """
+    scope_manager = p.parser.compiler.scope_manager
     t = scope_manager.find_name(p[1])
+    name_function(scope_manager, p[4], p[1])
     p[0] = AssignStatNode(tuple2index(t), p[4])
 
 
@@ -539,6 +531,7 @@ def p_seen_ASSIGN(p):
     """
     seen_ASSIGN :
     """
+    scope_manager = p.parser.compiler.scope_manager
     if not scope_manager.contains_name(p[-2]):
         scope_manager.append_name(p[-2])
 
@@ -554,10 +547,12 @@ def p_assign_dot_statement(p):
     """
     assign_subscr_statement : expression DOT ID ASSIGN expression
     """
-    exp_item = Value('str', p[3])
+    scope_manager = p.parser.compiler.scope_manager
+    exp_item = Value(STR, p[3])
     if not scope_manager.contains_const(exp_item):
         scope_manager.append_const(exp_item)
     subscr_node = ConstExpNode(scope_manager.find_const(exp_item))
+    name_function(scope_manager, p[5], p[3])
     p[0] = AssignSubscrStatNode(p[1], subscr_node, p[5])
 
 
@@ -612,7 +607,8 @@ def p_binary_dot_expression(p):
     """
     expression : expression DOT ID
     """
-    exp_item = Value('str', p[3])
+    scope_manager = p.parser.compiler.scope_manager
+    exp_item = Value(STR, p[3])
     if not scope_manager.contains_const(exp_item):
         scope_manager.append_const(exp_item)
     subscr_node = ConstExpNode(scope_manager.find_const(exp_item))
@@ -650,7 +646,8 @@ def p_expression_int(p):
     """
     expression : INT
     """
-    exp_item = Value('int', p[1])
+    scope_manager = p.parser.compiler.scope_manager
+    exp_item = Value(INT, p[1])
     if not scope_manager.contains_const(exp_item):
         scope_manager.append_const(exp_item)
     p[0] = ConstExpNode(scope_manager.find_const(exp_item))
@@ -660,7 +657,8 @@ def p_expression_real(p):
     """
     expression : REAL
     """
-    exp_item = Value('real', p[1])
+    scope_manager = p.parser.compiler.scope_manager
+    exp_item = Value(REAL, p[1])
     if not scope_manager.contains_const(exp_item):
         scope_manager.append_const(exp_item)
     p[0] = ConstExpNode(scope_manager.find_const(exp_item))
@@ -670,7 +668,8 @@ def p_expression_string(p):
     """
     expression : STRING
     """
-    exp_item = Value('str', p[1])
+    scope_manager = p.parser.compiler.scope_manager
+    exp_item = Value(STR, p[1])
     if not scope_manager.contains_const(exp_item):
         scope_manager.append_const(exp_item)
     p[0] = ConstExpNode(scope_manager.find_const(exp_item))
@@ -680,31 +679,38 @@ def p_expression_function(p):
     """
     expression : FUNCTION LEFT_PAREN parameter_list RIGHT_PAREN seen_FUNCTION LEFT_BRACE statement_list RIGHT_BRACE
     """
+    scope_manager = p.parser.compiler.scope_manager
     parameter_list = p[3]
     statement_list = p[7]
-    code = statement_list.emit_code()
-    function_obj = CodeObj(code, scope_manager.current_const_list, scope_manager.current_name_list)
-    exp_item = Value('function', Function(parameter_list, function_obj, scope_manager.current_lexical_depth))
+    code = CodeBuffer()
+    statement_list.emit_code(code)
+    function_obj = CodeObj(code.assemble(), scope_manager.current_const_list, scope_manager.current_name_list,
+                           FUNCTION_NAME, p.lineno(1))
+    exp_item = Value(FUNCTION, Function(parameter_list, function_obj, scope_manager.current_lexical_depth))
     scope_manager.exit_scope()
     if not scope_manager.contains_const(exp_item):
         scope_manager.append_const(exp_item)
     index = scope_manager.find_const(exp_item)
-    p[0] = ConstExpNode(index)
+    p[0] = FunctionExpNode(index)
 
 
 def p_seen_function(p):
     """
     seen_FUNCTION :
     """
-    global current_parameter_list
-    scope_manager.new_scope(current_parameter_list.names)
-    current_parameter_list = ParameterList()
+    compiler = p.parser.compiler
+    compiler.scope_manager.new_scope(compiler.current_parameter_list.names)
+    compiler.current_parameter_list = ParameterList()
 
 
 def p_expression_id(p):
     """
     expression : ID
     """
+    scope_manager = p.parser.compiler.scope_manager
+    if not scope_manager.contains_name(p[1]) and p[1] in BUILTINS:
+        p[0] = BuiltinExpNode(p[1])
+        return
     t = scope_manager.find_name(p[1])
     p[0] = IDExpNode(tuple2index(t))
 
@@ -723,6 +729,14 @@ def p_array_expression(p):
     p[0] = ArrayExpNode(p[2])
 
 
+def p_typed_array_expression(p):
+    """
+    expression : TYPE_INT LEFT_BRACKET expression RIGHT_BRACKET
+               | TYPE_REAL LEFT_BRACKET expression RIGHT_BRACKET
+    """
+    p[0] = TypedArrayExpNode(p[1] + '[]', p[3])
+
+
 def p_expression_list(p):
     """
     expression_list :  expression COMMA expression_list
@@ -742,6 +756,10 @@ def p_map_element(p):
     """
     map_element_expression : expression COLON expression
     """
+    if isinstance(p[1], ConstExpNode):
+        key = p.parser.compiler.scope_manager.current_const_list[p[1].children['index']]
+        if key.dtype is STR:
+            name_function(p.parser.compiler.scope_manager, p[3], key.value)
     p[0] = MapElementExpNode(p[1], p[3])
 
 
@@ -781,8 +799,10 @@ def p_type(p):
          | TYPE_STRING
          | FUNCTION
          | TYPE_TABLE
+         | TYPE_INT LEFT_BRACKET RIGHT_BRACKET
+         | TYPE_REAL LEFT_BRACKET RIGHT_BRACKET
     """
-    p[0] = p[1]
+    p[0] = ''.join(p[1:])
 
 
 def p_parameter_list(p):
@@ -791,17 +811,17 @@ def p_parameter_list(p):
                    | parameter
                    |
     """
-    global current_parameter_list
+    compiler = p.parser.compiler
     if len(p) == 1:
         p[0] = ParameterList()
-        current_parameter_list = deepcopy(p[0])
+        compiler.current_parameter_list = deepcopy(p[0])
     elif len(p) == 2:
         p[0] = ParameterList(p[1])
-        current_parameter_list = deepcopy(p[0])
+        compiler.current_parameter_list = deepcopy(p[0])
     else:
         p[0] = p[3]
         p[0].prepend_item(p[1])
-        current_parameter_list = deepcopy(p[0])
+        compiler.current_parameter_list = deepcopy(p[0])
 
 
 def p_error(p):
@@ -809,13 +829,65 @@ def p_error(p):
                                                                                   p.value))
 
 
-def generate_code(program: str):
-    parser = yacc.yacc()
-    result = parser.parse(program, debug=log)
-    print("the JSON format is:")
-    print(SyntaxTreeJSONEncoder(indent=4, separators=(',', ': ')).encode(result))
-    code = result.emit_code()
-    return CodeObj(code, scope_manager.current_const_list, scope_manager.current_name_list)
+TAB_MODULE = 'msparsetab'
+_parser = None
+_parser_lock = threading.Lock()
+
+
+def get_parser():
+    """Build the parser once per process. The LALR tables are written to msparsetab.py the first time,
+    later processes only read them back."""
+    global _parser
+    with _parser_lock:
+        if _parser is None:
+            _parser = yacc.yacc(debug=False, tabmodule=TAB_MODULE, errorlog=yacc.NullLogger())
+    return _parser
+
+
+class Compiler:
+    """All the state of one compilation. Every program is compiled by a new Compiler, so a process can
+    compile any number of programs, one after another or at the same time in different threads."""
+    def __init__(self):
+        self.scope_manager = ScopeManager()
+        self.current_parameter_list = ParameterList()
+
+    def new_parser(self, debug=False):
+        # a parser keeps its stacks on itself while parsing, so each compilation parses with its own
+        # shallow copy of the shared parser, only the LALR tables are shared
+        if debug:
+            parser = yacc.yacc(tabmodule=TAB_MODULE)
+        else:
+            parser = copy(get_parser())
+        parser.compiler = self
+        return parser
+
+    def parse(self, program: str, debug=False):
+        lexer = mslexer.lexer.clone()
+        lexer.lineno = 1
+        parser = self.new_parser(debug)
+        if not debug:
+            return parser.parse(program, lexer=lexer)
+        # log every parser action to parselog.txt, and print the syntax tree
+        logging.basicConfig(
+            level=logging.DEBUG,
+            filename="parselog.txt",
+            filemode="w",
+            format="%(filename)10s:%(lineno)4d:%(message)s"
+        )
+        result = parser.parse(program, lexer=lexer, debug=logging.getLogger())
+        print("the JSON format is:")
+        print(SyntaxTreeJSONEncoder(indent=4, separators=(',', ': ')).encode(result))
+        return result
+
+    def compile(self, program: str, debug=False) -> CodeObj:
+        result = self.parse(program, debug)
+        code = CodeBuffer()
+        result.emit_code(code)
+        return CodeObj(code.assemble(), self.scope_manager.current_const_list, self.scope_manager.current_name_list)
+
+
+def generate_code(program: str, debug=False):
+    return Compiler().compile(program, debug)
 
 
 def main():
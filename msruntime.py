@@ -0,0 +1,79 @@
+"""The support library of the Python modules which aot.py compiles MiniScript programs into.
+
+A compiled module holds one transpiled Python function for every code object of the program, see
+transpiler.py, and a Runtime which runs them in place of the virtual machine: it calls the functions,
+checks the arguments and the call depth, and raises the errors of the machine. The operators and the
+representation of the values, which the builtins need too, are those of the engine the module is compiled
+for, from msoperators.py. Neither this module nor a compiled one imports the lexer, the parser, the
+virtual machines or the transpiler, but they need msoperators.py, msbuiltins.py, value.py and typedarray.py.
+
+The calls of the program nest Python calls, so the recursion limit of Python is raised while the program
+runs, to allow `max_call_depth` calls.
+"""
+import sys
+
+from msoperators import DEFAULT_MAX_CALL_DEPTH
+from value import *
+
+FRAMES_PER_CALL = 2  # the Python frames of a call: Runtime.call and the transpiled function
+
+
+def make_function(code_obj: CodeObj, parameters: tuple, lexical_depth: int):
+    """The value of a function constant, `parameters` are the (name, type name) pairs of its parameters."""
+    parameter_list = ParameterList()
+    parameter_list.parameters = [Parameter(id_name, type_name) for id_name, type_name in parameters]
+    return Value(FUNCTION, Function(parameter_list, code_obj, lexical_depth))
+
+
+class Runtime:
+    def __init__(self, operators_class, max_call_depth=DEFAULT_MAX_CALL_DEPTH):
+        self.operators = operators_class(max_call_depth)  # like BoxedOperators or NativeOperators
+        self.functions = {}  # type: {CodeObj: function} the transpiled function of every code object
+        self.depth = 0  # how many calls are running, the program counts as one like its frame
+
+    def add(self, code_obj: CodeObj, function):
+        self.functions[code_obj] = function
+
+    def run(self, code_obj: CodeObj):
+        """Run the program `code_obj` and return its return value."""
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(recursion_limit, FRAMES_PER_CALL * self.operators.max_call_depth + recursion_limit))
+        slots = [None] * len(code_obj.name_list)
+        self.depth = 1
+        try:
+            return self.functions[code_obj](slots, (slots,))
+        finally:
+            self.depth = 0
+            sys.setrecursionlimit(recursion_limit)
+
+    # The calls of the transpiled code
+
+    def call(self, func_value, arguments: list):
+        func = func_value.value
+        operators = self.operators
+        if type(func) is NativeFunction:
+            return func.call(operators, arguments)
+        operators.check_arity(func, arguments)
+        operators.check_arguments(func, arguments)
+        arguments.extend(func.local_padding)
+        if self.depth >= operators.max_call_depth:
+            raise operators.call_depth_error()
+        self.depth += 1
+        try:
+            return self.functions[func.code_obj](arguments, func.scopes + (arguments,))
+        finally:
+            self.depth -= 1
+
+    def tail_call(self, func_value, arguments: list, code_obj: CodeObj):
+        """The scopes of a call of the function of `code_obj` in return position, which runs in the Python
+        call of the caller, or None if `func_value` is another function."""
+        func = func_value.value
+        if type(func) is not Function or func.code_obj is not code_obj:
+            return None
+        self.operators.check_arity(func, arguments)
+        self.operators.check_arguments(func, arguments)
+        arguments.extend(func.local_padding)
+        return func.scopes + (arguments,)
+
+    def unassigned(self, name: str):
+        return self.operators.unassigned_error(name)
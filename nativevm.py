@@ -0,0 +1,137 @@
+"""A virtual machine which keeps int, real, str and bool values unboxed.
+
+The boxed machine in vm.py wraps every value in a Value(dtype, value). This one puts native Python ints,
+floats, strs and bools on the stack and in the variables, only tables and functions stay wrapped in a
+Value. The type of a native value is the type of the Python object, and the operators, NativeOperators
+in msoperators.py, raise the same TypeErrors as the methods of Value do.
+
+Tables hold native keys and values as well, the hash part keeps the ints, reals and bools apart by their
+type, see hash_key in value.py.
+"""
+import math
+
+from msoperators import NATIVE_TYPES, NativeOperators, box, logical_not
+from transpiler import Entry, Transpiler
+from vm import VirtualMachine
+from value import *
+
+
+class NativeTranspiler(Transpiler):
+    """Transpiles for the native machine, the values of the constants and the numbers are Python objects."""
+
+    def constant(self, index: int, const: Value):
+        if const.dtype not in UNBOXED_TYPES:
+            return Entry(self.bind('k{}'.format(index), const), const.dtype)
+        if type(const.value) is float and not math.isfinite(const.value):
+            expression = self.bind('k{}'.format(index), const.value)
+        else:
+            expression = '({!r})'.format(const.value)
+        return Entry(expression, const.dtype, expression)
+
+    def raw(self, entry: Entry):
+        return entry.expression
+
+    def type_test(self, entry: Entry, dtype: str):
+        if entry.dtype is dtype:
+            return None
+        if dtype in UNBOXED_TYPES:
+            return 'type({}) is {}'.format(entry.expression, UNBOXED_TYPES[dtype].__name__)
+        return 'type({}) is {} and {}.dtype is {}'.format(entry.expression, self.bind('Value', Value),
+                                                          entry.expression, self.tag(dtype))
+
+    def boxed(self, dtype: str, raw: str):
+        return raw
+
+    def boolean(self, condition: str):
+        return condition
+
+    def truth(self, entry: Entry):
+        return entry.expression
+
+    def test_of(self, expression: str):
+        return expression
+
+    def equality(self, x: Entry, y: Entry):
+        # only unboxed values compare with Python ==, tables compare their elements with msoperators.equal
+        if x.dtype not in UNBOXED_TYPES and y.dtype not in UNBOXED_TYPES:
+            return None
+        return super().equality(x, y)
+
+    def subscript_test(self, obj: Entry, key: Entry):
+        if key.dtype is not None and key.dtype is not INT or obj.dtype is not None:
+            return None
+        return ' and '.join(test for test in (self.type_test(key, INT), self.type_test(obj, TABLE),
+                                              '0 <= {} < len({}.value.array)'.format(key.expression, obj.expression))
+                            if test)
+
+    def print_value(self, entry: Entry):
+        self.emit('print({}({}))'.format(self.bind('box', box), entry.expression))
+
+    def branch(self, entry: Entry, jump_if: bool, target: int):
+        """Like POP_JUMP_IF_TRUE and POP_JUMP_IF_FALSE, a value which is not a bool raises."""
+        if entry.is_bool:
+            self.branch_on(entry.expression, jump_if, target)
+            return
+        self.emit('if {} is not {}:'.format(entry.expression, not jump_if))
+        self.indent += 1
+        self.emit('if {} is not {}:'.format(entry.expression, jump_if))
+        self.emit("    raise TypeError('you should check bool with a bool value')")
+        self.jump(target)
+        self.emit('continue')
+        self.indent -= 1
+
+    def emit_UNARY_NOT(self, _):
+        x = self.pop()
+        target, stored = self.result_target()
+        if x.is_bool:
+            self.emit('{} = not {}'.format(target, x.expression))
+        else:
+            self.emit('{} = {}({})'.format(target, self.bind('logical_not', logical_not), x.expression))
+        return self.result(Entry(target, is_bool=True), stored)
+
+
+class NativeVirtualMachine(NativeOperators, VirtualMachine):
+    engine = 'native'
+    transpiler_class = NativeTranspiler
+    operators_class = NativeOperators
+
+    def decode_argument(self, code_obj: CodeObj, byte_name, arg_val):
+        argument = super().decode_argument(code_obj, byte_name, arg_val)
+        if byte_name == 'LOAD_CONST' and argument.dtype in NATIVE_TYPES.values():
+            return argument.value
+        return argument
+
+    def byte_BINARY_SUBSCR(self, cache: PropertyCache):
+        obj, subscr = self.current_frame.popn(2)
+        if type(subscr) is int and type(obj) is Value and obj.dtype is TABLE:
+            array = obj.value.array
+            if 0 <= subscr < len(array):
+                self.current_frame.push(array[subscr])
+                return
+        self.current_frame.push(cache.load(obj, subscr))
+
+    def byte_STORE_SUBSCR(self, cache: PropertyCache):
+        val, obj, subscr = self.current_frame.popn(3)
+        if type(subscr) is int and type(obj) is Value and obj.dtype is TABLE:
+            array = obj.value.array
+            if 0 <= subscr < len(array):
+                array[subscr] = val
+                return
+        cache.store(obj, subscr, val)
+
+    def byte_POP_JUMP_IF_TRUE(self, jump):
+        val = self.current_frame.pop()
+        if val is True:
+            self.jump(jump)
+        elif val is not False:
+            raise TypeError('you should check bool with a bool value')
+
+    def byte_POP_JUMP_IF_FALSE(self, jump):
+        val = self.current_frame.pop()
+        if val is False:
+            self.jump(jump)
+        elif val is not True:
+            raise TypeError('you should check bool with a bool value')
+
+    def byte_PRINT_EXPR(self, _):
+        print(box(self.current_frame.pop()))
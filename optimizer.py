@@ -0,0 +1,265 @@
+"""An optional stage between the code generator and the virtual machine which rewrites the compiled code.
+
+-O0 leaves the code as it is generated.
+-O1 folds the operators and the branches on constants, threads the jumps to jumps, and removes the jumps to
+    the next instruction and the code which can never run, like the code after a return or a break.
+-O2 also turns a store to a variable which is never read into a pop, and removes a STORE_NAME x followed by
+    the only LOAD_NAME x, which leaves the value on the stack.
+
+The functions defined in a code object are optimized too, each function is reported separately.
+"""
+import operator
+from collections import Counter
+
+from bytecode import HAVE_LABEL, index2tuple
+from value import *
+
+MAX_LEVEL = 2
+
+FOLDABLE_TYPES = (INT, REAL, STR, BOOL)
+BINARY_FOLDERS = {
+    'BINARY_ADD': operator.add,
+    'BINARY_SUBTRACT': operator.sub,
+    'BINARY_MULTIPLY': operator.mul,
+    'BINARY_DIVIDE': operator.truediv,
+    'BINARY_TRUE_DIVIDE': operator.truediv,
+    'BINARY_AND': operator.and_,
+    'BINARY_OR': operator.or_,
+}
+COMPARE_FOLDERS = [operator.lt, operator.le, operator.eq, operator.ne, operator.gt, operator.ge]
+UNARY_FOLDERS = {
+    'UNARY_NEGATIVE': operator.neg,
+    'UNARY_NOT': lambda x: make_bool(not x),
+}
+# The instructions which never continue with the next instruction
+NO_FALL_THROUGH = ('JUMP_ABSOLUTE', 'RETURN_VALUE', 'BREAK_LOOP')
+
+
+class CodeOptimizer:
+    """Optimizes the instructions of one code object. While a pass runs, removed instructions are replaced
+    by None, `compact` drops them and moves the jumps to the instruction which took their place."""
+    def __init__(self, code_obj: CodeObj, lexical_depth: int, level: int):
+        self.code_obj = code_obj
+        self.lexical_depth = lexical_depth
+        self.level = level
+        self.code = list(code_obj.code)  # type: [(str, int)]
+
+    def passes(self):
+        passes = [self.fold_constants, self.thread_jumps, self.remove_unreachable, self.remove_useless_pops]
+        if self.level >= 2:
+            passes.append(self.eliminate_stores)
+        return passes
+
+    def run(self):
+        changed = True
+        while changed:
+            changed = False
+            for optimization in self.passes():
+                if optimization(self.jump_targets()):
+                    self.compact()
+                    changed = True
+        return self.code
+
+    def jump_targets(self):
+        return {arg for byte_name, arg in self.code if byte_name in HAVE_LABEL}
+
+    def compact(self):
+        new_positions = []
+        position = 0
+        for instruction in self.code:
+            new_positions.append(position)
+            if instruction is not None:
+                position += 1
+        new_positions.append(position)
+        self.code = [(byte_name, new_positions[arg] if byte_name in HAVE_LABEL else arg)
+                     for byte_name, arg in filter(None, self.code)]
+
+    def operands(self, position, count, targets):
+        """The positions of the `count` instructions before `position`, or None if a jump may land between
+        them, in which case the instructions may run without each other."""
+        operand_positions = []
+        previous = position
+        while len(operand_positions) < count:
+            previous -= 1
+            while previous >= 0 and self.code[previous] is None:
+                previous -= 1
+            if previous < 0:
+                return None
+            operand_positions.insert(0, previous)
+        if any(target in targets for target in range(operand_positions[0] + 1, position + 1)):
+            return None
+        return operand_positions
+
+    def constants(self, positions):
+        """The constants loaded by the instructions at `positions`, or None if they are not all constants."""
+        constants = []
+        for position in positions:
+            byte_name, arg = self.code[position]
+            if byte_name != 'LOAD_CONST':
+                return None
+            constants.append(self.code_obj.const_list[arg])
+        return constants
+
+    def constant_index(self, constant: Value):
+        const_list = self.code_obj.const_list
+        for index, existing in enumerate(const_list):
+            if existing.dtype is constant.dtype and repr(existing.value) == repr(constant.value):
+                return index
+        const_list.append(constant)
+        return len(const_list) - 1
+
+    def fold_constants(self, targets):
+        """Compute the operators and the conditional jumps whose operands are all constants. An operation
+        which would raise an error is left for the virtual machine to raise at run time."""
+        changed = False
+        for position, instruction in enumerate(self.code):
+            if instruction is None:
+                continue
+            byte_name, arg = instruction
+            if byte_name in BINARY_FOLDERS:
+                fold, count = BINARY_FOLDERS[byte_name], 2
+            elif byte_name == 'COMPARE_OP' and arg < len(COMPARE_FOLDERS):
+                fold, count = COMPARE_FOLDERS[arg], 2
+            elif byte_name in UNARY_FOLDERS:
+                fold, count = UNARY_FOLDERS[byte_name], 1
+            elif byte_name in ('POP_JUMP_IF_TRUE', 'POP_JUMP_IF_FALSE'):
+                fold, count = None, 1
+            else:
+                continue
+            operand_positions = self.operands(position, count, targets)
+            constants = operand_positions and self.constants(operand_positions)
+            if not constants or any(constant.dtype is not constants[0].dtype or constant.dtype not in FOLDABLE_TYPES
+                                    for constant in constants):
+                continue
+            if fold is None:
+                if constants[0].dtype is not BOOL:
+                    continue
+                jumps = constants[0].value == (byte_name == 'POP_JUMP_IF_TRUE')
+                self.code[position] = ('JUMP_ABSOLUTE', arg) if jumps else None
+            else:
+                try:
+                    result = fold(*constants)
+                except (TypeError, ZeroDivisionError):
+                    continue
+                self.code[position] = ('LOAD_CONST', self.constant_index(result))
+            for operand_position in operand_positions:
+                self.code[operand_position] = None
+            changed = True
+        return changed
+
+    def thread_jumps(self, _):
+        """Let the jumps to an unconditional jump go to its target, and drop the jumps to the next instruction."""
+        changed = False
+        code = self.code
+        for position, instruction in enumerate(code):
+            if instruction is None or instruction[0] not in HAVE_LABEL:
+                continue
+            byte_name, arg = instruction
+            target, seen = arg, set()
+            while target < len(code) and code[target] is not None and code[target][0] == 'JUMP_ABSOLUTE' \
+                    and target not in seen:
+                seen.add(target)
+                target = code[target][1]
+            if byte_name == 'JUMP_ABSOLUTE' and target == position + 1:
+                code[position] = None
+            elif byte_name.startswith('POP_JUMP_IF_') and target == position + 1:
+                code[position] = ('POP_TOP', None)
+            elif target != arg:
+                code[position] = (byte_name, target)
+            else:
+                continue
+            changed = True
+        return changed
+
+    def remove_unreachable(self, _):
+        code = self.code
+        reachable = set()
+        pending = [0]
+        while pending:
+            position = pending.pop()
+            if position in reachable or position >= len(code):
+                continue
+            reachable.add(position)
+            byte_name, arg = code[position]
+            if byte_name in HAVE_LABEL:
+                pending.append(arg)
+            if byte_name not in NO_FALL_THROUGH:
+                pending.append(position + 1)
+        if len(reachable) == len(code):
+            return False
+        self.code = [instruction if position in reachable else None for position, instruction in enumerate(code)]
+        return True
+
+    def remove_useless_pops(self, targets):
+        """Remove a value which is pushed only to be popped again."""
+        changed = False
+        code = self.code
+        for position in range(1, len(code)):
+            if code[position] == ('POP_TOP', None) and position not in targets \
+                    and code[position - 1] is not None and code[position - 1][0] in ('LOAD_CONST', 'DUP_TOP'):
+                code[position - 1] = code[position] = None
+                changed = True
+        return changed
+
+    def loads(self, code_obj: CodeObj):
+        """How many times each slot of this code object is read by `code_obj` or by the functions defined in it."""
+        loads = Counter(index for lexical_depth, index in (index2tuple(arg) for byte_name, arg in code_obj.code
+                                                           if byte_name == 'LOAD_NAME')
+                        if lexical_depth == self.lexical_depth)
+        for const in code_obj.const_list:
+            if const.dtype is FUNCTION:
+                loads.update(self.loads(const.value.code_obj))
+        return loads
+
+    def eliminate_stores(self, targets):
+        changed = False
+        code = self.code
+        loads = self.loads(CodeObj(code, self.code_obj.const_list, self.code_obj.name_list))
+        for position, instruction in enumerate(code):
+            if instruction is None or instruction[0] != 'STORE_NAME':
+                continue
+            byte_name, arg = instruction
+            lexical_depth, index = index2tuple(arg)
+            if lexical_depth != self.lexical_depth:
+                continue
+            if not loads[index]:
+                code[position] = ('POP_TOP', None)
+            elif loads[index] == 1 and position + 1 < len(code) and code[position + 1] == ('LOAD_NAME', arg) \
+                    and position + 1 not in targets:
+                # the load right after the store is the only read of the variable
+                code[position] = code[position + 1] = None
+                loads[index] = 0
+            else:
+                continue
+            changed = True
+        return changed
+
+
+class Optimizer:
+    def __init__(self, level: int):
+        self.level = level
+        self.report = []  # type: [(str, int, int)] the name of each code object, its size before and after
+
+    def optimize(self, code_obj: CodeObj, name='<program>', lexical_depth=0):
+        """Optimize `code_obj` and the functions defined in it in place, and return it."""
+        size = len(code_obj.code)
+        if self.level > 0:
+            code_obj.code = CodeOptimizer(code_obj, lexical_depth, self.level).run()
+        self.report.append((name, size, len(code_obj.code)))
+        for index, const in enumerate(code_obj.const_list):
+            if const.dtype is FUNCTION:
+                self.optimize(const.value.code_obj, '{}/function{}'.format(name, index), const.value.lexical_depth)
+        return code_obj
+
+    def format_report(self):
+        lines = ['{:<40}{:>8}{:>8}{:>9}'.format('-O{}'.format(self.level), 'before', 'after', 'removed')]
+        for name, size, new_size in self.report:
+            lines.append('{:<40}{:>8}{:>8}{:>9}'.format(name, size, new_size, size - new_size))
+        total = sum(size for _, size, _ in self.report)
+        new_total = sum(new_size for _, _, new_size in self.report)
+        lines.append('{:<40}{:>8}{:>8}{:>9}'.format('total', total, new_total, total - new_total))
+        return '\n'.join(lines)
+
+
+def optimize(code_obj: CodeObj, level: int):
+    return Optimizer(level).optimize(code_obj)
@@ -0,0 +1,156 @@
+"""A profiler of the MiniScript functions, which the virtual machine runs when it is made with profile=True.
+
+Every function is identified by the name it is assigned to, the line it is defined on and the file of the
+program. For each function the profiler records the number of calls, the self time spent in its own code,
+and the cumulative time spent until it returns, including the functions it calls. The time of the builtins
+is part of the self time of their caller. A call in return position leaves its caller, so the caller does
+not appear as its parent.
+
+The results can be written in the format of the pstats module of Python, to read with pstats.Stats or
+tools like snakeviz, or as collapsed stacks, one line per stack with its self time in microseconds, which
+flamegraph.pl and speedscope read. The calls of a function by itself are folded into one frame of the stacks,
+so that deep recursion does not make stacks of thousands of frames.
+"""
+import marshal
+import time
+
+from value import *
+
+DEFAULT_REPORT_LINES = 20
+
+
+class FunctionStats:
+    __slots__ = ('calls', 'primitive_calls', 'self_time', 'cumulative_time', 'callers', 'active')
+
+    def __init__(self):
+        self.calls = 0
+        self.primitive_calls = 0  # the calls which are not made while the function is already running
+        self.self_time = 0.0
+        self.cumulative_time = 0.0
+        # the calls, the primitive calls, the self and the cumulative time by caller, in the order of pstats
+        self.callers = {}  # type: {CodeObj: [int, int, float, float]}
+        self.active = 0  # how many calls of the function are running
+
+
+class StackNode:
+    """A node of the tree of the call stacks."""
+    __slots__ = ('code_obj', 'children', 'self_time')
+
+    def __init__(self, code_obj):
+        self.code_obj = code_obj
+        self.children = {}  # type: {CodeObj: StackNode}
+        self.self_time = 0.0
+
+    def child(self, code_obj: CodeObj):
+        node = self.children.get(code_obj)
+        if node is None:
+            node = self.children[code_obj] = StackNode(code_obj)
+        return node
+
+
+class Entry:
+    """A running call."""
+    __slots__ = ('code_obj', 'start', 'child_time', 'node', 'caller')
+
+    def __init__(self, code_obj: CodeObj, start: float, node: StackNode, caller):
+        self.code_obj = code_obj
+        self.start = start
+        self.child_time = 0.0
+        self.node = node
+        self.caller = caller  # type: CodeObj
+
+
+class Profiler:
+    def __init__(self, file_name='<program>', clock=time.perf_counter):
+        self.file_name = file_name
+        self.clock = clock
+        self.stats = {}  # type: {CodeObj: FunctionStats}
+        self.root = StackNode(None)
+        self.entries = []  # type: [Entry] the running calls, the innermost last
+
+    def enter(self, code_obj: CodeObj):
+        caller = self.entries[-1] if self.entries else None
+        if caller is None:
+            node = self.root.child(code_obj)
+        elif caller.code_obj is code_obj:
+            node = caller.node  # a function which calls itself stays one frame of the stack
+        else:
+            node = caller.node.child(code_obj)
+        stats = self.stats.get(code_obj)
+        if stats is None:
+            stats = self.stats[code_obj] = FunctionStats()
+        stats.active += 1
+        self.entries.append(Entry(code_obj, self.clock(), node, caller.code_obj if caller else None))
+
+    def leave(self):
+        entry = self.entries.pop()
+        elapsed = self.clock() - entry.start
+        own_time = elapsed - entry.child_time
+        if self.entries:
+            self.entries[-1].child_time += elapsed
+        entry.node.self_time += own_time
+        stats = self.stats[entry.code_obj]
+        stats.active -= 1
+        stats.calls += 1
+        stats.self_time += own_time
+        primitive = stats.active == 0
+        if primitive:
+            # the time of a recursive call is already part of the outermost call
+            stats.primitive_calls += 1
+            stats.cumulative_time += elapsed
+        if entry.caller is not None:
+            caller_stats = stats.callers.setdefault(entry.caller, [0, 0, 0.0, 0.0])
+            caller_stats[0] += 1
+            caller_stats[1] += primitive
+            caller_stats[2] += own_time
+            caller_stats[3] += elapsed if primitive else 0.0
+
+    def leave_all(self):
+        """End the calls which are still running, when the program ends with an error."""
+        while self.entries:
+            self.leave()
+
+    def label(self, code_obj: CodeObj):
+        """The pstats key of a function: the file, the line and the name."""
+        return self.file_name, code_obj.line, code_obj.name
+
+    def format_report(self, lines=DEFAULT_REPORT_LINES):
+        """The `lines` functions with the largest cumulative time."""
+        report = ['{:>10}{:>12}{:>15}{:>16}  {}'.format('calls', 'self(ms)', 'self/call(us)', 'cumulative(ms)',
+                                                        'function')]
+        by_time = sorted(self.stats.items(), key=lambda item: -item[1].cumulative_time)
+        for code_obj, stats in by_time[:lines]:
+            calls = '{}/{}'.format(stats.calls, stats.primitive_calls) if stats.calls != stats.primitive_calls \
+                else str(stats.calls)
+            report.append('{:>10}{:>12.3f}{:>15.1f}{:>16.3f}  {}:{}({})'.format(
+                calls, stats.self_time * 1000, stats.self_time * 1e6 / stats.calls, stats.cumulative_time * 1000,
+                *self.label(code_obj)))
+        return '\n'.join(report)
+
+    def pstats_dict(self):
+        """The statistics in the form pstats.Stats loads from a file written by marshal."""
+        return {self.label(code_obj): (stats.primitive_calls, stats.calls, stats.self_time, stats.cumulative_time,
+                                       {self.label(caller): tuple(caller_stats)
+                                        for caller, caller_stats in stats.callers.items()})
+                for code_obj, stats in self.stats.items()}
+
+    def write_pstats(self, path: str):
+        with open(path, 'wb') as pstats_file:
+            marshal.dump(self.pstats_dict(), pstats_file)
+
+    def collapsed_stacks(self):
+        """The lines `outer;...;inner microseconds`, for every stack with self time."""
+        lines = []
+        pending = [(node, ()) for node in self.root.children.values()]
+        while pending:
+            node, names = pending.pop()
+            names += ('{}:{}'.format(node.code_obj.name, node.code_obj.line),)
+            microseconds = round(node.self_time * 1e6)
+            if microseconds:
+                lines.append('{} {}'.format(';'.join(names), microseconds))
+            pending.extend((child, names) for child in node.children.values())
+        return sorted(lines)
+
+    def write_collapsed(self, path: str):
+        with open(path, 'w') as collapsed_file:
+            collapsed_file.writelines(line + '\n' for line in self.collapsed_stacks())
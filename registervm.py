@@ -0,0 +1,613 @@
+"""A virtual machine of register code, which runs the programs with --engine register.
+
+The stack machines in vm.py and nativevm.py move every operand through the stack of the frame, x = x + 1 is
+LOAD_NAME, LOAD_CONST, BINARY_ADD and STORE_NAME. This machine translates the code of a code object into
+three-address instructions over the registers of the frame instead, like BINARY x, x, k, add, so it
+dispatches far fewer instructions. The registers of a frame are its slots: the variables come first, so the
+functions made in it find them where they always are, then the constants and the builtins the code loads,
+which are copied in when the frame is made, then the temporaries, which take the place of the stack.
+
+The translation keeps track of the register of every value on the stack, so loading a variable or a
+constant emits nothing, the result of an instruction goes right to the variable a STORE_NAME after it
+assigns, and a comparison fuses with the jump after it. A variable is checked for being assigned only
+where it may not be yet, and a break jumps to the end of its loop, so the loops need no blocks. The code
+is translated from the stack code rather than from the syntax tree, so the code cache and the optimizer
+serve this machine too. The values are boxed and the operators are those of vm.py, so the errors are the
+same.
+
+The machine does not memoize, instrument, profile or transpile.
+"""
+import msbuiltins
+from bytecode import HAVE_LABEL, OPMAP, REGISTER_JUMPS, REGISTER_OPMAP, REGISTER_OPNAMES, index2tuple
+from vm import DEFAULT_MAX_CALL_DEPTH, VirtualMachine, VirtualMachineError
+from value import *
+
+# How many values each instruction pops and pushes, the others are worked out from their argument
+STACK_EFFECTS = {'POP_TOP': -1, 'DUP_TOP': 1, 'LOAD_CONST': 1, 'LOAD_NAME': 1, 'LOAD_BUILTIN': 1, 'STORE_NAME': -1,
+                 'STORE_SUBSCR': -3, 'COMPARE_OP': -1, 'BUILD_ARRAY': 0, 'JUMP_ABSOLUTE': 0, 'POP_JUMP_IF_TRUE': -1,
+                 'POP_JUMP_IF_FALSE': -1, 'SETUP_LOOP': 0, 'BREAK_LOOP': 0, 'POP_BLOCK': 0, 'MAKE_FUNCTION': 1,
+                 'RETURN_VALUE': -1, 'PRINT_EXPR': -1}
+
+
+def stack_effect(byte_name: str, arg):
+    if byte_name in STACK_EFFECTS:
+        return STACK_EFFECTS[byte_name]
+    if byte_name == 'BUILD_LIST':
+        return 1 - arg
+    if byte_name == 'BUILD_MAP':
+        return 1 - 2 * arg
+    if byte_name in ('CALL_FUNCTION', 'TAIL_CALL_FUNCTION'):
+        return -arg
+    if byte_name.startswith('UNARY_'):
+        return 0
+    if byte_name.startswith('BINARY_'):
+        return -1
+    raise VirtualMachineError('unsupported bytecode type: {}'.format(byte_name))
+
+
+class RegisterCode:
+    """The register code of a code object, and the values its registers after the variables start with."""
+    __slots__ = ('instructions', 'padding')
+
+    def __init__(self, instructions: list, padding: tuple):
+        self.instructions = instructions  # type: [(int, tuple)] the opcodes and the operands
+        self.padding = padding  # the constants and the builtins, then None for every temporary
+
+
+class RegisterFrame:
+    __slots__ = ('code_obj', 'slots', 'scopes', 'prev_frame', 'last_instruction', 'return_register')
+
+    def __init__(self, code_obj: CodeObj, slots: [Value], prev_frame, scopes: tuple):
+        self.code_obj = code_obj
+        self.slots = slots  # type: [Value] the registers, the local variables first
+        self.scopes = scopes  # type: ([Value]) the slots of the enclosing functions and these slots, by lexical depth
+        self.prev_frame = prev_frame
+        self.last_instruction = 0
+        self.return_register = None  # where the return value of the call the frame waits for goes
+
+
+class RegisterCompiler:
+    """Translates the stack code of one code object into register code."""
+
+    def __init__(self, virtual_machine, code_obj: CodeObj, arity=0):
+        self.virtual_machine = virtual_machine
+        self.code_obj = code_obj
+        self.code = code_obj.code
+        self.arity = arity
+        self.lexical_depth = len(code_obj.scope_names) - 1
+        self.leaders = {arg for byte_name, arg in self.code if byte_name in HAVE_LABEL}
+        # the functions made here may assign the variables while a call runs
+        self.makes_functions = any(byte_name == 'MAKE_FUNCTION' for byte_name, _ in self.code)
+        self.constants = list(code_obj.const_list)  # the values of the registers after the variables
+        self.builtins = {}  # type: {str: int} the register of every builtin the code loads
+        for byte_name, arg in self.code:
+            if byte_name == 'LOAD_BUILTIN' and arg not in self.builtins:
+                self.builtins[arg] = len(code_obj.name_list) + len(self.constants)
+                self.constants.append(msbuiltins.BUILTINS[arg])
+        self.temporary_base = len(code_obj.name_list) + len(self.constants)
+        self.temporary_count = 0
+        self.instructions = []  # type: [list] the names and the operands, the jump targets are positions of the code
+        self.positions = {}  # type: {int: int} where the instructions of every position of the code begin
+        # the state of the translation
+        self.stack = []  # type: [int] the register of every value on the stack
+        self.position = 0
+        self.blocks = ()  # type: ((int, int)) the handler and the stack height of every loop
+        self.assigned = frozenset()  # the variables which are known to be assigned
+
+    # The analysis
+
+    def successors(self, position: int, state: tuple):
+        """The positions the instruction at `position` goes on at, with the state at each. A state is the
+        stack height, the loops and the assigned variables."""
+        byte_name, arg = self.code[position]
+        height, blocks, assigned = state
+        height += stack_effect(byte_name, arg)
+        if height < 0:
+            raise VirtualMachineError('the stack is empty at {} of {}'.format(position, self.code_obj.name))
+        if byte_name in ('LOAD_NAME', 'STORE_NAME'):
+            # a variable which is loaded without an error is assigned as well
+            depth, index = index2tuple(arg)
+            if depth == self.lexical_depth:
+                assigned = assigned | {index}
+        elif byte_name == 'SETUP_LOOP':
+            blocks += ((arg, height),)
+        elif byte_name == 'POP_BLOCK':
+            blocks = blocks[:-1]
+        if byte_name == 'RETURN_VALUE':
+            return []
+        if byte_name == 'JUMP_ABSOLUTE':
+            return [(arg, (height, blocks, assigned))]
+        if byte_name == 'BREAK_LOOP':
+            handler, block_height = blocks[-1]
+            return [(handler, (block_height, blocks[:-1], assigned))]
+        targets = [(position + 1, (height, blocks, assigned))]
+        if byte_name in ('POP_JUMP_IF_TRUE', 'POP_JUMP_IF_FALSE'):
+            targets.append((arg, (height, blocks, assigned)))
+        return targets
+
+    def analyze(self):
+        """The state before every reachable instruction."""
+        states = {0: (0, (), frozenset(range(self.arity)))}
+        pending = [0]
+        while pending:
+            position = pending.pop()
+            for target, (height, blocks, assigned) in self.successors(position, states[position]):
+                if target >= len(self.code):
+                    continue  # the code runs past its end, which raises like in the stack machine
+                old_state = states.get(target)
+                if old_state is None:
+                    states[target] = (height, blocks, assigned)
+                    pending.append(target)
+                elif old_state[:2] != (height, blocks):
+                    raise VirtualMachineError('the stack differs between the jumps to {} of {}'
+                                              .format(target, self.code_obj.name))
+                elif not old_state[2] <= assigned:
+                    states[target] = (height, blocks, old_state[2] & assigned)
+                    pending.append(target)
+        return states
+
+    # The translation
+
+    def compile(self):
+        states = self.analyze()
+        falls_through = False
+        position = 0
+        while position < len(self.code):
+            state = states.get(position)
+            if state is None:  # unreachable
+                falls_through = False
+                position += 1
+                continue
+            if position in self.leaders or not falls_through:
+                if falls_through:
+                    self.flush()
+                self.stack = [self.temporary(depth) for depth in range(state[0])]
+            self.positions[position] = len(self.instructions)
+            self.position = position
+            _, self.blocks, self.assigned = state
+            byte_name, arg = self.code[position]
+            handler = getattr(self, 'translate_' + byte_name, None)
+            if handler is None and byte_name.startswith('UNARY_'):
+                handler = self.translate_unary
+            elif handler is None and byte_name.startswith('BINARY_'):
+                handler = self.translate_binary
+            elif handler is None:
+                raise VirtualMachineError('unsupported bytecode type: {}'.format(byte_name))
+            next_position = handler(arg)
+            falls_through = next_position is not None
+            position = next_position if falls_through else position + 1
+        self.positions[len(self.code)] = len(self.instructions)
+        instructions = []
+        for name, *operands in self.instructions:
+            if name in REGISTER_JUMPS:
+                operands[-1] = self.positions[operands[-1]]
+            instructions.append((REGISTER_OPMAP[name], tuple(operands)))
+        return RegisterCode(instructions, tuple(self.constants) + (None,) * self.temporary_count)
+
+    def emit(self, name: str, *operands):
+        self.instructions.append([name] + list(operands))
+
+    def temporary(self, depth: int):
+        """The register of the value at `depth` of the stack, where it is kept across jumps."""
+        self.temporary_count = max(self.temporary_count, depth + 1)
+        return self.temporary_base + depth
+
+    def push_target(self):
+        """The register of the value pushed next."""
+        return self.temporary(len(self.stack))
+
+    def pop(self):
+        return self.stack.pop()
+
+    def popn(self, n: int):
+        registers = self.stack[len(self.stack) - n:]
+        del self.stack[len(self.stack) - n:]
+        return registers
+
+    def flush(self, height=None):
+        """Move the values on the stack up to `height` to their temporaries, before a jump."""
+        stack = self.stack if height is None else self.stack[:height]
+        for depth, register in enumerate(stack):
+            if register != self.temporary(depth):
+                self.emit('MOVE', self.temporary(depth), register)
+                self.stack[depth] = self.temporary(depth)
+
+    def protect(self, index: int):
+        """Move the values on the stack which are in the variable `index` to their temporaries, before it is
+        assigned."""
+        for depth, register in enumerate(self.stack):
+            if register == index:
+                self.emit('MOVE', self.temporary(depth), index)
+                self.stack[depth] = self.temporary(depth)
+
+    def protect_variables(self):
+        """Move the values on the stack which are in variables to their temporaries, before a call which may
+        assign the variables."""
+        for depth, register in enumerate(self.stack):
+            if register < len(self.code_obj.name_list):
+                self.emit('MOVE', self.temporary(depth), register)
+                self.stack[depth] = self.temporary(depth)
+
+    def next_instruction(self):
+        """The instruction after the current one if no jump lands on it, or (None, None)."""
+        position = self.position + 1
+        if position < len(self.code) and position not in self.leaders:
+            return self.code[position]
+        return None, None
+
+    def result_target(self):
+        """Where the result of an instruction goes: the variable a STORE_NAME right after it assigns, or
+        the temporary. Returns the register and the position to go on at."""
+        byte_name, arg = self.next_instruction()
+        if byte_name == 'STORE_NAME':
+            depth, index = index2tuple(arg)
+            if depth == self.lexical_depth:
+                self.protect(index)
+                return index, self.position + 2
+        return self.push_target(), self.position + 1
+
+    def result(self, register: int, next_position: int):
+        """Push the result unless it went to a variable."""
+        if next_position == self.position + 1:
+            self.stack.append(register)
+        return next_position
+
+    # The instructions, each returns the position to go on at, or None when it does not go on at the next
+
+    def translate_POP_TOP(self, _):
+        self.pop()
+        return self.position + 1
+
+    def translate_DUP_TOP(self, _):
+        self.stack.append(self.stack[-1])
+        return self.position + 1
+
+    def translate_LOAD_CONST(self, index):
+        self.stack.append(len(self.code_obj.name_list) + index)
+        return self.position + 1
+
+    def translate_LOAD_BUILTIN(self, name):
+        self.stack.append(self.builtins[name])
+        return self.position + 1
+
+    def translate_LOAD_NAME(self, arg):
+        depth, index = index2tuple(arg)
+        if depth == self.lexical_depth:
+            if index not in self.assigned:
+                self.emit('CHECK', index, self.code_obj.name_list[index])
+            self.stack.append(index)
+        else:
+            self.emit('LOAD_OUTER', self.push_target(), depth, index)
+            self.stack.append(self.push_target())
+        return self.position + 1
+
+    def translate_STORE_NAME(self, arg):
+        depth, index = index2tuple(arg)
+        source = self.pop()
+        if depth != self.lexical_depth:
+            self.emit('STORE_OUTER', depth, index, source)
+        elif source != index:
+            self.protect(index)
+            self.emit('MOVE', index, source)
+        return self.position + 1
+
+    def translate_MAKE_FUNCTION(self, index):
+        self.emit('MAKE_FUNCTION', self.push_target(), self.code_obj.const_list[index])
+        self.stack.append(self.push_target())
+        return self.position + 1
+
+    def translate_unary(self, _):
+        operator_function = self.virtual_machine.UNARY_OPERATORS[self.code[self.position][0][6:]]
+        source = self.pop()
+        target, next_position = self.result_target()
+        self.emit('UNARY', target, source, operator_function)
+        return self.result(target, next_position)
+
+    def translate_binary(self, _):
+        name = self.code[self.position][0][7:]
+        if name not in self.virtual_machine.BINARY_OPERATORS:
+            raise VirtualMachineError('unsupported bytecode type: BINARY_{}'.format(name))
+        x, y = self.popn(2)
+        target, next_position = self.result_target()
+        if name == 'SUBSCR':
+            cache = PropertyCache(self.virtual_machine.PROTOTYPE_KEY, self.virtual_machine.BINARY_OPERATORS['SUBSCR'])
+            self.emit('SUBSCR', target, x, y, cache)
+        else:
+            self.emit('BINARY', target, x, y, self.virtual_machine.BINARY_OPERATORS[name])
+        return self.result(target, next_position)
+
+    def translate_STORE_SUBSCR(self, _):
+        value, obj, key = self.popn(3)
+        cache = PropertyCache(self.virtual_machine.PROTOTYPE_KEY, self.virtual_machine.STORE_SUBSCR_OPERATOR)
+        self.emit('STORE_SUBSCR', obj, key, value, cache)
+        return self.position + 1
+
+    def translate_COMPARE_OP(self, index):
+        compare = self.virtual_machine.COMPARE_OPERATORS[index]
+        x, y = self.popn(2)
+        byte_name, jump = self.next_instruction()
+        if byte_name in ('POP_JUMP_IF_FALSE', 'POP_JUMP_IF_TRUE'):
+            self.flush()
+            self.emit('COMPARE_' + byte_name[4:], x, y, compare, jump)
+            return self.position + 2
+        target, next_position = self.result_target()
+        self.emit('COMPARE', target, x, y, compare)
+        return self.result(target, next_position)
+
+    def translate_BUILD_LIST(self, count):
+        elements = tuple(self.popn(count))
+        self.emit('BUILD_LIST', self.push_target(), elements)
+        self.stack.append(self.push_target())
+        return self.position + 1
+
+    def translate_BUILD_MAP(self, count):
+        elements = tuple(self.popn(2 * count))
+        self.emit('BUILD_MAP', self.push_target(), elements)
+        self.stack.append(self.push_target())
+        return self.position + 1
+
+    def translate_BUILD_ARRAY(self, type_name):
+        source = self.pop()
+        self.emit('BUILD_ARRAY', self.push_target(), source, type_tag(type_name))
+        self.stack.append(self.push_target())
+        return self.position + 1
+
+    def translate_JUMP_ABSOLUTE(self, target):
+        self.flush()
+        self.emit('JUMP', target)
+        return None
+
+    def translate_POP_JUMP_IF_FALSE(self, target):
+        condition = self.pop()
+        self.flush()
+        self.emit('JUMP_IF_FALSE', condition, target)
+        return self.position + 1
+
+    def translate_POP_JUMP_IF_TRUE(self, target):
+        condition = self.pop()
+        self.flush()
+        self.emit('JUMP_IF_TRUE', condition, target)
+        return self.position + 1
+
+    def translate_SETUP_LOOP(self, _):
+        return self.position + 1
+
+    def translate_POP_BLOCK(self, _):
+        return self.position + 1
+
+    def translate_BREAK_LOOP(self, _):
+        handler, height = self.blocks[-1]
+        self.flush(height)
+        self.emit('JUMP', handler)
+        return None
+
+    def translate_CALL_FUNCTION(self, count):
+        func = self.pop()
+        arguments = tuple(self.popn(count))
+        if self.makes_functions:
+            self.protect_variables()
+        target, next_position = self.result_target()
+        self.emit('CALL', target, func, arguments)
+        return self.result(target, next_position)
+
+    def translate_TAIL_CALL_FUNCTION(self, count):
+        """A builtin puts its result in the temporary, for the RETURN_VALUE after this."""
+        func = self.pop()
+        arguments = tuple(self.popn(count))
+        self.emit('TAIL_CALL', self.push_target(), func, arguments)
+        self.stack.append(self.push_target())
+        return self.position + 1
+
+    def translate_RETURN_VALUE(self, _):
+        self.emit('RETURN', self.pop())
+        return None
+
+    def translate_PRINT_EXPR(self, _):
+        self.emit('PRINT', self.pop())
+        return self.position + 1
+
+
+class RegisterVirtualMachine(VirtualMachine):
+    engine = 'register'
+
+    def __init__(self, superinstructions=True, max_call_depth=DEFAULT_MAX_CALL_DEPTH, memoize=False,
+                 instrument=False, profile=False, jit=False, **options):
+        """The register code needs no superinstructions, and it is never transpiled, so `superinstructions`
+        and `jit` are ignored."""
+        if memoize or instrument or profile:
+            raise VirtualMachineError('the register engine does not memoize, instrument or profile')
+        super().__init__(superinstructions, max_call_depth, **options)
+
+    def make_handlers(self):
+        return [getattr(self, 'register_' + name) for name in REGISTER_OPNAMES]
+
+    def decode(self, code_obj: CodeObj, enclosing_names=(), arity=0):
+        """Translate `code_obj` and all the functions defined in it into register code."""
+        for byte_name, _ in code_obj.code:
+            if byte_name not in OPMAP:
+                raise VirtualMachineError('unsupported bytecode type: %s' % byte_name)
+        code_obj.scope_names = enclosing_names + (code_obj.name_list,)
+        code_obj.decoded[self.decode_key] = RegisterCompiler(self, code_obj, arity).compile()
+        for const_item in code_obj.const_list:
+            if const_item.dtype is FUNCTION:
+                self.decode(const_item.value.code_obj, code_obj.scope_names, const_item.value.arity)
+
+    def make_frame(self, code, arguments=()):
+        slots = [None] * len(code.name_list)
+        slots[:len(arguments)] = arguments
+        slots.extend(code.decoded[self.decode_key].padding)
+        return RegisterFrame(code, slots, self.current_frame, (slots,))
+
+    def bind_arguments(self, func: Function, arguments: []):
+        """Check the arguments of a call and make them the registers of the callee."""
+        self.check_arity(func, arguments)
+        self.check_arguments(func, arguments)
+        arguments.extend(func.local_padding)
+        arguments.extend(func.code_obj.decoded[self.decode_key].padding)
+        return arguments
+
+    def enter_function(self, func: Function, arguments: []):
+        registers = self.bind_arguments(func, arguments)
+        return RegisterFrame(func.code_obj, registers, self.current_frame, func.scopes + (registers,))
+
+    def run_frame(self, frame):
+        """Run a frame until it returns. An instruction returns the position to jump to, or 'call' when it
+        made a frame or reused this one for a tail call, or 'return'."""
+        self.push_frame(frame)
+        base_frame = frame
+        code = frame.code_obj.decoded[self.decode_key].instructions
+        registers = frame.slots
+        handlers = self.handlers
+        position = frame.last_instruction
+        while True:
+            opcode, operands = code[position]
+            position += 1
+            result = handlers[opcode](registers, operands)
+            if result is None:
+                continue
+            if result.__class__ is int:
+                position = result
+                continue
+            if result == 'call':
+                if self.current_frame is not frame:
+                    frame.last_instruction = position
+                    frame = self.current_frame
+            else:
+                self.pop_frame()
+                if frame is base_frame:
+                    return self.return_value
+                frame = self.current_frame
+                frame.slots[frame.return_register] = self.return_value
+            code = frame.code_obj.decoded[self.decode_key].instructions
+            registers = frame.slots
+            position = frame.last_instruction
+
+    # The instructions
+
+    def register_MOVE(self, registers, operands):
+        target, source = operands
+        registers[target] = registers[source]
+
+    def register_CHECK(self, registers, operands):
+        register, name = operands
+        if registers[register] is None:
+            raise self.unassigned_error(name)
+
+    def register_LOAD_OUTER(self, registers, operands):
+        target, lexical_depth, index = operands
+        value = self.current_frame.scopes[lexical_depth][index]
+        if value is None:
+            raise self.unassigned(lexical_depth, index)
+        registers[target] = value
+
+    def register_STORE_OUTER(self, registers, operands):
+        lexical_depth, index, source = operands
+        self.current_frame.scopes[lexical_depth][index] = registers[source]
+
+    def register_MAKE_FUNCTION(self, registers, operands):
+        target, const = operands
+        registers[target] = Value(FUNCTION, const.value.bind_scopes(self.current_frame.scopes))
+
+    def register_UNARY(self, registers, operands):
+        target, source, op = operands
+        registers[target] = op(registers[source])
+
+    def register_BINARY(self, registers, operands):
+        target, x, y, op = operands
+        registers[target] = op(registers[x], registers[y])
+
+    def register_SUBSCR(self, registers, operands):
+        target, obj_register, key_register, cache = operands
+        obj, key = registers[obj_register], registers[key_register]
+        if key.dtype is INT and obj.dtype is TABLE:
+            array = obj.value.array
+            if 0 <= key.value < len(array):
+                registers[target] = array[key.value]
+                return
+        registers[target] = cache.load(obj, key)
+
+    def register_STORE_SUBSCR(self, registers, operands):
+        obj_register, key_register, source, cache = operands
+        obj, key = registers[obj_register], registers[key_register]
+        if key.dtype is INT and obj.dtype is TABLE:
+            array = obj.value.array
+            if 0 <= key.value < len(array):
+                array[key.value] = registers[source]
+                return
+        cache.store(obj, key, registers[source])
+
+    def register_COMPARE(self, registers, operands):
+        target, x, y, compare = operands
+        registers[target] = compare(registers[x], registers[y])
+
+    def register_BUILD_LIST(self, registers, operands):
+        target, elements = operands
+        registers[target] = Value(TABLE, Table([registers[element] for element in elements]))
+
+    def register_BUILD_MAP(self, registers, operands):
+        target, elements = operands
+        table = Table()
+        for i in range(0, len(elements), 2):
+            table[registers[elements[i]]] = registers[elements[i + 1]]
+        registers[target] = Value(TABLE, table)
+
+    def register_BUILD_ARRAY(self, registers, operands):
+        target, source, dtype = operands
+        registers[target] = make_array(dtype, registers[source])
+
+    def register_JUMP(self, registers, operands):
+        return operands[0]
+
+    def register_JUMP_IF_FALSE(self, registers, operands):
+        condition, jump = operands
+        if not registers[condition]:
+            return jump
+
+    def register_JUMP_IF_TRUE(self, registers, operands):
+        condition, jump = operands
+        if registers[condition]:
+            return jump
+
+    def register_COMPARE_JUMP_IF_FALSE(self, registers, operands):
+        x, y, compare, jump = operands
+        if not compare(registers[x], registers[y]):
+            return jump
+
+    def register_COMPARE_JUMP_IF_TRUE(self, registers, operands):
+        x, y, compare, jump = operands
+        if compare(registers[x], registers[y]):
+            return jump
+
+    def register_CALL(self, registers, operands):
+        target, func_register, argument_registers = operands
+        func = registers[func_register].value
+        arguments = [registers[register] for register in argument_registers]
+        if type(func) is NativeFunction:
+            registers[target] = func.call(self, arguments)
+            return
+        self.current_frame.return_register = target
+        self.push_frame(self.enter_function(func, arguments))
+        return 'call'
+
+    def register_TAIL_CALL(self, registers, operands):
+        """Call a function in the frame of the caller, like byte_TAIL_CALL_FUNCTION. A builtin puts its
+        result in the register `target`, which the RETURN after this returns."""
+        target, func_register, argument_registers = operands
+        frame = self.current_frame
+        func = registers[func_register].value
+        arguments = [registers[register] for register in argument_registers]
+        if type(func) is NativeFunction:
+            registers[target] = func.call(self, arguments)
+            return
+        frame.slots = self.bind_arguments(func, arguments)
+        frame.code_obj = func.code_obj
+        frame.scopes = func.scopes + (frame.slots,)
+        frame.last_instruction = 0
+        return 'call'
+
+    def register_RETURN(self, registers, operands):
+        self.return_value = registers[operands[0]]
+        return 'return'
+
+    def register_PRINT(self, registers, operands):
+        print(registers[operands[0]])
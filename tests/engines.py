@@ -0,0 +1,72 @@
+"""Run MiniScript programs on every engine, to compare what they print and the errors they raise.
+
+A mode is an engine and how it runs the code: interpreted, with every function and loop transpiled at once,
+or compiled ahead of time to a Python module. The output of a program is what it prints followed by the
+error which stopped it, as 'TypeError: message', so two modes agree when they print and raise the same.
+"""
+import contextlib
+import io
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aot
+import miniscript
+
+MODES = {
+    'boxed': dict(engine='boxed'),
+    'native': dict(engine='native'),
+    'register': dict(engine='register'),
+    'boxed jit': dict(engine='boxed', jit=True),
+    'native jit': dict(engine='native', jit=True),
+    'boxed aot': dict(engine='boxed', aot=True),
+    'native aot': dict(engine='native', aot=True),
+}
+
+
+def run(program: str, engine='boxed', jit=False, aot_compile=False, optimize_level=0, **options):
+    """The output of `program` on `engine`. With `jit`, every function is transpiled at its first call and
+    every loop at its first iteration, `options` are passed to the machine."""
+    code_obj = miniscript.compile_program(program, optimize_level=optimize_level)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            if aot_compile:
+                namespace = {'__name__': 'miniscript_program'}
+                exec(aot.compile_module(code_obj, miniscript.ENGINES[engine], 'program.ms'), namespace)
+                namespace['run']()
+            else:
+                machine = miniscript.ENGINES[engine](jit=jit, jit_calls=1, jit_loops=1, **options)
+                machine.run_code(code_obj)
+        except Exception as error:
+            print('{}: {}'.format(type(error).__name__, error))
+    return output.getvalue()
+
+
+def run_modes(program: str, modes=MODES, **options):
+    """The output of `program` in every mode of `modes`, by the name of the mode."""
+    outputs = {}
+    for name in modes:
+        mode = dict(MODES[name])
+        outputs[name] = run(program, mode.pop('engine'), aot_compile=mode.pop('aot', False), **dict(mode, **options))
+    return outputs
+
+
+def program_file(name: str):
+    with open(os.path.join(ROOT, name)) as program:
+        return program.read()
+
+
+class EngineTestMixin:
+    """Assertions for a unittest.TestCase which runs programs in every mode."""
+    def assertSameOutput(self, program: str, expected=None, modes=MODES, **options):
+        """Assert that `program` has the same output in every mode, and that it is `expected` if given."""
+        outputs = run_modes(program, modes, **options)
+        reference = outputs['boxed'] if 'boxed' in outputs else next(iter(outputs.values()))
+        for name, output in outputs.items():
+            self.assertEqual(output, reference, 'the output in mode {!r} differs'.format(name))
+        if expected is not None:
+            self.assertEqual(reference, expected)
+        return reference
@@ -0,0 +1,25 @@
+"""The example and bench programs in every mode."""
+import glob
+import os
+import unittest
+
+from engines import ROOT, EngineTestMixin, program_file
+
+
+class ProgramTest(EngineTestMixin, unittest.TestCase):
+    def test_programs(self):
+        for path in sorted(glob.glob(os.path.join(ROOT, 'example', '*.ms')) +
+                           glob.glob(os.path.join(ROOT, 'bench', '*.ms'))):
+            name = os.path.relpath(path, ROOT)
+            with self.subTest(name):
+                self.assertSameOutput(program_file(name))
+
+    def test_optimized_programs(self):
+        for name in ('example/closure.ms', 'example/student.ms', 'bench/loops.ms'):
+            with self.subTest(name):
+                self.assertEqual(self.assertSameOutput(program_file(name), optimize_level=2),
+                                 self.assertSameOutput(program_file(name)))
+
+
+if __name__ == '__main__':
+    unittest.main()
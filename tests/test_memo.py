@@ -0,0 +1,73 @@
+"""Memoized calls return and raise what the calls do without memoization."""
+import unittest
+
+from engines import EngineTestMixin, run
+
+MEMOIZING_MODES = ('boxed', 'native')
+
+
+class MemoizeTest(EngineTestMixin, unittest.TestCase):
+    def assertSameMemoized(self, program: str, expected=None):
+        output = self.assertSameOutput(program, expected)
+        for engine in MEMOIZING_MODES:
+            self.assertEqual(run(program, engine, memoize=True), output, 'the output of {} differs'.format(engine))
+
+    def test_arguments_of_another_type(self):
+        self.assertSameMemoized('''f = function(n: int) {
+    return n + 1
+}
+print f(1)
+print f(1 == 1)
+return 0
+''', "('int', 2)\nTypeError: the parameter n is type int, but the argument is ('bool', True)\n")
+
+    def test_int_and_real_arguments(self):
+        self.assertSameMemoized('''f = function(x: real) {
+    return x * 2.0
+}
+g = function(x: int) {
+    return x * 2
+}
+print f(1.0)
+print g(1)
+print f(1)
+return 0
+''')
+
+    def test_recursion(self):
+        self.assertSameMemoized('''fibo = function(n: int) {
+    if (n < 2) {
+        return n
+    }
+    return fibo(n - 1) + fibo(n - 2)
+}
+print fibo(20)
+return 0
+''', "('int', 6765)\n")
+
+    def test_impure_callee(self):
+        self.assertSameMemoized('''count = 0
+bump = function() {
+    count = count + 1
+    return count
+}
+apply = function(f: function, x: int) {
+    return f() + x
+}
+print apply(bump, 1)
+print apply(bump, 1)
+return 0
+''', "('int', 2)\n('int', 3)\n")
+
+    def test_table_arguments(self):
+        self.assertSameMemoized('''first = function(t: table) {
+    return t[0]
+}
+print first([1])
+print first([2])
+return 0
+''', "('int', 1)\n('int', 2)\n")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""The unboxed values of the native engine behave like the Values of the boxed engine."""
+import unittest
+
+from engines import EngineTestMixin
+
+
+class NativeValueTest(EngineTestMixin, unittest.TestCase):
+    def test_table_keys_keep_their_type(self):
+        self.assertSameOutput('''t = {}
+t[1] = "int"
+t[1.0] = "real"
+t[1 == 1] = "bool"
+t["1"] = "str"
+print len(t)
+print t[1]
+print t[1.0]
+print t[1 == 1]
+return 0
+''', "('int', 4)\n('str', 'int')\n('str', 'real')\n('str', 'bool')\n")
+
+    def test_table_equality_compares_types(self):
+        self.assertSameOutput('''print [1] == [1 == 1]
+print {"x": 1} == {"x": 1.0}
+print [1, 2] == [1, {}]
+print [[1], {"a": "b"}] == [[1], {"a": "b"}]
+print [1, 2] != [1, 2, 3]
+return 0
+''', "('bool', False)\n('bool', False)\n('bool', False)\n('bool', True)\n('bool', True)\n")
+
+    def test_table_equality_in_transpiled_code(self):
+        self.assertSameOutput('''same = function(a: table, b: table) {
+    return a == b
+}
+n = 0
+i = 0
+while (i < 10) {
+    if (same([1, "a"], [1, "a"])) {
+        n = n + 1
+    }
+    if (same([1], [1 == 1])) {
+        n = n + 100
+    }
+    i = i + 1
+}
+print n
+return 0
+''', "('int', 10)\n")
+
+    def test_operators(self):
+        self.assertSameOutput('''print "a" + "b"
+print "a" == "a"
+print 1 == 1.0
+print 2.5 * 2.0
+print -(3)
+print 7 / 2
+return 0
+''', "('str', 'ab')\n('bool', True)\n('bool', False)\n('real', 5.0)\n('int', -3)\n('int', 3)\n")
+
+    def test_type_errors(self):
+        for program in ('print 1 + 1.0\nreturn 0\n', 'print 1 < "a"\nreturn 0\n', 'x = 5\nprint x[0]\nreturn 0\n',
+                        't = {}\nprint t["a"]\nreturn 0\n'):
+            with self.subTest(program):
+                self.assertRegex(self.assertSameOutput(program), '^(TypeError|KeyError): ')
+
+
+if __name__ == '__main__':
+    unittest.main()
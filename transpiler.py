@@ -0,0 +1,734 @@
+"""Transpiles hot MiniScript code to Python functions, which the virtual machine does when it is made with
+jit=True.
+
+The machine counts the calls of every function and the iterations of the loops of every code object. When
+a function has been called `call_threshold` times, its code is translated into the source of a Python
+function and compiled, and the later calls run that function instead of the instructions. When a loop has
+run `loop_threshold` iterations, its code object is transpiled as well, and the frame running the loop
+continues in the Python function from the start of the loop.
+
+The stack of the instructions becomes the Python variables s0, s1, ..., and the variables of a function
+which makes no functions become Python variables too, the others stay in the slots of the scopes. The jump
+targets split the code into regions, which a loop over the position `pc` selects. The operators are those
+of the machine, so the type checks and the errors stay the same, with fast paths inlined for numbers.
+
+A transpiled function calls through the machine, and its calls nest Python calls, so the calls deeper than
+`max_nesting` transpiled calls are interpreted again. Code which can not be transpiled, like code which can
+run past its end, stays interpreted. With `dump_dir`, the source of every transpiled code object is
+written there.
+"""
+import collections
+import linecache
+import math
+import os
+import re
+
+import msbuiltins
+from bytecode import HAVE_LABEL, index2tuple
+from value import *
+
+DEFAULT_CALL_THRESHOLD = 100
+DEFAULT_LOOP_THRESHOLD = 1000
+DEFAULT_MAX_NESTING = 100
+
+MISSING = object()
+
+ARITHMETIC_OPERATORS = {'ADD': '+', 'SUBTRACT': '-', 'MULTIPLY': '*', 'DIVIDE': '/', 'TRUE_DIVIDE': '/'}
+# The types the fast path of an operator handles
+ARITHMETIC_TYPES = {'ADD': (INT, REAL, STR), 'SUBTRACT': (INT, REAL), 'MULTIPLY': (INT, REAL),
+                    'DIVIDE': (INT, REAL), 'TRUE_DIVIDE': (INT, REAL)}
+COMPARE_OPERATORS = ['<', '<=', '==', '!=', '>', '>=']
+ORDERING_TYPES = (INT, REAL, STR, BOOL)
+
+
+class TranspileError(Exception):
+    pass
+
+
+class Entry:
+    """A value on the stack of the code being transpiled, a Python expression without effects: a temporary,
+    a variable or a constant."""
+    __slots__ = ('expression', 'dtype', 'raw', 'local', 'is_bool')
+
+    def __init__(self, expression: str, dtype=None, raw=None, local=None, is_bool=False):
+        self.expression = expression
+        self.dtype = dtype  # the type tag when it is known, for constants
+        self.raw = raw  # a literal of the Python object in the value, for constants
+        self.local = local  # the index of the variable when the expression is the Python variable of it
+        self.is_bool = is_bool  # whether the value is known to be a bool
+
+
+def identifier(name: str):
+    return re.sub(r'\W', '_', name)
+
+
+class Transpiler:
+    """Translates one code object into the source of a Python function for the boxed machine. The function
+    takes the slots of the frame, the scopes and the position to start at."""
+
+    def __init__(self, virtual_machine, jit, code_obj: CodeObj, arity=None):
+        self.virtual_machine = virtual_machine
+        self.code_obj = code_obj
+        self.code = code_obj.code
+        self.arity = arity  # None for the code of the program
+        self.lexical_depth = len(code_obj.scope_names) - 1
+        # the variables stay in the slots when the functions made here may read or assign them
+        self.in_slots = any(byte_name == 'MAKE_FUNCTION' for byte_name, _ in self.code)
+        self.leaders = {0} | {arg for byte_name, arg in self.code if byte_name in HAVE_LABEL}
+        self.namespace = {'call': jit.call, 'tail_call': jit.tail_call, 'unassigned': jit.unassigned,
+                          'code_obj': code_obj}
+        self.outer_depths = sorted({index2tuple(arg)[0] for byte_name, arg in self.code
+                                    if byte_name in ('LOAD_NAME', 'STORE_NAME')} - {self.lexical_depth})
+        self.self_tail_call = False
+        # the state of the walk through a region
+        self.lines = []
+        self.indent = 0
+        self.stack = []  # type: [Entry]
+        self.blocks = ()  # type: ((int, int)) the handler and the stack height of every loop
+        self.assigned = set()  # the slots which are known to be assigned
+        self.edges = []  # type: [(int, tuple)] the jumps out of the region and the state at the jump
+        self.position = 0
+
+    # The source
+
+    def bind(self, name: str, obj):
+        """The name of `obj` in the source, every object the code uses is a parameter of the factory."""
+        self.namespace.setdefault(name, obj)
+        return name
+
+    def tag(self, dtype: str):
+        return self.bind(dtype.upper().replace('[]', '_ARRAY'), dtype)
+
+    def emit(self, line: str):
+        self.lines.append('    ' * self.indent + line)
+
+    def variable(self, index: int):
+        return 'v_' + self.code_obj.name_list[index]
+
+    def prologue(self):
+        lines = []
+        if not self.in_slots and self.code_obj.name_list:
+            lines.append('{}, = slots'.format(', '.join(map(self.variable, range(len(self.code_obj.name_list))))))
+        lines.extend('outer{} = scopes[{}]'.format(depth, depth) for depth in self.outer_depths)
+        return lines
+
+    def transpile(self, factory_name='make'):
+        """The source of the factory function `factory_name`, which returns the transpiled function, and
+        the objects to call it with."""
+        initial = frozenset(range(self.arity or 0))
+        states = self.analyze(initial)
+        regions = []
+        edges = False
+        for leader in sorted(states):
+            self.lines = []
+            self.walk(leader, states[leader])
+            edges = edges or bool(self.edges)
+            regions.append((leader, self.lines))
+        name = 'ms_' + identifier(self.code_obj.name)
+        lines = ['# transpiled from {} at line {}'.format(self.code_obj.name, self.code_obj.line),
+                 'def {}({}):'.format(factory_name, ', '.join(sorted(self.namespace))),
+                 '    def {}(slots, scopes, pc=0):'.format(name)]
+        lines.extend('        ' + line for line in self.prologue())
+        if edges or self.self_tail_call:
+            lines.append('        while True:')
+            lines.extend(self.dispatch(regions, 3))
+        else:
+            lines.extend('        ' + line for line in regions[0][1])
+        lines.append('    {}.entries = frozenset({})'.format(name, sorted(states)))
+        lines.append('    return {}'.format(name))
+        return '\n'.join(lines) + '\n', self.namespace
+
+    def dispatch(self, regions, indent):
+        """Select the region starting at pc by comparing it with the middle start, then the halves."""
+        prefix = '    ' * indent
+        if len(regions) == 1:
+            return [prefix + line for line in regions[0][1]]
+        middle = len(regions) // 2
+        return [prefix + 'if pc < {}:'.format(regions[middle][0])] + self.dispatch(regions[:middle], indent + 1) + \
+               [prefix + 'else:'] + self.dispatch(regions[middle:], indent + 1)
+
+    # The regions
+
+    def analyze(self, initial):
+        """The stack height, the loops and the assigned slots where every reachable region begins."""
+        states = {0: (0, (), initial)}
+        pending = [0]
+        while pending:
+            leader = pending.pop()
+            self.lines = []
+            self.walk(leader, states[leader])
+            for target, (height, blocks, assigned) in self.edges:
+                if target not in states:
+                    states[target] = (height, blocks, assigned)
+                    pending.append(target)
+                    continue
+                old_height, old_blocks, old_assigned = states[target]
+                if (height, blocks) != (old_height, old_blocks):
+                    raise TranspileError('the stack differs between the jumps to {}'.format(target))
+                if not old_assigned <= assigned:
+                    states[target] = (height, blocks, old_assigned & assigned)
+                    pending.append(target)
+        return states
+
+    def walk(self, leader: int, state):
+        """Emit the region which begins at `leader`, until it jumps, returns or reaches the next region."""
+        height, self.blocks, assigned = state
+        self.stack = [Entry('s{}'.format(depth)) for depth in range(height)]
+        self.assigned = set(assigned)
+        self.edges = []
+        self.indent = 0
+        position = leader
+        while position is not None:
+            if position >= len(self.code):
+                raise TranspileError('the code can run past its end')
+            if position != leader and position in self.leaders:
+                self.jump(position)
+                return
+            byte_name, arg = self.code[position]
+            self.position = position
+            handler = getattr(self, 'emit_' + byte_name, None)
+            if handler is None and byte_name.startswith('BINARY_'):
+                handler = self.emit_binary
+            elif handler is None and byte_name.startswith('UNARY_'):
+                handler = self.emit_unary
+            elif handler is None:
+                raise TranspileError('{} is not transpiled'.format(byte_name))
+            position = handler(arg)
+
+    def next_instruction(self):
+        """The instruction after the current one if it is in the same region, or (None, None)."""
+        position = self.position + 1
+        if position < len(self.code) and position not in self.leaders:
+            return self.code[position]
+        return None, None
+
+    def jump(self, target: int, height=None):
+        """Go on at `target`, with the stack up to `height`. The values are moved to their temporaries."""
+        stack = self.stack if height is None else self.stack[:height]
+        for depth, entry in enumerate(stack):
+            if entry.expression != 's{}'.format(depth):
+                self.emit('s{} = {}'.format(depth, entry.expression))
+        self.edges.append((target, (len(stack), self.blocks, frozenset(self.assigned))))
+        self.emit('pc = {}'.format(target))
+
+    def push(self, entry: Entry):
+        self.stack.append(entry)
+
+    def pop(self):
+        if not self.stack:
+            raise TranspileError('the stack is empty at {}'.format(self.position))
+        return self.stack.pop()
+
+    def popn(self, n: int):
+        if n > len(self.stack):
+            raise TranspileError('the stack is empty at {}'.format(self.position))
+        entries = self.stack[len(self.stack) - n:]
+        del self.stack[len(self.stack) - n:]
+        return entries
+
+    def temporary(self):
+        """The temporary of the value pushed next."""
+        return 's{}'.format(len(self.stack))
+
+    def protect(self, index: int):
+        """Move the values on the stack which read the variable `index` to their temporaries, before it is
+        assigned."""
+        for depth, entry in enumerate(self.stack):
+            if entry.local == index:
+                self.emit('s{} = {}'.format(depth, entry.expression))
+                self.stack[depth] = Entry('s{}'.format(depth), entry.dtype, entry.raw, None, entry.is_bool)
+
+    def result_target(self):
+        """Where the result of an operator goes: the variable a STORE_NAME right after the operator stores it
+        to, or the temporary. Returns the target and whether it is the variable."""
+        byte_name, arg = self.next_instruction()
+        if byte_name == 'STORE_NAME':
+            depth, index = index2tuple(arg)
+            target = self.store_target(depth, index)
+            if depth == self.lexical_depth:
+                self.assigned.add(index)
+            return target, True
+        return self.temporary(), False
+
+    def result(self, entry: Entry, stored: bool):
+        """Push the result unless it is stored already, and return the position to go on at."""
+        if stored:
+            return self.position + 2
+        self.push(entry)
+        return self.position + 1
+
+    def store_target(self, depth: int, index: int):
+        if depth != self.lexical_depth:
+            return 'outer{}[{}]'.format(depth, index)
+        if self.in_slots:
+            return 'slots[{}]'.format(index)
+        self.protect(index)
+        return self.variable(index)
+
+    def check_assigned(self, expression: str, depth: int, index: int):
+        if depth == self.lexical_depth:
+            if index in self.assigned:
+                return
+            self.assigned.add(index)
+        self.emit('if {} is None:'.format(expression))
+        self.emit('    raise unassigned({!r})'.format(self.code_obj.scope_names[depth][index]))
+
+    # The representation of the values, the native transpiler overrides these
+
+    def constant(self, index: int, const: Value):
+        raw = None
+        if const.dtype in UNBOXED_TYPES and (type(const.value) is not float or math.isfinite(const.value)):
+            raw = repr(const.value)
+        return Entry(self.bind('k{}'.format(index), const), const.dtype, raw)
+
+    def raw(self, entry: Entry):
+        """An expression of the Python object in the value of `entry`."""
+        return entry.raw if entry.raw is not None else entry.expression + '.value'
+
+    def type_test(self, entry: Entry, dtype: str):
+        """A test whether the value of `entry` has the type `dtype`, or None if it is known to have it."""
+        if entry.dtype is dtype:
+            return None
+        return '{}.dtype is {}'.format(entry.expression, self.tag(dtype))
+
+    def boxed(self, dtype: str, raw: str):
+        """The value of the Python object `raw` of the type `dtype`."""
+        if dtype is INT:
+            return '{}({}, {})'.format(self.bind('make_value', make_value), self.tag(INT), raw)
+        return '{}({}, {})'.format(self.bind('Value', Value), self.tag(dtype), raw)
+
+    def boolean(self, condition: str):
+        """The value of a Python bool."""
+        return '{} if {} else {}'.format(self.bind('TRUE', TRUE), condition, self.bind('FALSE', FALSE))
+
+    def truth(self, entry: Entry):
+        """A Python condition which is true when the value of `entry` is true, it raises like the machine
+        for a value which is not a bool."""
+        if entry.is_bool:
+            return '({} is {})'.format(entry.expression, self.bind('TRUE', TRUE))
+        return 'bool({})'.format(entry.expression)
+
+    def test_of(self, expression: str):
+        """A Python condition which is true when the value of a comparison is true."""
+        return '{} is {}'.format(expression, self.bind('TRUE', TRUE))
+
+    @staticmethod
+    def guarded(tests, fast: str, slow: str):
+        """The expression `fast` when all the tests hold, otherwise `slow`, in parentheses."""
+        tests = [test for test in tests if test]
+        if not tests:
+            return '({})'.format(fast)
+        return '({} if {} else {})'.format(fast, ' and '.join(tests), slow)
+
+    def arithmetic(self, target: str, name: str, x: Entry, y: Entry, generic: str):
+        """Emit `target` = x `name` y with the fast path for two numbers of the same type."""
+        dtype = self.fast_type(x, y, ARITHMETIC_TYPES[name])
+        if dtype is None:
+            self.emit('{} = {}({}, {})'.format(target, generic, x.expression, y.expression))
+            return
+        operator_symbol = ARITHMETIC_OPERATORS[name]
+        if operator_symbol == '/' and dtype is INT:
+            operator_symbol = '//'
+        fast = self.boxed(dtype, '{} {} {}'.format(self.raw(x), operator_symbol, self.raw(y)))
+        tests = [test for test in (self.type_test(x, dtype), self.type_test(y, dtype)) if test]
+        if not tests:
+            self.emit('{} = {}'.format(target, fast))
+            return
+        self.emit('if {}:'.format(' and '.join(tests)))
+        self.emit('    {} = {}'.format(target, fast))
+        self.emit('else:')
+        self.emit('    {} = {}({}, {})'.format(target, generic, x.expression, y.expression))
+
+    @staticmethod
+    def fast_type(x: Entry, y: Entry, dtypes):
+        """The type of the fast path of an operator of x and y: the known type of one of them, or int."""
+        for entry in (x, y):
+            if entry.dtype is not None:
+                return entry.dtype if entry.dtype in dtypes else None
+        return INT if INT in dtypes else None
+
+    def comparison(self, index: int, x: Entry, y: Entry, generic: str):
+        """A Python condition of the comparison `index` of x and y, in parentheses."""
+        if index in (2, 3):
+            equal = self.equality(x, y)
+            if equal is not None:
+                return '({})'.format(equal) if index == 2 else '(not ({}))'.format(equal)
+        dtype = self.fast_type(x, y, ORDERING_TYPES)
+        slow = self.test_of('{}({}, {})'.format(generic, x.expression, y.expression))
+        if dtype is None:
+            return '({})'.format(slow)
+        fast = '{} {} {}'.format(self.raw(x), COMPARE_OPERATORS[index], self.raw(y))
+        return self.guarded([self.type_test(x, dtype), self.type_test(y, dtype)], fast, slow)
+
+    def equality(self, x: Entry, y: Entry):
+        """A Python condition which is true when x equals y, or None to compare them like the others."""
+        for known, other in ((x, y), (y, x)):
+            if known.dtype is not None:
+                return ' and '.join(test for test in (self.type_test(other, known.dtype),
+                                                      '{} == {}'.format(self.raw(x), self.raw(y))) if test)
+        return '{}.dtype is {}.dtype and {} == {}'.format(x.expression, y.expression, self.raw(x), self.raw(y))
+
+    def subscript_test(self, obj: Entry, key: Entry):
+        """A test whether `key` is an index of the array part of the table `obj`, or None if it is known not
+        to be. A constant is never a table."""
+        if key.dtype is not None and key.dtype is not INT or obj.dtype is not None:
+            return None
+        index = self.raw(key)
+        return ' and '.join(test for test in (self.type_test(key, INT), self.type_test(obj, TABLE),
+                                              '0 <= {} < len({}.value.array)'.format(index, obj.expression)) if test)
+
+    def print_value(self, entry: Entry):
+        self.emit('print({})'.format(entry.expression))
+
+    def branch_on(self, condition: str, jump_if: bool, target: int):
+        """Emit the jump to `target` when the Python condition is `jump_if`."""
+        self.emit('if {}:'.format(condition if jump_if else 'not ' + condition))
+        self.indent += 1
+        self.jump(target)
+        self.emit('continue')
+        self.indent -= 1
+
+    def branch(self, entry: Entry, jump_if: bool, target: int):
+        self.branch_on(self.truth(entry), jump_if, target)
+
+    def emit_UNARY_NOT(self, _):
+        x = self.pop()
+        target, stored = self.result_target()
+        self.emit('{} = {}'.format(target, self.boolean('not ' + self.truth(x))))
+        return self.result(Entry(target, is_bool=True), stored)
+
+    # The instructions, each returns the position to go on at, or None when the region ends
+
+    def emit_POP_TOP(self, _):
+        self.pop()
+        return self.position + 1
+
+    def emit_DUP_TOP(self, _):
+        entry = self.pop()
+        self.stack.extend((entry, entry))
+        return self.position + 1
+
+    def emit_LOAD_CONST(self, index):
+        self.push(self.constant(index, self.code_obj.const_list[index]))
+        return self.position + 1
+
+    def emit_LOAD_BUILTIN(self, name):
+        self.push(Entry(self.bind('builtin_' + name, msbuiltins.BUILTINS[name])))
+        return self.position + 1
+
+    def emit_LOAD_NAME(self, arg):
+        depth, index = index2tuple(arg)
+        if depth == self.lexical_depth and not self.in_slots:
+            self.check_assigned(self.variable(index), depth, index)
+            self.push(Entry(self.variable(index), local=index))
+            return self.position + 1
+        target = self.temporary()
+        self.emit('{} = {}[{}]'.format(target, 'slots' if depth == self.lexical_depth else 'outer{}'.format(depth),
+                                       index))
+        self.check_assigned(target, depth, index)
+        self.push(Entry(target))
+        return self.position + 1
+
+    def emit_STORE_NAME(self, arg):
+        depth, index = index2tuple(arg)
+        entry = self.pop()
+        self.emit('{} = {}'.format(self.store_target(depth, index), entry.expression))
+        if depth == self.lexical_depth:
+            self.assigned.add(index)
+        return self.position + 1
+
+    def emit_MAKE_FUNCTION(self, index):
+        function = self.bind('k{}'.format(index), self.code_obj.const_list[index])
+        self.emit('{} = {}({}, {}.value.bind_scopes(scopes))'.format(
+            self.temporary(), self.bind('Value', Value), self.tag(FUNCTION), function))
+        self.push(Entry(self.temporary()))
+        return self.position + 1
+
+    def emit_BINARY_SUBSCR(self, _):
+        obj, key = self.popn(2)
+        target, stored = self.result_target()
+        cache = self.bind('load_cache{}'.format(self.position), PropertyCache(
+            self.virtual_machine.PROTOTYPE_KEY, self.virtual_machine.BINARY_OPERATORS['SUBSCR']))
+        load = '{}.load({}, {})'.format(cache, obj.expression, key.expression)
+        test = self.subscript_test(obj, key)
+        if test is None:
+            self.emit('{} = {}'.format(target, load))
+        else:
+            self.emit('{} = {}.value.array[{}] if {} else {}'.format(target, obj.expression, self.raw(key), test, load))
+        return self.result(Entry(target), stored)
+
+    def emit_STORE_SUBSCR(self, _):
+        value, obj, key = self.popn(3)
+        cache = self.bind('store_cache{}'.format(self.position), PropertyCache(
+            self.virtual_machine.PROTOTYPE_KEY, self.virtual_machine.STORE_SUBSCR_OPERATOR))
+        store = '{}.store({}, {}, {})'.format(cache, obj.expression, key.expression, value.expression)
+        test = self.subscript_test(obj, key)
+        if test is None:
+            self.emit(store)
+        else:
+            self.emit('if {}:'.format(test))
+            self.emit('    {}.value.array[{}] = {}'.format(obj.expression, self.raw(key), value.expression))
+            self.emit('else:')
+            self.emit('    ' + store)
+        return self.position + 1
+
+    def emit_unary(self, _):
+        byte_name = self.code[self.position][0]
+        x = self.pop()
+        target, stored = self.result_target()
+        operator_function = self.bind('unary_' + byte_name[6:].lower(),
+                                      self.virtual_machine.UNARY_OPERATORS[byte_name[6:]])
+        self.emit('{} = {}({})'.format(target, operator_function, x.expression))
+        return self.result(Entry(target), stored)
+
+    def emit_binary(self, _):
+        name = self.code[self.position][0][7:]
+        if name not in self.virtual_machine.BINARY_OPERATORS:
+            raise TranspileError('BINARY_{} is not transpiled'.format(name))
+        x, y = self.popn(2)
+        target, stored = self.result_target()
+        generic = self.bind('binary_' + name.lower(), self.virtual_machine.BINARY_OPERATORS[name])
+        if name in ARITHMETIC_OPERATORS:
+            self.arithmetic(target, name, x, y, generic)
+        else:
+            self.emit('{} = {}({}, {})'.format(target, generic, x.expression, y.expression))
+        return self.result(Entry(target), stored)
+
+    def emit_COMPARE_OP(self, index):
+        if index >= len(self.virtual_machine.COMPARE_OPERATORS):
+            raise TranspileError('the comparison {} is not transpiled'.format(index))
+        x, y = self.popn(2)
+        generic = self.bind('compare{}'.format(index), self.virtual_machine.COMPARE_OPERATORS[index])
+        if index >= len(COMPARE_OPERATORS):
+            self.emit('{} = {}({}, {})'.format(self.temporary(), generic, x.expression, y.expression))
+            self.push(Entry(self.temporary()))
+            return self.position + 1
+        condition = self.comparison(index, x, y, generic)
+        byte_name, target = self.next_instruction()
+        if byte_name in ('POP_JUMP_IF_FALSE', 'POP_JUMP_IF_TRUE'):
+            self.branch_on(condition, byte_name == 'POP_JUMP_IF_TRUE', target)
+            return self.position + 2
+        target, stored = self.result_target()
+        self.emit('{} = {}'.format(target, self.boolean(condition)))
+        return self.result(Entry(target, is_bool=True), stored)
+
+    def emit_BUILD_LIST(self, count):
+        elements = self.popn(count)
+        self.emit('{} = {}({}, {}([{}]))'.format(self.temporary(), self.bind('Value', Value), self.tag(TABLE),
+                                                 self.bind('Table', Table),
+                                                 ', '.join(entry.expression for entry in elements)))
+        self.push(Entry(self.temporary()))
+        return self.position + 1
+
+    def emit_BUILD_MAP(self, count):
+        elements = self.popn(2 * count)
+        self.emit('{} = {}([{}])'.format(self.temporary(), self.bind('build_map', build_map),
+                                         ', '.join(entry.expression for entry in elements)))
+        self.push(Entry(self.temporary()))
+        return self.position + 1
+
+    def emit_BUILD_ARRAY(self, type_name):
+        source = self.pop()
+        dtype = type_tag(type_name)
+        self.emit('{} = {}({}, {})'.format(self.temporary(), self.bind('make_array', make_array),
+                                           self.tag(dtype), source.expression))
+        self.push(Entry(self.temporary()))
+        return self.position + 1
+
+    def emit_JUMP_ABSOLUTE(self, target):
+        self.jump(target)
+        return None
+
+    def emit_POP_JUMP_IF_FALSE(self, target):
+        self.branch(self.pop(), False, target)
+        return self.position + 1
+
+    def emit_POP_JUMP_IF_TRUE(self, target):
+        self.branch(self.pop(), True, target)
+        return self.position + 1
+
+    def emit_SETUP_LOOP(self, handler):
+        self.blocks += ((handler, len(self.stack)),)
+        return self.position + 1
+
+    def emit_POP_BLOCK(self, _):
+        if not self.blocks:
+            raise TranspileError('POP_BLOCK outside of a loop')
+        self.blocks = self.blocks[:-1]
+        return self.position + 1
+
+    def emit_BREAK_LOOP(self, _):
+        if not self.blocks:
+            raise TranspileError('BREAK_LOOP outside of a loop')
+        handler, height = self.blocks[-1]
+        self.blocks = self.blocks[:-1]
+        self.jump(handler, height)
+        return None
+
+    def emit_CALL_FUNCTION(self, count):
+        func = self.pop()
+        arguments = self.popn(count)
+        self.emit('{} = call({}, [{}])'.format(self.temporary(), func.expression,
+                                               ', '.join(entry.expression for entry in arguments)))
+        self.push(Entry(self.temporary()))
+        return self.position + 1
+
+    def emit_TAIL_CALL_FUNCTION(self, count):
+        """A call of the function itself starts over with the new slots, other calls return the result."""
+        func = self.pop()
+        arguments = '[{}]'.format(', '.join(entry.expression for entry in self.popn(count)))
+        if self.arity is None:
+            self.emit('return call({}, {})'.format(func.expression, arguments))
+            return None
+        self.self_tail_call = True
+        self.emit('new_slots = {}'.format(arguments))
+        self.emit('new_scopes = tail_call({}, new_slots, code_obj)'.format(func.expression))
+        self.emit('if new_scopes is None:')
+        self.emit('    return call({}, new_slots)'.format(func.expression))
+        self.emit('slots, scopes = new_slots, new_scopes')
+        for line in self.prologue():
+            self.emit(line)
+        self.edges.append((0, (0, (), frozenset(range(self.arity)))))
+        self.emit('pc = 0')
+        return None
+
+    def emit_RETURN_VALUE(self, _):
+        self.emit('return {}'.format(self.pop().expression))
+        return None
+
+    def emit_PRINT_EXPR(self, _):
+        self.print_value(self.pop())
+        return self.position + 1
+
+
+class JIT:
+    """Counts the calls and the loop iterations of the code which is not transpiled yet, and transpiles it
+    when it is hot."""
+    def __init__(self, virtual_machine, call_threshold=DEFAULT_CALL_THRESHOLD, loop_threshold=DEFAULT_LOOP_THRESHOLD,
+                 dump_dir=None, max_nesting=DEFAULT_MAX_NESTING):
+        self.virtual_machine = virtual_machine
+        self.call_threshold = call_threshold
+        self.loop_threshold = loop_threshold
+        self.dump_dir = dump_dir
+        self.max_nesting = max_nesting
+        self.functions = {}  # type: {CodeObj: function} the transpiled functions, None if it can not be transpiled
+        self.calls = collections.Counter()  # type: {CodeObj: int}
+        self.loops = collections.Counter()  # type: {CodeObj: int} the backward jumps
+        self.arities = {}  # type: {CodeObj: int} the number of parameters of every function of the program
+        self.positions = {}  # type: {CodeObj: [int]} the position in the code of every decoded instruction
+        # the Python calls nested by the transpiled code: the transpiled calls and the frames they run
+        self.nesting = 0
+        self.running = 0  # the transpiled calls which are running, they count to the call depth like frames
+
+    def add_program(self, code_obj: CodeObj):
+        for const in code_obj.const_list:
+            if const.dtype is FUNCTION:
+                self.arities[const.value.code_obj] = const.value.arity
+                self.add_program(const.value.code_obj)
+
+    def transpile(self, code_obj: CodeObj):
+        transpiler = self.virtual_machine.transpiler_class(self.virtual_machine, self, code_obj,
+                                                           self.arities.get(code_obj))
+        file_name = '<transpiled {} at line {}>'.format(code_obj.name, code_obj.line)
+        try:
+            source, namespace = transpiler.transpile()
+        except TranspileError as error:
+            function, source = None, '# {} is not transpiled: {}\n'.format(file_name, error)
+        else:
+            definitions = {}
+            exec(compile(source, file_name, 'exec'), definitions)
+            function = definitions['make'](**namespace)
+            # tracebacks show the lines of the source
+            linecache.cache[file_name] = (len(source), None, source.splitlines(True), file_name)
+        if self.dump_dir:
+            os.makedirs(self.dump_dir, exist_ok=True)
+            dump_name = '{}_{}_{}.py'.format(len(self.functions), identifier(code_obj.name), code_obj.line)
+            with open(os.path.join(self.dump_dir, dump_name), 'w') as dump_file:
+                dump_file.write(source)
+        self.functions[code_obj] = function
+        return function
+
+    def hot_function(self, code_obj: CodeObj):
+        """The transpiled function of a function which is called, or None while it is interpreted."""
+        function = self.functions.get(code_obj, MISSING)
+        if function is MISSING:
+            self.calls[code_obj] += 1
+            if self.calls[code_obj] < self.call_threshold:
+                return None
+            function = self.transpile(code_obj)
+        if self.nesting >= self.max_nesting:
+            return None
+        return function
+
+    def hot_loop(self, code_obj: CodeObj):
+        """The transpiled function of a code object which jumps back, or None while it is interpreted."""
+        function = self.functions.get(code_obj, MISSING)
+        if function is MISSING:
+            self.loops[code_obj] += 1
+            if self.loops[code_obj] < self.loop_threshold:
+                return None
+            function = self.transpile(code_obj)
+        if self.nesting >= self.max_nesting:
+            return None
+        return function
+
+    def run(self, function, func: Function, arguments: list):
+        """Call the transpiled function of `func`."""
+        virtual_machine = self.virtual_machine
+        virtual_machine.check_arity(func, arguments)
+        virtual_machine.check_arguments(func, arguments)
+        arguments.extend(func.local_padding)
+        if len(virtual_machine.frames) + self.running >= virtual_machine.max_call_depth:
+            raise virtual_machine.call_depth_error()
+        self.nesting += 1
+        self.running += 1
+        try:
+            return function(arguments, func.scopes + (arguments,))
+        finally:
+            self.nesting -= 1
+            self.running -= 1
+
+    def run_loop(self, function, frame, jump: int):
+        """Go on running `frame` in the transpiled function from the decoded position `jump`, or return
+        MISSING if it can not start there."""
+        positions = self.positions.get(frame.code_obj)
+        if positions is None:
+            groups = self.virtual_machine.group_instructions(frame.code_obj.code)
+            positions = self.positions[frame.code_obj] = [position for _, position, _ in groups]
+        if positions[jump] not in function.entries:
+            return MISSING
+        self.nesting += 1
+        try:
+            return function(frame.slots, frame.scopes, positions[jump])
+        finally:
+            self.nesting -= 1
+
+    # The calls of the transpiled code
+
+    def call(self, func_value, arguments: list):
+        func = func_value.value
+        if type(func) is NativeFunction:
+            return func.call(self.virtual_machine, arguments)
+        function = self.hot_function(func.code_obj)
+        if function is not None:
+            return self.run(function, func, arguments)
+        virtual_machine = self.virtual_machine
+        self.nesting += 1
+        try:
+            return virtual_machine.run_frame(virtual_machine.enter_function(func, arguments))
+        finally:
+            self.nesting -= 1
+
+    def tail_call(self, func_value, arguments: list, code_obj: CodeObj):
+        """The scopes of a call of the function of `code_obj` in return position, which runs in the frame
+        of the caller, or None if `func_value` is another function."""
+        func = func_value.value
+        if type(func) is not Function or func.code_obj is not code_obj:
+            return None
+        self.virtual_machine.check_arity(func, arguments)
+        self.virtual_machine.check_arguments(func, arguments)
+        arguments.extend(func.local_padding)
+        return func.scopes + (arguments,)
+
+    def unassigned(self, name: str):
+        return self.virtual_machine.unassigned_error(name)
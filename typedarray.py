@@ -0,0 +1,127 @@
+"""The storage of the typed arrays int[] and real[], which hold numbers unboxed in one buffer.
+
+The buffer is a numpy array when numpy is installed, otherwise an array.array. The elements of an int[] are
+64 bit integers. The element-wise operators run over the whole buffer at once, in numpy or in map(), instead
+of one instruction of the virtual machine per element.
+"""
+import array
+import itertools
+import operator
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TYPECODES = {int: 'q', float: 'd'}
+TYPE_NAMES = {int: 'int', float: 'real'}
+OPERATORS = {
+    'add': operator.add,
+    'subtract': operator.sub,
+    'multiply': operator.mul,
+}
+
+
+class TypedArray:
+    __slots__ = ('element_type', 'data')
+
+    def __init__(self, element_type: type, data):
+        self.element_type = element_type  # int or float
+        self.data = data
+
+    @classmethod
+    def zeros(cls, element_type: type, length: int):
+        if length < 0:
+            raise ValueError('the length of an array can not be negative, but it is {}'.format(length))
+        if numpy is not None:
+            return cls(element_type, numpy.zeros(length, dtype=TYPECODES[element_type]))
+        return cls(element_type, array.array(TYPECODES[element_type], bytes(8 * length)))
+
+    @classmethod
+    def from_elements(cls, element_type: type, elements: list):
+        for element in elements:
+            if type(element) is not element_type:
+                raise TypeError('the elements of an array {}[] must be {}, but one is {!r}'
+                                .format(TYPE_NAMES[element_type], TYPE_NAMES[element_type], element))
+        if numpy is not None:
+            return cls(element_type, numpy.array(elements, dtype=TYPECODES[element_type]))
+        return cls(element_type, array.array(TYPECODES[element_type], elements))
+
+    def converted(self, element_type: type):
+        """A copy of the array with elements of `element_type`."""
+        if numpy is not None:
+            return TypedArray(element_type, self.data.astype(TYPECODES[element_type]))
+        return TypedArray(element_type, array.array(TYPECODES[element_type], map(element_type, self.data)))
+
+    def tolist(self):
+        return self.data.tolist()
+
+    def check_index(self, index):
+        if type(index) is not int or not 0 <= index < len(self.data):
+            raise IndexError('the index of the array must be an int from 0 to {}, but it is {!r}'
+                             .format(len(self.data) - 1, index))
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        if type(index) is not int or index < 0:
+            self.check_index(index)
+        try:
+            return self.element_type(self.data[index])
+        except IndexError:
+            self.check_index(index)
+
+    def __setitem__(self, index, value):
+        if type(value) is not self.element_type:
+            raise TypeError('the elements of an array {}[] must be {}, but the value is {!r}'
+                            .format(TYPE_NAMES[self.element_type], TYPE_NAMES[self.element_type], value))
+        if type(index) is not int or index < 0:
+            self.check_index(index)
+        try:
+            self.data[index] = value
+        except IndexError:
+            self.check_index(index)
+
+    def __eq__(self, other):
+        return type(other) is TypedArray and self.element_type is other.element_type and \
+            self.tolist() == other.tolist()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+    def elementwise(self, name: str, other, reflected=False):
+        """The array of `self` and `other` combined element by element by the operator `name`. `other` is
+        an array with elements of the same type and the same length, or a number of that type which is
+        combined with every element. With `reflected` the operands are swapped."""
+        type_name = TYPE_NAMES[self.element_type]
+        if type(other) is TypedArray:
+            if other.element_type is not self.element_type:
+                raise TypeError('to {}, the arrays must be of the same type, but they are {}[] and {}[]'
+                                .format(name, type_name, TYPE_NAMES[other.element_type]))
+            if len(other.data) != len(self.data):
+                raise ValueError('to {}, the arrays must be of the same length, but they are {} and {}'
+                                 .format(name, len(self.data), len(other.data)))
+            other_data = other.data
+        elif type(other) is self.element_type:
+            other_data = other
+        else:
+            raise TypeError('to {} with a {}[], the operand must be a {}[] or a {}, but it is {!r}'
+                            .format(name, type_name, type_name, type_name, other))
+        left, right = (other_data, self.data) if reflected else (self.data, other_data)
+        if name == 'divide':
+            operation = operator.floordiv if self.element_type is int else operator.truediv
+            # numpy only warns about a division by zero, map() raises like the division of two numbers
+            if numpy is not None and not numpy.all(right):
+                raise ZeroDivisionError('division by zero')
+        else:
+            operation = OPERATORS[name]
+        if numpy is not None:
+            return TypedArray(self.element_type, operation(left, right))
+        if type(left) is self.element_type:
+            left = itertools.repeat(left)
+        elif type(right) is self.element_type:
+            right = itertools.repeat(right)
+        return TypedArray(self.element_type, array.array(TYPECODES[self.element_type], map(operation, left, right)))
@@ -1,4 +1,31 @@
+import copy
+import sys
+from reprlib import recursive_repr
+
+from typedarray import TypedArray
+
+# The type tags of values. There is exactly one object for every tag, so tags are compared with `is`,
+# a tag which does not come from this module (e.g. a type name read by the lexer) must be interned first
+INT = 'int'
+REAL = 'real'
+STR = 'str'
+BOOL = 'bool'
+TABLE = 'table'
+FUNCTION = 'function'
+INT_ARRAY = sys.intern('int[]')
+REAL_ARRAY = sys.intern('real[]')
+TYPE_TAGS = {INT, REAL, STR, BOOL, TABLE, FUNCTION, INT_ARRAY, REAL_ARRAY}
+# The type tag of the elements of each typed array
+ARRAY_ELEMENT_TYPES = {INT_ARRAY: INT, REAL_ARRAY: REAL}
+
+
+def type_tag(type_name: str):
+    return sys.intern(type_name)
+
+
 class Value:
+    __slots__ = ('dtype', 'value')
+
     def __init__(self, dtype: str, value):
         self.dtype = dtype
         self.value = value
@@ -10,100 +37,368 @@ class Value:
         return str(self)
 
     def _check_type(self, other):
-        if self.dtype != other.dtype:
+        if self.dtype is not other.dtype:
             raise TypeError('the compare of = for {} and {} is error, the first is of type {} '
                             'but the latter is of type {}'.format(self, other, self.dtype, other.dtype))
 
+    def _check_number(self, operation):
+        if self.dtype is not INT and self.dtype is not REAL:
+            raise TypeError('to {}, the type of operand must be number'.format(operation))
+
+    def _check_bool(self, operation):
+        if self.dtype is not BOOL:
+            raise TypeError('to {}, the type of operand must be bool'.format(operation))
+
     def __eq__(self, other):
-        return Value('bool', self.dtype == other.dtype and self.value == other.value)
+        return TRUE if self.dtype is other.dtype and self.value == other.value else FALSE
 
     def __le__(self, other):
         self._check_type(other)
-        return Value('bool', self.value < other.value)
+        return TRUE if self.value <= other.value else FALSE
 
     def __ge__(self, other):
         self._check_type(other)
-        return Value('bool', self.value >= other.value)
+        return TRUE if self.value >= other.value else FALSE
 
     def __lt__(self, other):
         self._check_type(other)
-        return Value('bool', self.value < other.value)
+        return TRUE if self.value < other.value else FALSE
 
     def __gt__(self, other):
         self._check_type(other)
-        return Value('bool', self.value > other.value)
+        return TRUE if self.value > other.value else FALSE
 
     def __ne__(self, other):
-        return Value('bool', not(self == other))
+        return FALSE if self.dtype is other.dtype and self.value == other.value else TRUE
 
     def __add__(self, other):
+        if self.dtype in ARRAY_ELEMENT_TYPES or other.dtype in ARRAY_ELEMENT_TYPES:
+            return array_operation('add', self, other)
         self._check_type(other)
-        return Value(self.dtype, self.value + other.value)
+        if self.dtype is not INT and self.dtype is not REAL and self.dtype is not STR:
+            raise TypeError('to add, the type of operand must be number or str')
+        return make_value(self.dtype, self.value + other.value)
 
     def __sub__(self, other):
+        if self.dtype in ARRAY_ELEMENT_TYPES or other.dtype in ARRAY_ELEMENT_TYPES:
+            return array_operation('subtract', self, other)
         self._check_type(other)
-        if self.dtype != 'int' and self.dtype != 'real':
-            raise TypeError('to subtract, the type of operand must be number')
-        return Value(self.dtype, self.value - other.value)
+        self._check_number('subtract')
+        return make_value(self.dtype, self.value - other.value)
 
     def __mul__(self, other):
+        if self.dtype in ARRAY_ELEMENT_TYPES or other.dtype in ARRAY_ELEMENT_TYPES:
+            return array_operation('multiply', self, other)
         self._check_type(other)
-        if self.dtype != 'int' and self.dtype != 'real':
-            raise TypeError('to multiply, the type of operand must be number')
-        return Value(self.dtype, self.value * other.value)
+        self._check_number('multiply')
+        return make_value(self.dtype, self.value * other.value)
 
     def __truediv__(self, other):
+        if self.dtype in ARRAY_ELEMENT_TYPES or other.dtype in ARRAY_ELEMENT_TYPES:
+            return array_operation('divide', self, other)
+        self._check_type(other)
+        self._check_number('divide')
+        if self.dtype is INT:
+            return make_value(INT, self.value // other.value)
+        return Value(REAL, self.value / other.value)
+
+    def __and__(self, other):
+        self._check_type(other)
+        self._check_bool('and')
+        return TRUE if self.value and other.value else FALSE
+
+    def __or__(self, other):
         self._check_type(other)
-        if self.dtype != 'int' and self.dtype != 'real':
-            raise TypeError('to divide, the type of operand must be number')
-        return Value(self.dtype, self.value / other.value)
+        self._check_bool('or')
+        return TRUE if self.value or other.value else FALSE
 
     def __getitem__(self, item):
-        obj = self
-        while obj.dtype == 'table':
-            if item in obj.value:
-                return obj.value[item]
-            elif Value('str', 'prototype') in obj.value:
-                obj = obj.value[Value('str', 'prototype')]
-            else:
-                raise KeyError('item {} not exists!'.format(item))
+        if self.dtype in ARRAY_ELEMENT_TYPES:
+            return make_value(ARRAY_ELEMENT_TYPES[self.dtype], self.value[item.value if item.dtype is INT else item])
+        if self.dtype is not TABLE:
+            raise TypeError('only a table or an array can be subscripted, but the object is {}'.format(self))
+        owner = find_owner(self, item, PROTOTYPE)
+        if owner is None:
+            raise KeyError('item {} not exists!'.format(item))
+        return owner[item]
 
     def __setitem__(self, key, value):
-        obj = self
-        succeed = False
-        while obj.dtype == 'table':
-            if key in obj.value:
-                obj.value[key] = value
-                succeed = True
-                break
-            elif Value('str', 'prototype') in obj.value:
-                obj = obj.value[Value('str', 'prototype')]
-            else:
-                break
-        if not succeed:
-            self.value[key] = value
+        if self.dtype in ARRAY_ELEMENT_TYPES:
+            self.value[key.value if key.dtype is INT else key] = value.value
+            return
+        if self.dtype is not TABLE:
+            raise TypeError('only a table or an array can be subscripted, but the object is {}'.format(self))
+        store_property(self, key, value, PROTOTYPE)
 
     def __neg__(self):
-        if self.dtype != 'int' and self.dtype != 'real':
-            raise TypeError('to negative, the type of operand must be number')
-        return Value(self.dtype, -self.value)
+        self._check_number('negative')
+        return make_value(self.dtype, -self.value)
 
     def __bool__(self):
-        if self.dtype != 'bool':
+        if self.dtype is not BOOL:
             raise TypeError('you should check bool with a bool value')
         return self.value
 
     def __hash__(self):
-        if self.dtype == 'table':
+        if self.dtype is TABLE:
             raise TypeError('the type table is not hashable')
         return hash(self.value)
 
 
+TRUE = Value(BOOL, True)
+FALSE = Value(BOOL, False)
+
+# Values never change after they are created, so the small integers are shared like in CPython
+SMALL_INT_MIN = -5
+SMALL_INT_MAX = 1024
+SMALL_INTS = [Value(INT, i) for i in range(SMALL_INT_MIN, SMALL_INT_MAX + 1)]
+
+
+def make_value(dtype: str, value):
+    """Create a value, reusing the shared small integers."""
+    if dtype is INT and SMALL_INT_MIN <= value <= SMALL_INT_MAX:
+        return SMALL_INTS[value - SMALL_INT_MIN]
+    return Value(dtype, value)
+
+
+def make_bool(value: bool):
+    return TRUE if value else FALSE
+
+
+def is_array(x):
+    return type(x) is Value and x.dtype in ARRAY_ELEMENT_TYPES
+
+
+def array_operation(name: str, x, y):
+    """x `name` y where x or y is a typed array, the other operand may be boxed or not."""
+    if is_array(x):
+        return Value(x.dtype, x.value.elementwise(name, y.value if type(y) is Value else y))
+    return Value(y.dtype, y.value.elementwise(name, x.value if type(x) is Value else x, reflected=True))
+
+
+def make_array(dtype: str, source):
+    """The value of int[source] or real[source]. `source` is the length of an array of zeros, a table with
+    the keys 0 to n - 1, or a typed array to convert, boxed or not."""
+    element_type = UNBOXED_TYPES[ARRAY_ELEMENT_TYPES[dtype]]
+    if type(source) is Value and source.dtype is TABLE:
+        if source.value.hash:
+            raise TypeError('to make a {}, the keys of the table must be 0 to n - 1'.format(dtype))
+        elements = [element.value if type(element) is Value else element for element in source.value.array]
+        return Value(dtype, TypedArray.from_elements(element_type, elements))
+    if type(source) is Value:
+        source = source.value
+    if type(source) is int:
+        return Value(dtype, TypedArray.zeros(element_type, source))
+    if type(source) is TypedArray:
+        return Value(dtype, source.converted(element_type))
+    raise TypeError('to make a {}, the operand must be a length, a table or an array'.format(dtype))
+
+
+def boxed_int(index: int):
+    return make_value(INT, index)
+
+
+def array_index(key):
+    """The integer a key stands for, boxed or not, or None if it is not an integer."""
+    if type(key) is int:
+        return key
+    if type(key) is Value and key.dtype is INT:
+        return key.value
+    return None
+
+
+def hash_key(key):
+    """The key of the hash part of a table which stands for `key`. Python considers 1, 1.0 and True the same
+    dict key, so the unboxed ints, reals and bools of the native machine go in with their type."""
+    if type(key) is str or type(key) is Value:
+        return key
+    return type(key), key
+
+
+def table_key(key):
+    """The key of a table a key of the hash part stands for."""
+    return key[1] if type(key) is tuple else key
+
+
+class Table:
+    """The value of a table. Like in Lua, the values of the integer keys 0 to n - 1 are kept in the list
+    `array`, and the values of all other keys in the dict `hash`. The hash never holds an integer key from 0
+    to len(array), so the array grows when a table is filled in order."""
+    __slots__ = ('array', 'hash')
+
+    def __init__(self, array=None):
+        self.array = array if array is not None else []  # type: list
+        self.hash = {}
+
+    def __contains__(self, key):
+        index = array_index(key)
+        if index is not None and 0 <= index < len(self.array):
+            return True
+        return hash_key(key) in self.hash
+
+    def __getitem__(self, key):
+        index = array_index(key)
+        if index is not None and 0 <= index < len(self.array):
+            return self.array[index]
+        return self.hash[hash_key(key)]
+
+    def __setitem__(self, key, value):
+        array = self.array
+        index = array_index(key)
+        if index is not None and 0 <= index <= len(array):
+            if index < len(array):
+                array[index] = value
+                return
+            array.append(value)
+            self.migrate(int if type(key) is int else boxed_int)
+            return
+        self.hash[hash_key(key)] = value
+
+    def migrate(self, make_key):
+        """Move the keys which follow the array from the hash to the array. `make_key` makes a key of the
+        form the hash holds, a Python int or a boxed one, from an index."""
+        array = self.array
+        while self.hash:
+            next_key = hash_key(make_key(len(array)))
+            if next_key not in self.hash:
+                break
+            array.append(self.hash.pop(next_key))
+
+    def insert(self, index: int, value, make_key):
+        """Insert `value` at `index` of the array, moving the elements after it up by one."""
+        if not 0 <= index <= len(self.array):
+            raise IndexError('the index to insert at must be from 0 to {}, but it is {}'
+                             .format(len(self.array), index))
+        self.array.insert(index, value)
+        self.migrate(make_key)
+
+    def remove(self, index: int):
+        """Remove and return the element at `index` of the array, moving the elements after it down by one."""
+        if not 0 <= index < len(self.array):
+            raise IndexError('the index to remove must be from 0 to {}, but it is {}'
+                             .format(len(self.array) - 1, index))
+        return self.array.pop(index)
+
+    def __len__(self):
+        return len(self.array) + len(self.hash)
+
+    def __eq__(self, other):
+        return type(other) is Table and self.array == other.array and self.hash == other.hash
+
+    def items(self):
+        """The (key, value) pairs, the keys of the array part are Python ints."""
+        yield from enumerate(self.array)
+        for key, value in self.hash.items():
+            yield table_key(key), value
+
+    @recursive_repr('{...}')
+    def __repr__(self):
+        items = ['{!r}: {!r}'.format(make_value(INT, index), value) for index, value in enumerate(self.array)]
+        items.extend('{!r}: {!r}'.format(table_key(key), value) for key, value in self.hash.items())
+        return '{' + ', '.join(items) + '}'
+
+
+def build_map(elements: list):
+    """The table of the keys and the values which alternate in `elements`."""
+    table = Table()
+    for i in range(0, len(elements), 2):
+        table[elements[i]] = elements[i + 1]
+    return Value(TABLE, table)
+
+
+PROTOTYPE = Value(STR, 'prototype')
+
+# Which table of a prototype chain holds a key only changes when a key is added to a table or when a
+# prototype is assigned. Only the keys of the hash parts are cached, and adding one of them or assigning
+# a prototype increments table_epoch, a PropertyCache is only valid in the epoch it was filled.
+table_epoch = 0
+
+
+def find_owner(obj: Value, key, prototype_key):
+    """Return the table in the prototype chain of `obj` which holds `key`, or None."""
+    while obj.dtype is TABLE:
+        table = obj.value
+        if key in table:
+            return table
+        elif prototype_key in table.hash:
+            obj = table.hash[prototype_key]
+        else:
+            break
+    return None
+
+
+def store_property(obj: Value, key, value, prototype_key):
+    """Assign to the key where it is found in the prototype chain, or add it to the table itself."""
+    global table_epoch
+    owner = find_owner(obj, key, prototype_key)
+    if owner is None:
+        owner = obj.value
+        if array_index(key) is None:
+            table_epoch += 1
+    elif key == prototype_key:
+        table_epoch += 1
+    owner[key] = value
+
+
+class PropertyCache:
+    """The inline cache of one subscript instruction. It remembers which table of the prototype chain held
+    the key last time, so that the same key on the same table is found again with a single dict lookup.
+    Integer keys are looked up in the array part of the table instead, and not cached, neither are the
+    unboxed reals and bools, which the hash part holds with their type."""
+    __slots__ = ('prototype_key', 'fallback', 'obj', 'key', 'owner', 'epoch')
+
+    def __init__(self, prototype_key, fallback):
+        self.prototype_key = prototype_key
+        self.fallback = fallback  # the uncached operation, it raises the errors
+        self.obj = None
+        self.key = None
+        self.owner = None  # type: dict the hash part of the table which holds the key
+        self.epoch = -1
+
+    def load(self, obj, key):
+        if obj is self.obj and key is self.key and self.epoch == table_epoch:
+            return self.owner[key]
+        if type(obj) is Value and obj.dtype is TABLE:
+            index = array_index(key)
+            if index is None:
+                owner = find_owner(obj, key, self.prototype_key)
+                if owner is not None:
+                    if hash_key(key) is key:
+                        self.obj, self.key, self.owner, self.epoch = obj, key, owner.hash, table_epoch
+                    return owner[key]
+            elif 0 <= index < len(obj.value.array):
+                return obj.value.array[index]
+        return self.fallback(obj, key)
+
+    def store(self, obj, key, value):
+        if obj is self.obj and key is self.key and self.epoch == table_epoch:
+            self.owner[key] = value
+            return
+        if type(obj) is Value and obj.dtype is TABLE:
+            index = array_index(key)
+            if index is None and not key == self.prototype_key:
+                owner = find_owner(obj, key, self.prototype_key)
+                if owner is not None:
+                    if hash_key(key) is key:
+                        self.obj, self.key, self.owner, self.epoch = obj, key, owner.hash, table_epoch
+                    owner[key] = value
+                    return
+            elif index is not None and 0 <= index < len(obj.value.array):
+                obj.value.array[index] = value
+                return
+        self.fallback(obj, key, value)
+
+
 class CodeObj:
-    def __init__(self, code, const_list, name_list):
+    def __init__(self, code, const_list, name_list, name='<program>', line=1):
         self.code = code
         self.const_list = const_list
         self.name_list = name_list
+        self.name = name  # the variable or the key a function is assigned to where it is defined
+        self.line = line  # the line of the source where the code begins
+        self.decoded = {}  # the (opcode, operand) pairs each kind of virtual machine runs, filled in by decode
+        self.scope_names = None  # the name lists of the enclosing code objects and of this one, by lexical depth
+        self.pure = False  # whether a call of the function has no effect but its return value, see memo.py
 
     def __str__(self):
         return """CodeObj object: begin
@@ -122,7 +417,7 @@ end""".format(self.const_list, self.name_list, self.code)
 class Parameter:
     def __init__(self, id_name: str, type_name: str):
         self.id_name = id_name
-        self.type_name = type_name
+        self.type_name = type_tag(type_name)
 
     def __str__(self):
         return self.id_name + ': ' + self.type_name
@@ -150,11 +445,33 @@ class ParameterList:
         return [parameter.type_name for parameter in self.parameters]
 
 
+# The Python type of the values of a type tag, which the native engine keeps unboxed
+UNBOXED_TYPES = {INT: int, REAL: float, STR: str, BOOL: bool}
+UNBOXED_TYPE_TAGS = {python_type: type_name for type_name, python_type in UNBOXED_TYPES.items()}
+
+
 class Function:
     def __init__(self, parameter_list: ParameterList, code_obj: CodeObj, lexical_depth: int):
         self.parameter_list = parameter_list
         self.code_obj = code_obj
         self.lexical_depth = lexical_depth
+        # The binding plan of the calls, worked out once: the number of arguments, the type tags they must
+        # have, the Python types of them when they are all unboxed on the native engine (None if some are
+        # not), and the empty slots of the local variables, which follow the arguments in the frame
+        self.arity = len(parameter_list.parameters)
+        self.parameter_types = tuple(parameter.type_name for parameter in parameter_list.parameters)
+        self.unboxed_types = None
+        if all(type_name in UNBOXED_TYPES for type_name in self.parameter_types):
+            self.unboxed_types = tuple(UNBOXED_TYPES[type_name] for type_name in self.parameter_types)
+        self.local_padding = (None,) * (len(code_obj.name_list) - self.arity)
+        # The slot lists of the enclosing functions by lexical depth, bound when the function is made
+        self.scopes = ()
+
+    def bind_scopes(self, scopes: tuple):
+        """A copy of the function which reads the variables of the functions enclosing it from `scopes`."""
+        closure = copy.copy(self)
+        closure.scopes = scopes
+        return closure
 
     def __str__(self):
         return str((self.lexical_depth, self.parameter_list, self.code_obj))
@@ -163,3 +480,27 @@ class Function:
         return str(self)
 
 
+class NativeFunction:
+    """A function of the host, like the builtins in msbuiltins.py. The virtual machine calls it with the
+    arguments right away, without making a frame. `function` takes the virtual machine and the arguments,
+    and returns a value of the representation of that machine. A function is pure when a call has no
+    effect and does not read tables, see memo.py."""
+    def __init__(self, name: str, function, min_arity: int, max_arity: int, pure: bool):
+        self.name = name
+        self.function = function
+        self.min_arity = min_arity
+        self.max_arity = max_arity
+        self.pure = pure
+
+    def call(self, virtual_machine, arguments: []):
+        if not self.min_arity <= len(arguments) <= self.max_arity:
+            arity = str(self.min_arity) if self.min_arity == self.max_arity else \
+                '{} to {}'.format(self.min_arity, self.max_arity)
+            raise TypeError('{} takes {} arguments, but {} are given'.format(self.name, arity, len(arguments)))
+        return self.function(virtual_machine, *arguments)
+
+    def __str__(self):
+        return '<builtin {}>'.format(self.name)
+
+    def __repr__(self):
+        return str(self)
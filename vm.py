@@ -4,21 +4,43 @@
 # 2. byterun by Ned Batchelder, github.com/nedbat/byterun
 
 import collections
-import operator
+import time
+from fnmatch import fnmatchcase
 
 import bytecode
+import instrument as instrument_module
+import msbuiltins
+import memo
+import profiler
+import transpiler
 from bytecode import index2tuple
+from msoperators import DEFAULT_MAX_CALL_DEPTH, BoxedOperators, VirtualMachineError
 from value import *
 
+# The sequences of instructions fused into a superinstruction when no jump lands inside of them, `*` matches
+# any rest of a byte name. The first matching sequence is taken, so the longer ones come first.
+SUPERINSTRUCTION_PATTERNS = [
+    ('COMPARE_NAME_CONST_JUMP_IF_FALSE', ('LOAD_NAME', 'LOAD_CONST', 'COMPARE_OP', 'POP_JUMP_IF_FALSE')),
+    ('INCREMENT_NAME', ('LOAD_NAME', 'LOAD_CONST', 'BINARY_ADD', 'STORE_NAME')),
+    ('INCREMENT_NAME', ('LOAD_NAME', 'LOAD_CONST', 'BINARY_SUBTRACT', 'STORE_NAME')),
+    ('COMPARE_JUMP_IF_FALSE', ('COMPARE_OP', 'POP_JUMP_IF_FALSE')),
+    ('LOAD_NAME_CONST_BINARY', ('LOAD_NAME', 'LOAD_CONST', 'BINARY_*')),
+    ('LOAD_NAME_NAME_BINARY', ('LOAD_NAME', 'LOAD_NAME', 'BINARY_*')),
+]
+# The superinstructions which load and store the same name
+SAME_NAME_SUPERINSTRUCTIONS = {'INCREMENT_NAME'}
+
 
 class Frame(object):
-    def __init__(self, code_obj: CodeObj, local_names: {str: Value}, prev_frame):
+    def __init__(self, code_obj: CodeObj, slots: [Value], prev_frame, scopes: tuple):
         self.code_obj = code_obj  # type: CodeObj
-        self.local_names = local_names  # type: {str: Value}
+        self.slots = slots  # type: [Value] the local variables, indexed like code_obj.name_list
+        self.scopes = scopes  # type: ([Value]) the slots of the enclosing functions and these slots, by lexical depth
         self.prev_frame = prev_frame
         self.stack = []  # type: [Value]
         self.last_instruction = 0
         self.block_stack = []  # type: [Block]
+        self.memo = None  # type: (memo.MemoCache, tuple, int) where the return value is memoized, see memo.py
 
     # Data stack manipulation
     def top(self):
@@ -58,31 +80,46 @@ class Frame(object):
 Block = collections.namedtuple("Block", "type, handler, stack_height")
 
 
-class VirtualMachineError(Exception):
-    pass
-
-
-class VirtualMachine(object):
-    def __init__(self):
+class VirtualMachine(BoxedOperators):
+    """Runs the code of a program. The operators, the representation of the values and the checks of the
+    calls are those of BoxedOperators in msoperators.py."""
+    engine = 'boxed'  # the code is decoded differently for every engine
+    transpiler_class = transpiler.Transpiler  # and transpiled differently
+    operators_class = BoxedOperators  # the operators without the machine, for the compiled modules of aot.py
+
+    def __init__(self, superinstructions=True, max_call_depth=DEFAULT_MAX_CALL_DEPTH, memoize=False,
+                 memo_size=memo.DEFAULT_MEMO_SIZE, instrument=False, timing=False, profile=False,
+                 file_name='<program>', jit=False, jit_calls=transpiler.DEFAULT_CALL_THRESHOLD,
+                 jit_loops=transpiler.DEFAULT_LOOP_THRESHOLD, jit_dump=None):
+        self.superinstructions = superinstructions
+        self.max_call_depth = max_call_depth
+        self.memoizer = memo.Memoizer(memo_size) if memoize else None
+        # with instrument, the instructions are counted, and with timing also timed, see instrument.py
+        self.instrumentation = instrument_module.Instrumentation(timing) if instrument else None
+        # with profile, the calls of every function of the program `file_name` are timed, see profiler.py
+        self.profiler = profiler.Profiler(file_name) if profile else None
+        # with jit, the hot code is transpiled to Python, see transpiler.py. The code must run in the
+        # interpreter to be memoized, instrumented or profiled, so then it is not.
+        self.jit = None
+        if jit and not (memoize or instrument or profile):
+            self.jit = transpiler.JIT(self, jit_calls, jit_loops, jit_dump)
+        self.decode_key = (self.engine, superinstructions)  # where the decoded code is kept in CodeObj.decoded
+        self.handlers = self.make_handlers()  # The handler of each opcode, indexed by opcode.
         self.frames = []  # The call stack of frames.
         self.current_frame = None  # The current frame.
         self.return_value = None
-        self.display_stack = {}  # type: {[int: Frame]}
-        self.current_lexical_depth = None
-        self.lexical_depth_stack = []
-        self.display = {}
 
     # Frame manipulation
-    def make_frame(self, code, call_args=None, local_names=None):
-        if call_args is None:
-            call_args = {}
-        if local_names is None:
-            local_names = {}
-        local_names.update(call_args)
-        frame = Frame(code, local_names, self.current_frame)
-        return frame
+    def make_frame(self, code, arguments=()):
+        """The parameters come first in the name list of a function, so the arguments are bound to the
+        first slots."""
+        slots = [None] * len(code.name_list)
+        slots[:len(arguments)] = arguments
+        return Frame(code, slots, self.current_frame, (slots,))
 
     def push_frame(self, frame):
+        if len(self.frames) >= self.max_call_depth:
+            raise self.call_depth_error()
         self.frames.append(frame)
         self.current_frame = frame
 
@@ -93,39 +130,22 @@ class VirtualMachine(object):
         else:
             self.current_frame = None
 
-    def push_display(self, lexical_depth, frame):
-        if lexical_depth in self.display_stack:
-            self.display_stack[lexical_depth].append(frame)
-        else:
-            self.display_stack[lexical_depth] = [frame]
-        self.display[lexical_depth] = frame
-        self.lexical_depth_stack.append(lexical_depth)
-        self.current_lexical_depth = lexical_depth
-
-    def pop_display(self):
-        lexical_depth = self.current_lexical_depth
-        self.display_stack[lexical_depth].pop()
-        if self.display_stack[lexical_depth]:
-            self.display[lexical_depth] = self.display_stack[lexical_depth][-1]
-        else:
-            self.display[lexical_depth] = None
-        self.lexical_depth_stack.pop()
-        if self.lexical_depth_stack:
-            self.current_lexical_depth = self.lexical_depth_stack[-1]
-        else:
-            self.current_lexical_depth = None
-
     # Jumping through bytecode
     def jump(self, jump):
         """Move the bytecode pointer to `jump`, so it will execute next."""
         self.current_frame.last_instruction = jump
 
-    def run_code(self, code, local_names=None):
+    def run_code(self, code):
         """ An entry point to execute code using the virtual machine."""
-        frame = self.make_frame(code, local_names=local_names)
-        self.push_display(0, frame)
+        self.decode(code)
+        if self.memoizer:
+            memo.mark_pure_functions(code)
+        if self.instrumentation:
+            self.instrumentation.name_code(code)
+        if self.jit:
+            self.jit.add_program(code)
+        frame = self.make_frame(code)
         self.run_frame(frame)
-        self.pop_display()
         # Check some invariants
         # if self.frames:
         #     raise VirtualMachineError("Frames left over!")
@@ -135,44 +155,112 @@ class VirtualMachine(object):
         # for testing, was val = self.run_frame(frame)
         # return val # for testing
 
-    def parse_byte_and_args(self):
-        f = self.current_frame
-        op_offset = f.last_instruction
-        byte_name, arg_val = f.code_obj.code[op_offset]
-        f.last_instruction += 1
-        if arg_val is not None:
-            if byte_name in bytecode.HAVE_CONST:  # Look up a constant
-                arg = f.code_obj.const_list[arg_val]
-            elif byte_name in bytecode.HAVE_NAME:  # Look up a name
-                arg = index2tuple(arg_val)
-            else:
-                arg = arg_val
-            argument = [arg]
+    def make_handlers(self):
+        """Build the dispatch table: the handler of an opcode is found at the index of that opcode."""
+        handlers = []
+        for byte_name in bytecode.OPNAMES:
+            handler = getattr(self, 'byte_%s' % byte_name, None)
+            if handler is None and byte_name.startswith('UNARY_'):
+                handler = self.unaryOperator
+            elif handler is None and byte_name.startswith('BINARY_'):
+                handler = self.binaryOperator
+            if self.memoizer:
+                handler = getattr(self, 'memoized_%s' % byte_name, handler)
+            if self.jit:
+                handler = getattr(self, 'tiered_%s' % byte_name, handler)
+            handlers.append(handler)
+        return handlers
+
+    def decode_argument(self, code_obj: CodeObj, byte_name, arg_val):
+        if byte_name in bytecode.HAVE_CONST:  # Look up a constant
+            return code_obj.const_list[arg_val]
+        elif byte_name in bytecode.HAVE_NAME:  # Look up a name
+            return index2tuple(arg_val)
+        elif byte_name == 'BINARY_SUBSCR':
+            return PropertyCache(self.PROTOTYPE_KEY, self.BINARY_OPERATORS['SUBSCR'])
+        elif byte_name == 'STORE_SUBSCR':
+            return PropertyCache(self.PROTOTYPE_KEY, self.STORE_SUBSCR_OPERATOR)
+        elif byte_name == 'COMPARE_OP':
+            return self.COMPARE_OPERATORS[arg_val]
+        elif byte_name == 'BUILD_ARRAY':
+            return type_tag(arg_val)
+        elif byte_name == 'LOAD_BUILTIN':
+            return msbuiltins.BUILTINS[arg_val]
+        elif byte_name.startswith('UNARY_'):
+            return self.UNARY_OPERATORS[byte_name[6:]]
+        elif byte_name.startswith('BINARY_'):
+            return self.BINARY_OPERATORS[byte_name[7:]]
         else:
-            argument = []
-        # print("the instruction: {} {}".format(byte_name, argument))
-        return byte_name, argument
-
-    def dispatch(self, byte_name, argument):
-        """ Dispatch by bytename to the corresponding methods.
-        Exceptions are caught and set on the virtual machine."""
-
-        # When later unwinding the block stack,
-        # we need to keep track of why we are doing it.
-        why = None
-        bytecode_fn = getattr(self, 'byte_%s' % byte_name, None)
-        if bytecode_fn is None:
-            if byte_name.startswith('UNARY_'):
-                self.unaryOperator(byte_name[6:])
-            elif byte_name.startswith('BINARY_'):
-                self.binaryOperator(byte_name[7:])
+            return arg_val
+
+    def matches(self, code, position, byte_name, pattern, jump_targets):
+        group = code[position:position + len(pattern)]
+        return len(group) == len(pattern) \
+            and all(fnmatchcase(name, pattern_name) for (name, _), pattern_name in zip(group, pattern)) \
+            and not jump_targets.intersection(range(position + 1, position + len(pattern))) \
+            and (byte_name not in SAME_NAME_SUPERINSTRUCTIONS or group[0][1] == group[-1][1])
+
+    def group_instructions(self, code):
+        """Split the code into (byte_name, position, length) groups, which are superinstructions where
+        possible and single instructions otherwise."""
+        jump_targets = {arg for byte_name, arg in code if byte_name in bytecode.HAVE_LABEL}
+        groups = []
+        position = 0
+        while position < len(code):
+            byte_name, length = code[position][0], 1
+            if self.superinstructions:
+                for fused_name, pattern in SUPERINSTRUCTION_PATTERNS:
+                    if self.matches(code, position, fused_name, pattern, jump_targets):
+                        byte_name, length = fused_name, len(pattern)
+                        break
+            groups.append((byte_name, position, length))
+            position += length
+        return groups
+
+    @staticmethod
+    def fuse_operands(code, position, operands):
+        """The operand of a superinstruction is the tuple of the operands of its instructions, with the name
+        tuples spread out and the subscript caches replaced by their load method."""
+        fused = []
+        for (byte_name, _), operand in zip(code[position:], operands):
+            if byte_name in bytecode.HAVE_NAME:
+                fused.extend(operand)
+            elif isinstance(operand, PropertyCache):
+                fused.append(operand.load)
             else:
+                fused.append(operand)
+        return tuple(fused)
+
+    def decode(self, code_obj: CodeObj, enclosing_names=()):
+        """Translate the (byte_name, argument) pairs of `code_obj` and of all the functions defined in it
+        into (opcode, operand) pairs, with constants, names, operators and jump targets already resolved,
+        so that running the code does no string work at all. Common sequences of instructions are fused
+        into superinstructions, which run with a single dispatch."""
+        code = code_obj.code
+        for byte_name, _ in code:
+            if byte_name not in bytecode.OPMAP:
                 raise VirtualMachineError(
                     "unsupported bytecode type: %s" % byte_name
                 )
-        else:
-            why = bytecode_fn(*argument)
-        return why
+        groups = self.group_instructions(code)
+        new_positions = [None] * len(code) + [len(groups)]
+        for new_position, (_, position, _) in enumerate(groups):
+            new_positions[position] = new_position
+        decoded = []
+        for byte_name, position, length in groups:
+            operands = []
+            for name, arg_val in code[position:position + length]:
+                if name in bytecode.HAVE_LABEL:
+                    operands.append(new_positions[arg_val])
+                else:
+                    operands.append(self.decode_argument(code_obj, name, arg_val))
+            operand = operands[0] if length == 1 else self.fuse_operands(code, position, operands)
+            decoded.append((bytecode.OPMAP[byte_name], operand))
+        code_obj.decoded[self.decode_key] = decoded
+        code_obj.scope_names = enclosing_names + (code_obj.name_list,)
+        for const_item in code_obj.const_list:
+            if const_item.dtype is FUNCTION:
+                self.decode(const_item.value.code_obj, code_obj.scope_names)
 
     def manage_block_stack(self, why):
         block = self.current_frame.block_stack[-1]
@@ -189,114 +277,184 @@ class VirtualMachine(object):
     def run_frame(self, frame):
         """Run a frame until it returns (somehow).
         Exceptions are raised, the return value is returned.
+        A call pushes the frame of the callee and a return pops it again, all in this loop, so the
+        calls of the program do not nest Python calls and are only limited by max_call_depth.
         """
+        if self.instrumentation:
+            return self.run_frame_instrumented(frame)
+        if self.profiler:
+            return self.run_frame_profiled(frame)
         self.push_frame(frame)
+        base_frame = frame
+        code = frame.code_obj.decoded[self.decode_key]
+        handlers = self.handlers
         while True:
-            byte_name, argument = self.parse_byte_and_args()
-
-            why = self.dispatch(byte_name, argument)
+            opcode, argument = code[frame.last_instruction]
+            frame.last_instruction += 1
+            why = handlers[opcode](argument)
 
             # Deal with any block management we need to do
             if why:
-                if frame.block_stack:
+                if why == 'call':
+                    frame = self.current_frame
+                    code = frame.code_obj.decoded[self.decode_key]
+                elif why == 'return' or not frame.block_stack:
+                    self.pop_frame()
+                    if frame is base_frame:
+                        return self.return_value
+                    frame = self.current_frame
+                    code = frame.code_obj.decoded[self.decode_key]
+                    frame.push(self.return_value)
+                else:
                     self.manage_block_stack(why)
+
+    def run_frame_instrumented(self, frame):
+        """run_frame, counting the instructions and with timing also timing them."""
+        self.push_frame(frame)
+        base_frame = frame
+        code = frame.code_obj.decoded[self.decode_key]
+        handlers = self.handlers
+        instrumentation = self.instrumentation
+        opcode_counts, opcode_times = instrumentation.opcode_counts, instrumentation.opcode_times
+        position_counts = instrumentation.position_counts
+        timing = instrumentation.timing
+        clock = time.perf_counter
+        while True:
+            position = frame.last_instruction
+            opcode, argument = code[position]
+            frame.last_instruction += 1
+            opcode_counts[opcode] += 1
+            position_counts[frame.code_obj, position, opcode] += 1
+            if timing:
+                start = clock()
+                why = handlers[opcode](argument)
+                opcode_times[opcode] += clock() - start
+            else:
+                why = handlers[opcode](argument)
+
+            if why:
+                if why == 'call':
+                    frame = self.current_frame
+                    code = frame.code_obj.decoded[self.decode_key]
+                elif why == 'return' or not frame.block_stack:
+                    self.pop_frame()
+                    if frame is base_frame:
+                        return self.return_value
+                    frame = self.current_frame
+                    code = frame.code_obj.decoded[self.decode_key]
+                    frame.push(self.return_value)
                 else:
-                    break
-        self.pop_frame()
-        return self.return_value
+                    self.manage_block_stack(why)
+
+    def run_frame_profiled(self, frame):
+        """run_frame, telling the profiler where every call begins and ends."""
+        self.push_frame(frame)
+        base_frame = frame
+        code = frame.code_obj.decoded[self.decode_key]
+        handlers = self.handlers
+        profiler = self.profiler
+        profiler.enter(frame.code_obj)
+        while True:
+            opcode, argument = code[frame.last_instruction]
+            frame.last_instruction += 1
+            why = handlers[opcode](argument)
+
+            if why:
+                if why == 'call':
+                    if self.current_frame is frame:  # a tail call, which ran in the frame of the caller
+                        profiler.leave()
+                    frame = self.current_frame
+                    code = frame.code_obj.decoded[self.decode_key]
+                    profiler.enter(frame.code_obj)
+                elif why == 'return' or not frame.block_stack:
+                    self.pop_frame()
+                    profiler.leave()
+                    if frame is base_frame:
+                        return self.return_value
+                    frame = self.current_frame
+                    code = frame.code_obj.decoded[self.decode_key]
+                    frame.push(self.return_value)
+                else:
+                    self.manage_block_stack(why)
+
+    def enter_function(self, func: Function, arguments: []):
+        """Check the arguments and make the frame of a call. The list of the arguments becomes the slots of
+        the frame."""
+        self.check_arity(func, arguments)
+        self.check_arguments(func, arguments)
+        arguments.extend(func.local_padding)
+        return Frame(func.code_obj, arguments, self.current_frame, func.scopes + (arguments,))
 
     def call_function(self, func: Function, arguments: []):
-        parameter_list = func.parameter_list
-        parameters = parameter_list.parameters
-        if len(parameters) != len(arguments):
-            raise VirtualMachineError('the length of parameter is {}, but the argument is {}'
-                                      .format(len(parameters), len(arguments)))
-        for parameter, argument in zip(parameters, arguments):
-            if parameter.type_name != argument.dtype:
-                raise TypeError('the parameter {} is type {}, but the argument is {}'
-                                .format(parameter.id_name, parameter.type_name, argument))
-        call_args = dict(zip(parameter_list.names, arguments))
-        lexical_depth = func.lexical_depth
-        frame = self.make_frame(func.code_obj, call_args)
-        self.push_display(lexical_depth, frame)
-        ret_value = self.run_frame(frame)
-        self.pop_display()
-        return ret_value
+        """Call a function from Python and return its return value."""
+        if type(func) is NativeFunction:
+            return func.call(self, list(arguments))
+        return self.run_frame(self.enter_function(func, list(arguments)))
 
     def byte_LOAD_CONST(self, const):
         self.current_frame.push(const)
 
-    def byte_POP_TOP(self):
+    def byte_POP_TOP(self, _):
         self.current_frame.pop()
 
+    def byte_DUP_TOP(self, _):
+        self.current_frame.push(self.current_frame.top())
+
     # Names
+    def unassigned(self, lexical_depth, index):
+        return self.unassigned_error(self.current_frame.code_obj.scope_names[lexical_depth][index])
+
+    def byte_LOAD_BUILTIN(self, builtin):
+        self.current_frame.push(builtin)
+
     def byte_LOAD_NAME(self, tuple_index):
         lexical_depth, index = tuple_index
-        frame = self.display[lexical_depth]
-        name = frame.code_obj.name_list[index]
-        val = frame.local_names[name]
+        val = self.current_frame.scopes[lexical_depth][index]
+        if val is None:
+            raise self.unassigned(lexical_depth, index)
         self.current_frame.push(val)
 
     def byte_STORE_NAME(self, tuple_index):
         lexical_depth, index = tuple_index
-        frame = self.display[lexical_depth]
-        name = frame.code_obj.name_list[index]
-        frame.local_names[name] = self.current_frame.pop()
-
-    def byte_STORE_SUBSCR(self):
+        self.current_frame.scopes[lexical_depth][index] = self.current_frame.pop()
+
+    def byte_MAKE_FUNCTION(self, const):
+        """A function reads the variables of the functions enclosing it where it is made, even after they
+        have returned."""
+        self.current_frame.push(Value(FUNCTION, const.value.bind_scopes(self.current_frame.scopes)))
+
+    # Tables
+    def byte_BINARY_SUBSCR(self, cache: PropertyCache):
+        obj, subscr = self.current_frame.popn(2)
+        if subscr.dtype is INT and obj.dtype is TABLE:
+            array = obj.value.array
+            if 0 <= subscr.value < len(array):
+                self.current_frame.push(array[subscr.value])
+                return
+        self.current_frame.push(cache.load(obj, subscr))
+
+    def byte_STORE_SUBSCR(self, cache: PropertyCache):
         val, obj, subscr = self.current_frame.popn(3)
-        obj[subscr] = val
+        if subscr.dtype is INT and obj.dtype is TABLE:
+            array = obj.value.array
+            if 0 <= subscr.value < len(array):
+                array[subscr.value] = val
+                return
+        cache.store(obj, subscr, val)
 
     # Operators
 
-    UNARY_OPERATORS = {
-        'POSITIVE': operator.pos,
-        'NEGATIVE': operator.neg,
-        'NOT': operator.not_,
-        'INVERT': operator.invert,
-    }
-
     def unaryOperator(self, op):
         x = self.current_frame.pop()
-        self.current_frame.push(self.UNARY_OPERATORS[op](x))
-
-    BINARY_OPERATORS = {
-        'POWER': pow,
-        'MULTIPLY': operator.mul,
-        'FLOOR_DIVIDE': operator.floordiv,
-        'TRUE_DIVIDE': operator.truediv,
-        'MODULO': operator.mod,
-        'ADD': operator.add,
-        'SUBTRACT': operator.sub,
-        'SUBSCR': operator.getitem,
-        'LSHIFT': operator.lshift,
-        'RSHIFT': operator.rshift,
-        'AND': operator.and_,
-        'XOR': operator.xor,
-        'OR': operator.or_,
-    }
+        self.current_frame.push(op(x))
 
     def binaryOperator(self, op):
         x, y = self.current_frame.popn(2)
-        self.current_frame.push(self.BINARY_OPERATORS[op](x, y))
-
-    COMPARE_OPERATORS = [
-        operator.lt,
-        operator.le,
-        operator.eq,
-        operator.ne,
-        operator.gt,
-        operator.ge,
-        lambda x, y: x in y,
-        lambda x, y: x not in y,
-        lambda x, y: x is y,
-        lambda x, y: x is not y,
-        lambda x, y: issubclass(x, Exception) and issubclass(x, y),
-    ]
-
-    def byte_COMPARE_OP(self, op_num):
+        self.current_frame.push(op(x, y))
+
+    def byte_COMPARE_OP(self, op):
         x, y = self.current_frame.popn(2)
-        self.current_frame.push(self.COMPARE_OPERATORS[op_num](x, y))
+        self.current_frame.push(op(x, y))
 
     # Building
 
@@ -306,13 +464,17 @@ class VirtualMachine(object):
 
     def byte_BUILD_LIST(self, count):
         elements = self.current_frame.popn(count)
-        table = dict(enumerate(elements))
-        self.current_frame.push(Value('table', table))
+        self.current_frame.push(Value(TABLE, Table(elements)))
 
     def byte_BUILD_MAP(self, count):
         elements = self.current_frame.popn(2 * count)
-        table = {elements[i]: elements[i+1] for i in range(0, len(elements), 2)}
-        self.current_frame.push(Value('table', table))
+        table = Table()
+        for i in range(0, len(elements), 2):
+            table[elements[i]] = elements[i + 1]
+        self.current_frame.push(Value(TABLE, table))
+
+    def byte_BUILD_ARRAY(self, dtype):
+        self.current_frame.push(make_array(dtype, self.current_frame.pop()))
 
     def byte_LIST_APPEND(self, count):
         val = self.current_frame.pop()
@@ -339,25 +501,177 @@ class VirtualMachine(object):
     def byte_SETUP_LOOP(self, destination):
         self.current_frame.push_block('loop', destination)
 
-    def byte_BREAK_LOOP(self):
+    def byte_BREAK_LOOP(self, _):
         return 'break'
 
-    def byte_POP_BLOCK(self):
+    def byte_POP_BLOCK(self, _):
         self.current_frame.pop_block()
 
-    def byte_CALL_FUNCTION(self):
-        func_value = self.current_frame.pop()
-        func = func_value.value
-        parameter_len = len(func.parameter_list.parameters)
-        arguments = self.current_frame.popn(parameter_len)
-        ret_value = self.call_function(func, arguments)
-        self.current_frame.push(ret_value)
-
-    def byte_RETURN_VALUE(self):
+    def byte_CALL_FUNCTION(self, count):
+        func = self.current_frame.pop().value
+        arguments = self.current_frame.popn(count)
+        if type(func) is NativeFunction:
+            self.current_frame.push(func.call(self, arguments))
+            return
+        self.push_frame(self.enter_function(func, arguments))
+        return 'call'
+
+    def byte_TAIL_CALL_FUNCTION(self, count):
+        """Call a function whose return value is returned right away. The frame of the caller is not needed
+        any more, so the callee runs in it. The functions made by the caller keep its slots, which are not
+        reused. The RETURN_VALUE after this instruction is only reached after a builtin."""
+        frame = self.current_frame
+        func = frame.pop().value
+        arguments = frame.popn(count)
+        if type(func) is NativeFunction:
+            frame.push(func.call(self, arguments))
+            return
+        self.check_arity(func, arguments)
+        self.check_arguments(func, arguments)
+        arguments.extend(func.local_padding)
+        frame.code_obj = func.code_obj
+        frame.slots = arguments
+        frame.scopes = func.scopes + (arguments,)
+        frame.stack = []
+        frame.block_stack = []
+        frame.last_instruction = 0
+        return 'call'
+
+    def byte_RETURN_VALUE(self, _):
         self.return_value = self.current_frame.pop()
         return "return"
 
+    # Memoization, these replace the handlers of the same name when the machine memoizes
+
+    def memoized_CALL_FUNCTION(self, count):
+        frame = self.current_frame
+        func = frame.pop().value
+        arguments = frame.popn(count)
+        if type(func) is NativeFunction:
+            if not func.pure:
+                self.memoizer.impure_calls += 1
+            frame.push(func.call(self, arguments))
+            return
+        if not func.code_obj.pure:
+            self.memoizer.impure_calls += 1
+            self.push_frame(self.enter_function(func, arguments))
+            return 'call'
+        cache = self.memoizer.cache(func)
+        # the unboxed arguments of the native machine go in with their type, like the keys of a table, so a
+        # call with True does not find the result of a call with 1, which it would have to reject
+        key = tuple(map(hash_key, arguments))
+        try:
+            result = cache.lookup(key)
+        except TypeError:  # a table argument
+            self.push_frame(self.enter_function(func, arguments))
+            return 'call'
+        if result is not memo.MISSING:
+            frame.push(result)
+            return
+        callee_frame = self.enter_function(func, arguments)
+        callee_frame.memo = (cache, key, self.memoizer.impure_calls)
+        self.push_frame(callee_frame)
+        return 'call'
+
+    def memoized_TAIL_CALL_FUNCTION(self, argument):
+        func = self.current_frame.top().value
+        if not (func.pure if type(func) is NativeFunction else func.code_obj.pure):
+            self.memoizer.impure_calls += 1
+        return self.byte_TAIL_CALL_FUNCTION(argument)
+
+    def memoized_RETURN_VALUE(self, _):
+        frame = self.current_frame
+        self.return_value = frame.pop()
+        if frame.memo is not None:
+            cache, key, impure_calls = frame.memo
+            # a new array, like the sum of two arrays, must not be shared by the callers
+            if impure_calls == self.memoizer.impure_calls and not is_array(self.return_value):
+                cache.store(key, self.return_value)
+        return 'return'
+
+    # Tiering, these replace the handlers of the same name when the machine transpiles the hot code
+
+    def call_transpiled(self, count):
+        """Call the function on the stack if it is transpiled, and return whether it is."""
+        frame = self.current_frame
+        func = frame.top().value
+        if type(func) is Function:
+            function = self.jit.hot_function(func.code_obj)
+            if function is not None:
+                frame.pop()
+                frame.push(self.jit.run(function, func, frame.popn(count)))
+                return True
+        return False
+
+    def tiered_CALL_FUNCTION(self, count):
+        if not self.call_transpiled(count):
+            return self.byte_CALL_FUNCTION(count)
+
+    def tiered_TAIL_CALL_FUNCTION(self, count):
+        """A transpiled function returns its result like a builtin, to the RETURN_VALUE after this."""
+        if not self.call_transpiled(count):
+            return self.byte_TAIL_CALL_FUNCTION(count)
+
+    def tiered_JUMP_ABSOLUTE(self, jump):
+        """A jump back is a loop, the frame goes on in the transpiled code when the loop is hot."""
+        frame = self.current_frame
+        if jump < frame.last_instruction and not frame.stack:
+            function = self.jit.hot_loop(frame.code_obj)
+            if function is not None:
+                return_value = self.jit.run_loop(function, frame, jump)
+                if return_value is not transpiler.MISSING:
+                    self.return_value = return_value
+                    return 'return'
+        frame.last_instruction = jump
+
+    # Superinstructions
+
+    def byte_COMPARE_NAME_CONST_JUMP_IF_FALSE(self, operand):
+        """LOAD_NAME, LOAD_CONST, COMPARE_OP, POP_JUMP_IF_FALSE"""
+        lexical_depth, index, const, compare, jump = operand
+        x = self.current_frame.scopes[lexical_depth][index]
+        if x is None:
+            raise self.unassigned(lexical_depth, index)
+        if not compare(x, const):
+            self.current_frame.last_instruction = jump
+
+    def byte_INCREMENT_NAME(self, operand):
+        """LOAD_NAME x, LOAD_CONST, BINARY_ADD or BINARY_SUBTRACT, STORE_NAME x"""
+        lexical_depth, index, const, op, _, _ = operand
+        slots = self.current_frame.scopes[lexical_depth]
+        x = slots[index]
+        if x is None:
+            raise self.unassigned(lexical_depth, index)
+        slots[index] = op(x, const)
+
+    def byte_COMPARE_JUMP_IF_FALSE(self, operand):
+        """COMPARE_OP, POP_JUMP_IF_FALSE"""
+        compare, jump = operand
+        x, y = self.current_frame.popn(2)
+        if not compare(x, y):
+            self.current_frame.last_instruction = jump
+
+    def byte_LOAD_NAME_CONST_BINARY(self, operand):
+        """LOAD_NAME, LOAD_CONST, BINARY_*"""
+        lexical_depth, index, const, op = operand
+        x = self.current_frame.scopes[lexical_depth][index]
+        if x is None:
+            raise self.unassigned(lexical_depth, index)
+        self.current_frame.push(op(x, const))
+
+    def byte_LOAD_NAME_NAME_BINARY(self, operand):
+        """LOAD_NAME, LOAD_NAME, BINARY_*"""
+        x_depth, x_index, y_depth, y_index, op = operand
+        scopes = self.current_frame.scopes
+        x = scopes[x_depth][x_index]
+        if x is None:
+            raise self.unassigned(x_depth, x_index)
+        y = scopes[y_depth][y_index]
+        if y is None:
+            raise self.unassigned(y_depth, y_index)
+        self.current_frame.push(op(x, y))
+
     # print
-    def byte_PRINT_EXPR(self):
+    def byte_PRINT_EXPR(self, _):
         value = self.current_frame.pop()
         print(value)